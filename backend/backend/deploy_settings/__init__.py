@@ -1,5 +1,6 @@
 import dj_database_url
 from ..settings import *
+from pugorugh.db import POOLED_ENGINES
 
 DEBUG = False
 TEMPLATE_DEBUG = DEBUG
@@ -12,4 +13,59 @@ ALLOWED_HOSTS = [
 SECRET_KEY = get_env_variable("SECRET_KEY")
 
 db_from_env = dj_database_url.config()
-DATABASES["default"].update(db_from_env)
\ No newline at end of file
+DATABASES["default"].update(db_from_env)
+
+# Share the default cache between workers, e.g.
+# CACHE_BACKEND=django.core.cache.backends.memcached.MemcachedCache CACHE_LOCATION=127.0.0.1:11211
+if os.environ.get('CACHE_BACKEND'):
+    CACHES = {
+        'default': {
+            'BACKEND': os.environ['CACHE_BACKEND'],
+            'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+        }
+    }
+
+# Serve read-only views from the replicas in DATABASE_REPLICA_URLS, a
+# comma-separated list of database URLs. To try it locally, copy
+# db.sqlite3 and set it to e.g. sqlite:////path/to/replica.sqlite3
+# Users are pinned to the primary after a write through a shared cache,
+# see CACHE_BACKEND above, and the app refuses to start without one.
+for number, url in enumerate(filter(None, os.environ.get('DATABASE_REPLICA_URLS', '').split(',')), 1):
+    alias = 'replica_{}'.format(number)
+    DATABASES[alias] = dj_database_url.parse(url.strip())
+    DATABASES[alias]["TEST"] = {'MIRROR': 'default'}
+    REPLICA_DATABASES.append(alias)
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', REPLICA_PIN_SECONDS))
+
+# Rank undecided dogs for each user rather than in id order
+DOG_RANKING = os.environ.get('DOG_RANKING', 'off').lower() in ('on', 'true', '1')
+
+# Match undecided dogs against an in-memory index rather than the match queues
+DOG_CATALOGUE_INDEX = os.environ.get('DOG_CATALOGUE_INDEX', 'off').lower() in ('on', 'true', '1')
+
+# Read each user's rated dogs from packed sets rather than scanning their ratings
+USER_DOG_SETS = os.environ.get('USER_DOG_SETS', 'off').lower() in ('on', 'true', '1')
+
+# Buffer swipes in a local log, e.g. SWIPE_BUFFER_PATH=/var/tmp/pugorugh-swipes.sqlite3
+SWIPE_BUFFER_PATH = os.environ.get('SWIPE_BUFFER_PATH') or None
+SWIPE_BUFFER_FLUSH_INTERVAL = float(os.environ.get('SWIPE_BUFFER_FLUSH_INTERVAL', SWIPE_BUFFER_FLUSH_INTERVAL))
+
+# Run expensive follow-up work in background jobs, needs a run_jobs worker
+BACKGROUND_JOBS = os.environ.get('BACKGROUND_JOBS', 'off').lower() in ('on', 'true', '1')
+
+# Keep one persistent connection per thread for DB_CONN_MAX_AGE seconds.
+# Set DB_POOL=on to instead share a pool of connections between the threads
+# of each process, for the primary only; replicas keep persistent connections.
+DB_POOL = os.environ.get('DB_POOL', 'off').lower() in ('on', 'true', '1')
+for alias, database in DATABASES.items():
+    if DB_POOL and alias not in REPLICA_DATABASES:
+        database["ENGINE"] = POOLED_ENGINES.get(database["ENGINE"], database["ENGINE"])
+        database["CONN_MAX_AGE"] = 0
+        database["POOL"] = {
+            'SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+            'MAX_AGE': int(os.environ.get('DB_POOL_MAX_AGE', 300)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'CHECK_AFTER': float(os.environ.get('DB_POOL_CHECK_AFTER', 30)),
+        }
+    else:
+        database["CONN_MAX_AGE"] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
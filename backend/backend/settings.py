@@ -60,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'pugorugh.middleware.InstrumentationMiddleware',
+    'pugorugh.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -115,6 +117,13 @@ DATABASES = {
     }
 }
 
+# Read replicas, see pugorugh/routers.py. List the DATABASES aliases of
+# the replicas in REPLICA_DATABASES to serve read-only views from them.
+DATABASE_ROUTERS = ['pugorugh.routers.ReplicaRouter']
+REPLICA_DATABASES = []
+REPLICA_PIN_SECONDS = 5  # Seconds a user reads from the primary after a write
+REPLICA_PIN_CACHE_ALIAS = 'default'  # Must be shared between workers, e.g. memcached, when there are replicas
+
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
 
@@ -138,12 +147,66 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'pugorugh.authentication.CachedTokenAuthentication',
+        # 'rest_framework.authentication.TokenAuthentication',
         # 'rest_framework.authentication.BasicAuthentication',
         # 'rest_framework.authentication.SessionAuthentication',
     )
 }
 
+# Token authentication cache, see pugorugh/authentication.py
+TOKEN_CACHE_SIZE = 10000  # Tokens kept in memory per worker
+TOKEN_CACHE_TTL = 300  # Seconds before a cached token is checked against the DB again
+TOKEN_CACHE_ALIAS = None  # Optionally share cached tokens between workers through a CACHES alias
+
+# User preference cache, see pugorugh/preferences.py. Invalidation only reaches
+# other workers if the CACHES alias is shared, e.g. memcached or redis. With the
+# default per-process locmem cache, other workers serve the old preferences for
+# up to USER_PREF_CACHE_TTL seconds after a change, so keep the TTL short there.
+USER_PREF_CACHE_ALIAS = 'default'
+USER_PREF_CACHE_TTL = 60  # Seconds, or None to keep entries until invalidated
+
+# Dog search, see pugorugh/search.py. The backend defaults to the one for
+# the database's vendor. Match counts are cached per query until the index changes.
+DOG_SEARCH_BACKEND = None
+DOG_SEARCH_CACHE_ALIAS = 'default'
+DOG_SEARCH_CACHE_TTL = 300
+
+# Optional cache of get-next responses, see pugorugh/conditional.py.
+# Set the alias to a CACHES entry, shared between workers, to switch it on.
+NEXT_DOG_CACHE_ALIAS = None
+NEXT_DOG_CACHE_TTL = 60
+
+# Rank undecided dogs by the user's learned affinities, see pugorugh/ranking.py.
+# Changed dogs reach other workers' copies of the dog features through the
+# log kept in this CACHES alias, so it should be shared between workers.
+DOG_RANKING = False
+DOG_RANKING_CACHE_ALIAS = 'default'
+
+# Match undecided dogs against in-memory bitmaps, see pugorugh/catalogue.py.
+# Workers reload when the version stamp in this shared CACHES alias moves on.
+DOG_CATALOGUE_INDEX = False
+DOG_CATALOGUE_CACHE_ALIAS = 'default'
+
+# Keep each user's liked / disliked / undecided / blacklisted dog ids as
+# packed, sorted arrays, see pugorugh/dog_sets.py. Run check_dog_sets after
+# switching it back on, to reconcile sets that missed ratings while it was off.
+USER_DOG_SETS = False
+
+# Acknowledge swipes once they are logged to this local SQLite file, and write
+# them to UserDog in batches, see pugorugh/swipe_buffer.py. Each process
+# flushes the log every SWIPE_BUFFER_FLUSH_INTERVAL seconds; set it to 0 to
+# leave flushing to manage.py flush_swipes instead.
+SWIPE_BUFFER_PATH = None
+SWIPE_BUFFER_FLUSH_INTERVAL = 1.0
+
+# Hand queue rebuilds, image variants and dog purges after API writes to
+# background jobs, run by manage.py run_jobs, see pugorugh/jobs.py. A job
+# whose worker stops for JOB_LEASE_SECONDS is taken by another worker; a running
+# job's lease is renewed every third of that.
+BACKGROUND_JOBS = False
+JOB_LEASE_SECONDS = 300
+
 # Internationalization
 # https://docs.djangoproject.com/en/1.9/topics/i18n/
 
@@ -174,3 +237,8 @@ INTERNAL_IPS = [
     '127.0.0.1',
     # ...
 ]
+
+# Request instrumentation, see pugorugh/middleware.py
+SLOW_REQUEST_MS = 500  # Requests slower than this are logged with their SQL
+SLOW_REQUEST_SAMPLE_RATE = 0.1  # The fraction of slow requests that are logged
+METRICS_ALLOWED_IPS = INTERNAL_IPS  # Addresses allowed to scrape /metrics
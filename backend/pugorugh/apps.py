@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class PugorughConfig(AppConfig):
     name = 'pugorugh'
+
+    def ready(self):
+        from . import receivers  # Connect the signal receivers
+        from . import tasks  # Register the background tasks
+        from . import routers
+        routers.check_pin_cache()
@@ -0,0 +1,70 @@
+import time
+
+from django.db import transaction
+
+from . import dog_sets
+from . import models
+from . import ratings
+from .signals import skip_receivers
+
+#  Rows deleted per transaction when purging an archived dog
+PURGE_BATCH_SIZE = 500
+
+
+def archive_dog(dog):
+    """
+    Hide a dog straight away without deleting it. Its ratings and queue
+    entries stay behind until purge_dog removes them in small batches,
+    rather than in one cascade that holds locks on the swipe tables.
+    The receivers take it out of the search index.
+    :param dog: a Dog instance
+    """
+    dog.is_active = False
+    dog.save(update_fields=['is_active', 'version'])
+
+
+def purge_dog(dog_id, batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Delete an archived dog's ratings and queue entries a batch at a time,
+    then the dog itself, which has nothing left to cascade to.
+    :param dog_id: the id of an archived dog
+    :param batch_size: the most rows deleted per transaction
+    :param pause: seconds to wait between batches, to let swipes through
+    :return: the number of ratings deleted
+    """
+    purged = 0
+    while True:
+        with transaction.atomic():
+            rows = list(models.UserDog.objects.filter(dog_id=dog_id).values_list(
+                'id', 'user_id', 'status', 'blacklist')[:batch_size])
+            if not rows:
+                break
+            # Skip the per-row receivers, the counts are updated for the whole batch
+            with skip_receivers():
+                models.UserDog.objects.filter(id__in=[row[0] for row in rows]).delete()
+            ratings.remove_from_counts(row[1:] for row in rows)
+            if dog_sets.enabled():
+                dog_sets.remove_dog([row[1] for row in rows], dog_id)
+        purged += len(rows)
+        time.sleep(pause)
+
+    while True:
+        with transaction.atomic():
+            ids = list(models.MatchQueue.objects.filter(dog_id=dog_id).values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            models.MatchQueue.objects.filter(id__in=ids).delete()
+        time.sleep(pause)
+
+    models.Dog.objects.filter(id=dog_id, is_active=False).delete()
+    return purged
+
+
+def purge_archived(batch_size=PURGE_BATCH_SIZE, pause=0):
+    """
+    Purge every archived dog.
+    :return: (the number of dogs purged, the number of ratings deleted)
+    """
+    dog_ids = list(models.Dog.objects.filter(is_active=False).values_list('id', flat=True))
+    purged = sum(purge_dog(dog_id, batch_size, pause) for dog_id in dog_ids)
+    return len(dog_ids), purged
@@ -0,0 +1,53 @@
+import django
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+#  URL names of the read endpoints served by async handlers
+ASYNC_READS = {'get-next', 'user-prefs'}
+
+
+class APIHandler(ASGIHandler):
+    """
+    ASGI handler that serves GET requests to the hot read endpoints, the
+    next dog and the user's preferences, from async handlers.
+    Django 3.0 can only run synchronous views, so the async handler awaits
+    the middleware and the DRF view on a thread of the default executor.
+    These reads are not pinned to the single thread-sensitive thread, so
+    many are served at once, each on its own thread's connection.
+    Every other request is served as Django's ASGIHandler serves it.
+    """
+    async def get_response(self, request):
+        # ASGIHandler awaits get_response itself when it is a coroutine function
+        if request.method == 'GET' and is_async_read(request.path_info):
+            return await sync_to_async(self.get_read_response, thread_sensitive=False)(request)
+        return await sync_to_async(super().get_response)(request)
+
+    def get_read_response(self, request):
+        # request_started and request_finished are sent from other threads,
+        # so give the connections of the executor thread the same checks
+        close_old_connections()
+        try:
+            return super().get_response(request)
+        finally:
+            close_old_connections()
+
+
+def is_async_read(path):
+    """
+    :param path: a request path
+    :return: whether the path is served by an async handler
+    """
+    try:
+        return resolve(path).url_name in ASYNC_READS
+    except Resolver404:
+        return False
+
+
+def get_asgi_application():
+    """
+    The same as django.core.asgi.get_asgi_application, with APIHandler.
+    """
+    django.setup(set_prefix=False)
+    return APIHandler()
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """
+    A bounded, thread-safe LRU of token key -> Token (with its user loaded).
+    Entries expire after ttl seconds so changes made by other workers are
+    picked up, and are evicted directly by the receivers in receivers.py.
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return token
+
+    def set(self, key, token):
+        with self.lock:
+            self.entries[key] = (token, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(
+    max_size=getattr(settings, 'TOKEN_CACHE_SIZE', 10000),
+    ttl=getattr(settings, 'TOKEN_CACHE_TTL', 300),
+)
+
+
+def shared_cache():
+    """
+    Get the Django cache named by TOKEN_CACHE_ALIAS, or None if not set.
+    """
+    alias = getattr(settings, 'TOKEN_CACHE_ALIAS', None)
+    return caches[alias] if alias else None
+
+
+def shared_cache_key(key):
+    return 'pugorugh:token:{}'.format(key)
+
+
+def invalidate_token(key):
+    """
+    Remove a token from the in-process cache and the shared cache.
+    """
+    token_cache.delete(key)
+    cache = shared_cache()
+    if cache is not None:
+        cache.delete(shared_cache_key(key))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Drop-in replacement for TokenAuthentication that keeps recently used
+    tokens in memory, and optionally in a Django cache shared between
+    workers, to save the Token / User query on every request.
+    """
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+
+        cache = shared_cache()
+        if token is None and cache is not None:
+            token = cache.get(shared_cache_key(key))
+            if token is not None:
+                token_cache.set(key, token)
+
+        if token is None:
+            # Raises AuthenticationFailed for unknown tokens or inactive users
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+            if cache is not None:
+                cache.set(shared_cache_key(key), token, token_cache.ttl)
+
+        return token.user, token
@@ -0,0 +1,552 @@
+import asyncio
+import io
+import random
+import re
+import statistics
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.util import setup_testing_defaults
+
+from django.contrib.auth.models import User
+from django.core.wsgi import get_wsgi_application
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.utils import load_backend
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIClient
+
+from .asgi import get_asgi_application
+from . import catalogue
+from . import matching
+from .db import POOLED_ENGINES
+from . import models
+from . import preferences
+from . import ranking
+from . import search
+from . import serializers
+from . import validators
+from .utils import AGE_BITS, GENDER_BITS, SIZE_BITS, get_age_bucket, to_mask
+
+#  Rows inserted per query when generating data
+BATCH_SIZE = 5000
+
+BREEDS = ('Labrador', 'Boxer', 'Beagle', 'Border Collie', 'French Bulldog', 'Pug', 'Swedish Vallhund')
+AGES = ('b', 'y', 'a', 's')
+GENDERS = ('m', 'f')
+SIZES = ('s', 'm', 'l', 'xl')
+
+
+def random_choices(values, rng):
+    """
+    Return a comma-separated, non-empty random subset of values.
+    """
+    return ','.join(rng.sample(values, rng.randint(1, len(values))))
+
+
+def generate_data(dogs, users, ratings, seed=0, stdout=None):
+    """
+    Fill the DB with synthetic dogs, users, preferences and ratings.
+    Everything is saved with bulk_create, so derived columns are set here.
+    :param dogs: the number of dogs to create
+    :param users: the number of users to create, each with preferences
+    :param ratings: the number of dogs each user has rated
+    :param seed: the random seed, so runs can be compared
+    :return: the ids of the users created
+    """
+    rng = random.Random(seed)
+
+    def log(message):
+        if stdout is not None:
+            stdout.write(message)
+
+    batch = []
+    for number in range(dogs):
+        age = rng.randint(1, 200)
+        batch.append(models.Dog(
+            name='Dog {}'.format(number),
+            image_filename='{}.jpg'.format(number % 19 + 1),
+            breed=rng.choice(BREEDS),
+            age=age,
+            age_bucket=get_age_bucket(age),
+            gender=rng.choice('mfu'),
+            size=rng.choice(SIZES),
+            microchipped=rng.random() < 0.5,
+        ))
+        if len(batch) == BATCH_SIZE:
+            models.Dog.objects.bulk_create(batch)
+            batch = []
+    models.Dog.objects.bulk_create(batch)
+    log('{} dogs created'.format(dogs))
+
+    first_user = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+    User.objects.bulk_create(
+        [User(username='benchmark_{}'.format(first_user + number), password='!')
+         for number in range(users)],
+        batch_size=BATCH_SIZE,
+    )
+    user_ids = list(User.objects.filter(id__gte=first_user).values_list('id', flat=True))
+
+    batch = []
+    for user_id in user_ids:
+        age, gender, size = random_choices(AGES, rng), random_choices(GENDERS, rng), random_choices(SIZES, rng)
+        batch.append(models.UserPref(
+            user_id=user_id,
+            age=age,
+            gender=gender,
+            size=size,
+            microchipped=rng.choice('yne'),
+            age_mask=to_mask(age, AGE_BITS),
+            gender_mask=to_mask(gender, GENDER_BITS),
+            size_mask=to_mask(size, SIZE_BITS),
+            version=1,
+        ))
+    models.UserPref.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+    log('{} users created'.format(len(user_ids)))
+
+    dog_ids = list(models.Dog.objects.values_list('id', flat=True))
+    batch = []
+    for user_id in user_ids:
+        for dog_id in rng.sample(dog_ids, min(ratings, len(dog_ids))):
+            batch.append(models.UserDog(
+                user_id=user_id,
+                dog_id=dog_id,
+                status=rng.choice('ldu'),
+                blacklist=rng.random() < 0.05,
+            ))
+            if len(batch) == BATCH_SIZE:
+                models.UserDog.objects.bulk_create(batch)
+                batch = []
+    models.UserDog.objects.bulk_create(batch)
+    log('{} ratings created'.format(len(user_ids) * ratings))
+
+    preferences.invalidate_all()
+    search.rebuild_index()
+    log('search index built')
+    return user_ids
+
+
+class ScanCounter:
+    """
+    Measure how much work the DB did for a request, where the backend
+    allows it. MySQL reports the rows read by its storage handlers;
+    SQLite only reports virtual machine steps, counted in thousands.
+    """
+    unit = None
+    #  Rows read by the SHOW SESSION STATUS query itself, measured once
+    overhead = None
+
+    def __init__(self):
+        self.count = 0
+        if connection.vendor == 'mysql':
+            self.unit = 'rows_read'
+            if ScanCounter.overhead is None:
+                before = self.handler_reads()
+                ScanCounter.overhead = self.handler_reads() - before
+        elif connection.vendor == 'sqlite':
+            self.unit = 'vm_steps_k'
+
+    def handler_reads(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW SESSION STATUS LIKE 'Handler_read%%'")
+            return sum(int(value) for name, value in cursor.fetchall())
+
+    def progress(self):
+        self.count += 1
+        return 0
+
+    def __enter__(self):
+        self.count = 0
+        if self.unit == 'rows_read':
+            self.start = self.handler_reads()
+        elif self.unit == 'vm_steps_k':
+            connection.ensure_connection()
+            connection.connection.set_progress_handler(self.progress, 1000)
+        return self
+
+    def __exit__(self, *args):
+        if self.unit == 'rows_read':
+            # Less the rows read by this status query itself
+            self.count = self.handler_reads() - self.start - self.overhead
+        elif self.unit == 'vm_steps_k':
+            connection.connection.set_progress_handler(None, 1000)
+
+
+class Recorder:
+    """
+    Record the latency, query count and scan cost of requests per endpoint.
+    """
+    def __init__(self):
+        self.client = None
+        self.samples = defaultdict(list)
+
+    def request(self, name, method, url, data=None):
+        # The scan counter's own status queries are made outside the capture
+        with ScanCounter() as scan, CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = getattr(self.client, method)(url, data, format='json')
+            elapsed = time.perf_counter() - started
+        self.samples[name].append((elapsed * 1000, len(queries), scan.count))
+        return response
+
+
+def run_session(recorder, swipes, rng):
+    """
+    Replay a user's swipe session: read the preferences, then step through
+    undecided dogs rating each one, sometimes blacklisting or browsing likes.
+    """
+    recorder.request('user-prefs', 'get', reverse('user-prefs'))
+
+    pk = -1
+    for swipe in range(swipes):
+        response = recorder.request(
+            'get-next', 'get', reverse('get-next', kwargs={'status': 'undecided', 'pk': pk}))
+        if response.status_code != 200:
+            return
+        pk = response.data['id']
+
+        if rng.random() < 0.1:
+            recorder.request(
+                'blacklist', 'put', reverse('blacklist', kwargs={'blacklist': 'true', 'pk': pk}))
+        else:
+            new_status = rng.choice(('liked', 'disliked', 'undecided'))
+            recorder.request(
+                'set-status', 'put', reverse('set-status', kwargs={'status': new_status, 'pk': pk}))
+
+        if rng.random() < 0.1:
+            recorder.request(
+                'get-next-liked', 'get', reverse('get-next', kwargs={'status': 'liked', 'pk': -1}))
+
+
+def run_searches(recorder, searches, rng):
+    """
+    Search for breeds and name prefixes, some with filters and some
+    paging on, as the search box would.
+    """
+    for number in range(searches):
+        params = {'q': rng.choice(BREEDS)[:rng.randint(3, 8)] if rng.random() < 0.5 else 'Dog {}'.format(
+            rng.randint(1, 999))}
+        if rng.random() < 0.5:
+            params['gender'] = rng.choice(GENDERS)
+            params['size'] = random_choices(SIZES, rng)
+        if rng.random() < 0.2:
+            params['offset'] = 20
+        recorder.request('search', 'get', reverse('dog-search') + '?' + urlencode(params))
+
+
+def run_bulk_comparison(recorder, user_id, count, rng):
+    """
+    Rate the same number of dogs with single set-status calls and with one
+    call to the bulk endpoint. Each path gets its own sample of dogs the
+    user has not rated, so both first insert fresh rows, then update them
+    to the same status.
+    :return: the time taken by each path, for the inserts and the updates
+    """
+    rated = models.UserDog.objects.filter(user_id=user_id).values('dog_id')
+    dog_ids = list(models.Dog.objects.filter(is_active=True).exclude(id__in=rated).values_list('id', flat=True))
+    count = min(count, len(dog_ids) // 2)
+    dog_ids = rng.sample(dog_ids, count * 2)
+    single_ids, bulk_ids = dog_ids[:count], dog_ids[count:]
+
+    results = {'entries': count}
+    for name, new_status in (('insert', 'liked'), ('update', 'disliked')):
+        started = time.perf_counter()
+        for dog_id in single_ids:
+            recorder.request(
+                'set-status-single', 'put', reverse('set-status', kwargs={'status': new_status, 'pk': dog_id}))
+        single = time.perf_counter() - started
+
+        recorder.request('bulk-status', 'post', reverse('bulk-status'),
+                         [{'dog_id': dog_id, 'status': new_status} for dog_id in bulk_ids])
+        bulk = recorder.samples['bulk-status'][-1][0] / 1000
+
+        results[name] = {'single_calls_ms': round(single * 1000, 3), 'bulk_call_ms': round(bulk * 1000, 3)}
+    return results
+
+
+def run_concurrency_comparison(user_id, concurrency, total):
+    """
+    Serve the same get-next requests, with up to concurrency in flight at
+    once, through the WSGI application on a thread pool and through the
+    ASGI application, whose async handler serves get-next, on an event
+    loop. Both are called in-process, so
+    this compares the handlers rather than any particular server.
+    :return: requests per second for each
+    """
+    token = Token.objects.get_or_create(user_id=user_id)[0].key
+    path = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+
+    wsgi_application = get_wsgi_application()
+    statuses = defaultdict(int)
+
+    def start_response(status, headers):
+        statuses['wsgi ' + status.split()[0]] += 1
+
+    def wsgi_request(number):
+        environ = {
+            'HTTP_HOST': 'testserver',
+            'PATH_INFO': path,
+            'REQUEST_METHOD': 'GET',
+            'HTTP_AUTHORIZATION': 'Token ' + token,
+            'wsgi.input': io.BytesIO(),
+        }
+        setup_testing_defaults(environ)
+        response = wsgi_application(environ, start_response)
+        b''.join(response)
+        response.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(wsgi_request, range(total)))
+    wsgi_seconds = time.perf_counter() - started
+
+    asgi_application = get_asgi_application()
+
+    async def asgi_request(semaphore):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', ('Token ' + token).encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses['asgi {}'.format(message['status'])] += 1
+
+        async with semaphore:
+            await asgi_application(scope, receive, send)
+
+    async def asgi_requests():
+        semaphore = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(asgi_request(semaphore) for number in range(total)))
+
+    started = time.perf_counter()
+    asyncio.run(asgi_requests())
+    asgi_seconds = time.perf_counter() - started
+
+    return {
+        'concurrency': concurrency,
+        'requests': total,
+        'wsgi_requests_per_second': round(total / wsgi_seconds, 1),
+        'asgi_requests_per_second': round(total / asgi_seconds, 1),
+        'statuses': dict(statuses),
+    }
+
+
+def run_connection_comparison(user_id, total):
+    """
+    Serve the same get-next requests closing the connection after each
+    one, as Django does with CONN_MAX_AGE = 0, first with the plain backend
+    that opens a new connection per request, then with the pooled backend.
+    :return: get-next latency percentiles for each, or None for an
+             in-memory SQLite database, which would be lost on close
+    """
+    original = connections[DEFAULT_DB_ALIAS]
+    if original.vendor == 'sqlite' and original.is_in_memory_db():
+        return None
+
+    plain_engines = {pooled: plain for plain, pooled in POOLED_ENGINES.items()}
+    plain_engine = plain_engines.get(original.settings_dict['ENGINE'], original.settings_dict['ENGINE'])
+    client = APIClient()
+    client.force_authenticate(User.objects.get(id=user_id))
+    path = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+
+    results = {}
+    for name, engine, pool in (
+            ('new_connection', plain_engine, None),
+            ('pooled', POOLED_ENGINES.get(plain_engine), {'SIZE': 1})):
+        if engine is None:
+            continue
+        settings_dict = dict(original.settings_dict, ENGINE=engine, CONN_MAX_AGE=0, POOL=pool)
+        wrapper = load_backend(engine).DatabaseWrapper(settings_dict, DEFAULT_DB_ALIAS)
+        connections[DEFAULT_DB_ALIAS] = wrapper
+        samples = []
+        try:
+            for number in range(total):
+                started = time.perf_counter()
+                client.get(path)
+                wrapper.close()
+                samples.append(((time.perf_counter() - started) * 1000, 0, 0))
+        finally:
+            wrapper.close()
+            if pool:
+                wrapper.get_pool().close_idle()
+            connections[DEFAULT_DB_ALIAS] = original
+        summary = summarise(samples)
+        results[name] = {key: summary[key] for key in ('requests', 'p50_ms', 'p95_ms', 'p99_ms')}
+    return results
+
+
+def summarise(samples):
+    """
+    Reduce (latency, queries, scan cost) samples to percentiles and means.
+    """
+    latencies = sorted(sample[0] for sample in samples)
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'requests': len(samples),
+        'p50_ms': round(p50, 3),
+        'p95_ms': round(p95, 3),
+        'p99_ms': round(p99, 3),
+        'queries_per_request': round(statistics.mean(sample[1] for sample in samples), 2),
+        'scan_cost_per_request': round(statistics.mean(sample[2] for sample in samples), 2),
+    }
+
+
+def run_benchmark(user_ids, sessions, swipes, bulk=50, concurrency=0, connection_requests=0, searches=0, seed=0):
+    """
+    Run swipe sessions for a sample of users through the test client.
+    :return: a dict of results per endpoint, ready to be saved as JSON
+    """
+    rng = random.Random(seed)
+    session_users = rng.sample(user_ids, min(sessions, len(user_ids)))
+
+    recorder = Recorder()
+    if ranking.enabled():
+        # Load the dog features up front so the first request is not an outlier
+        ranking.get_features()
+    if catalogue.enabled():
+        # Load the catalogue index up front so the first request is not an outlier
+        catalogue.get_index()
+    for user in User.objects.filter(id__in=session_users):
+        # Build the queue up front so the first request is not an outlier
+        matching.rebuild_queue(preferences.get_prefs(user.id))
+
+        recorder.client = APIClient()
+        recorder.client.force_authenticate(user)
+        run_session(recorder, swipes, rng)
+
+    if recorder.client is not None and searches:
+        run_searches(recorder, searches, rng)
+
+    scan = ScanCounter()
+    results = {'scan_cost_unit': scan.unit, 'scan_cost_overhead': scan.overhead}
+    if recorder.client is not None and bulk:
+        results['bulk_comparison'] = run_bulk_comparison(recorder, user.id, bulk, rng)
+        for name in ('set-status-single', 'bulk-status'):
+            recorder.samples.pop(name)
+    results['endpoints'] = {name: summarise(samples) for name, samples in sorted(recorder.samples.items())}
+    if recorder.client is not None and concurrency:
+        results['concurrency_comparison'] = run_concurrency_comparison(
+            session_users[0], concurrency, max(concurrency * 10, 100))
+    if recorder.client is not None and connection_requests:
+        connection_comparison = run_connection_comparison(session_users[0], connection_requests)
+        if connection_comparison is not None:
+            results['connection_comparison'] = connection_comparison
+    return results
+
+
+def generate_rows(count, seed=0):
+    """
+    Generate raw dog rows as an import reads them, with string values as
+    in a CSV file for some and a few invalid rows among them.
+    """
+    rng = random.Random(seed)
+    rows = []
+    for number in range(count):
+        row = {
+            'name': 'Dog {}'.format(number),
+            'image_filename': '{}.jpg'.format(number % 19 + 1),
+            'breed': rng.choice(BREEDS),
+            'age': rng.randint(1, 200),
+            'gender': rng.choice('mfu'),
+            'size': rng.choice(SIZES),
+            'microchipped': rng.random() < 0.5,
+        }
+        if rng.random() < 0.5:
+            row = {field: str(value) for field, value in row.items()}
+        if rng.random() < 0.05:
+            row[rng.choice(('image_filename', 'age', 'gender', 'size'))] = 'x'
+        rows.append(row)
+    return rows
+
+
+def regex_checks(row):
+    # The inline patterns the serializers used before validators.py, as a baseline
+    return (re.match(r'^.+\.(jpg|jpeg|png)$', row['image_filename']) and
+            re.match(r'^[mfu]$', row['gender']) and
+            re.match(r'^(s|m|l|xl)$', row['size']))
+
+
+def field_checks(row):
+    try:
+        validators.validate_image_filename(row['image_filename'])
+        validators.DOG_GENDERS.check(row['gender'])
+        validators.DOG_SIZES.check(row['size'])
+    except ValidationError:
+        return False
+    return True
+
+
+def run_validation_benchmark(rows, serializer_rows=None):
+    """
+    Time the validation of each row, for the field checks alone, first
+    with the old inline patterns then with validators.py, and for whole
+    rows through DogSerializer and through validators.validate_dog.
+    :param rows: raw dog rows, see generate_rows
+    :param serializer_rows: validate only this many rows through
+                            DogSerializer, which is much slower
+    :return: microseconds per row and the total seconds for each
+    """
+    def run(validate, sample):
+        started = time.perf_counter()
+        for row in sample:
+            validate(row)
+        seconds = time.perf_counter() - started
+        return {
+            'rows': len(sample),
+            'us_per_row': round(seconds / len(sample) * 1000000, 3),
+            'seconds': round(seconds, 3),
+        }
+
+    results = {
+        'regex_field_checks': run(regex_checks, rows),
+        'field_checks': run(field_checks, rows),
+        'serializer': run(
+            lambda row: serializers.DogSerializer(data=row).is_valid(), rows[:serializer_rows or len(rows)]),
+        'validate_dog': run(validators.validate_dog, rows),
+    }
+    results['speedup'] = round(results['serializer']['us_per_row'] / results['validate_dog']['us_per_row'], 1)
+    results['invalid_rows'] = sum(1 for row in rows if validators.validate_dog(row)[1])
+    return results
+
+
+def compare(previous, current):
+    """
+    List the change in p50 / p95 / p99, queries and scan cost per endpoint
+    between two runs. Scan costs are only compared when measured in the same unit.
+    """
+    keys = ['p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request']
+    unit = current.get('scan_cost_unit')
+    if unit is not None and previous.get('scan_cost_unit') == unit:
+        keys.append('scan_cost_per_request')
+
+    lines = []
+    for name, result in current['endpoints'].items():
+        before = previous.get('endpoints', {}).get(name)
+        if before is None:
+            continue
+        changes = []
+        for key in keys:
+            if before[key]:
+                changes.append('{} {:+.1f}%'.format(key, (result[key] - before[key]) / before[key] * 100))
+        lines.append('{}: {}'.format(name, ', '.join(changes)))
+    return lines
@@ -0,0 +1,247 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import dog_sets
+from . import models
+
+#  The Dog fields with a bitmap for each of their values
+FIELDS = ('gender', 'size', 'age_bucket', 'microchipped')
+
+LOAD_BATCH_SIZE = 5000
+
+VERSION_KEY = 'pugorugh:catalogue:version'
+
+#  Bits of a bitmap read at a time when walking it in id order
+WINDOW_BITS = 4096
+WINDOW_BYTES = WINDOW_BITS // 8
+WINDOW_MASK = (1 << WINDOW_BITS) - 1
+
+
+def get_cache():
+    return caches[getattr(settings, 'DOG_CATALOGUE_CACHE_ALIAS', 'default')]
+
+
+def enabled():
+    return getattr(settings, 'DOG_CATALOGUE_INDEX', False)
+
+
+def to_bitmap(dog_ids):
+    """
+    Pack dog ids into a bitmap, with bit n set for dog n.
+    Setting bits in a bytearray first keeps this linear in the largest id.
+    :param dog_ids: an iterable of dog ids
+    :return: an int
+    """
+    dog_ids = list(dog_ids)
+    if not dog_ids:
+        return 0
+    packed = bytearray(max(dog_ids) // 8 + 1)
+    for dog_id in dog_ids:
+        packed[dog_id >> 3] |= 1 << (dog_id & 7)
+    return int.from_bytes(packed, 'little')
+
+
+def lowest(bitmap):
+    """
+    :return: the position of the lowest set bit of a non-zero bitmap
+    """
+    return (bitmap & -bitmap).bit_length() - 1
+
+
+class DogIndex:
+    """
+    An in-process copy of the catalogue as bitmaps over dog ids, one for
+    each value of each of FIELDS and one of the active dogs, so matching
+    a user's preferences is a few bitwise operations on Python ints
+    instead of a query. Patched as dogs change in this process; the
+    other processes see the shared version stamp move on and reload.
+    """
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.bitmaps = {field: {} for field in FIELDS}  # field: {value: bitmap}
+        self.active = 0
+        self.version = None  # The shared version stamp this copy is up to date with
+
+    def load(self):
+        """
+        Reload every active dog.
+        """
+        self.reset()
+        ids = {field: {} for field in FIELDS}
+        active = []
+        dogs = models.Dog.objects.filter(is_active=True).values_list('id', *FIELDS)
+        for row in dogs.iterator(chunk_size=LOAD_BATCH_SIZE):
+            active.append(row[0])
+            for field, value in zip(FIELDS, row[1:]):
+                ids[field].setdefault(value, []).append(row[0])
+        self.active = to_bitmap(active)
+        self.bitmaps = {
+            field: {value: to_bitmap(dog_ids) for value, dog_ids in values.items()}
+            for field, values in ids.items()
+        }
+
+    def set(self, dog_id, values=None):
+        """
+        Add, change or remove a dog.
+        :param dog_id: a dog id
+        :param values: {field: value} for each of FIELDS, or None to remove the dog
+        """
+        bit = 1 << dog_id
+        self.active &= ~bit
+        for field, bitmaps in self.bitmaps.items():
+            for value, bitmap in bitmaps.items():
+                if bitmap & bit:
+                    bitmaps[value] = bitmap & ~bit
+        if values is not None:
+            self.active |= bit
+            for field in FIELDS:
+                bitmaps = self.bitmaps[field]
+                bitmaps[values[field]] = bitmaps.get(values[field], 0) | bit
+
+    def any_of(self, field, values):
+        bitmap = 0
+        for value in values:
+            bitmap |= self.bitmaps[field].get(value, 0)
+        return bitmap
+
+    def match(self, prefs, rated=0):
+        """
+        Get the dogs that match the user's preferences.
+        :param prefs: a preferences.Prefs instance
+        :param rated: a bitmap of dogs to leave out, e.g. those the user decided on
+        :return: a bitmap
+        """
+        bitmap = (
+            self.active &
+            self.any_of('gender', prefs.genders) &
+            self.any_of('size', prefs.sizes) &
+            self.any_of('age_bucket', prefs.ages)
+        )
+        if prefs.chipped != 'no_preference':
+            bitmap &= self.any_of('microchipped', [prefs.chipped])
+        return bitmap & ~rated
+
+
+def next_ids(bitmap, pk, count=1):
+    """
+    Get the ids of the dogs that follow pk in a bitmap,
+    looping back around to the first dog. The bitmap is read a window at
+    a time. The first window is shifted out of the bitmap, which copies
+    every bit above it, as matching the bitmap did. If more windows are
+    needed, e.g. for a sparse bitmap, the bitmap is copied out to bytes
+    once and each window is sliced from its own bytes instead.
+    :param bitmap: a bitmap of dogs
+    :param pk: the id of the current dog
+    :param count: the most ids to return
+    :return: a list of dog ids
+    """
+    start = max(int(pk) + 1, 0)
+    size = bitmap.bit_length()
+    data = None
+    dog_ids = []
+    for offset, end in ((start, size), (0, min(start, size))):
+        first_window = True
+        while offset < end and len(dog_ids) < count:
+            if first_window and data is None:
+                window = (bitmap >> offset) & WINDOW_MASK
+            else:
+                if data is None:
+                    data = bitmap.to_bytes((size + 7) // 8, 'little')
+                first_byte = offset // 8
+                window = int.from_bytes(data[first_byte:first_byte + WINDOW_BYTES + 1], 'little')
+                window = (window >> (offset % 8)) & WINDOW_MASK
+            first_window = False
+            if offset + WINDOW_BITS > end:
+                window &= (1 << (end - offset)) - 1
+            while window and len(dog_ids) < count:
+                dog_ids.append(offset + lowest(window))
+                window &= window - 1
+            offset += WINDOW_BITS
+    return dog_ids
+
+
+index = DogIndex()
+
+
+def get_version(cache):
+    cache.add(VERSION_KEY, 1, None)
+    return cache.get(VERSION_KEY, 1)
+
+
+def get_index():
+    """
+    Get this process's DogIndex, reloading it if any process has changed
+    a dog since it was loaded.
+    """
+    version = get_version(get_cache())
+    with index.lock:
+        if index.version != version:
+            index.load()
+            index.version = version
+    return index
+
+
+def update_dog(dog, deleted=False):
+    """
+    Patch this process's index with an added, changed, archived or deleted
+    dog and move the shared version stamp on, once the change is committed.
+    :param dog: a Dog instance
+    :param deleted: whether the dog has been deleted
+    """
+    dog_id = dog.id
+    values = {field: getattr(dog, field) for field in FIELDS} if dog.is_active and not deleted else None
+
+    def patch():
+        cache = get_cache()
+        previous = get_version(cache)
+        version = cache.incr(VERSION_KEY)
+        with index.lock:
+            if index.version is not None:
+                index.set(dog_id, values)
+                # Only this process's change since it was loaded, so it needn't reload
+                if index.version == previous and version == previous + 1:
+                    index.version = version
+    transaction.on_commit(patch)
+
+
+def invalidate():
+    """
+    Make every process reload the index, e.g. after dogs are saved in bulk.
+    """
+    cache = get_cache()
+    get_version(cache)
+    cache.incr(VERSION_KEY)
+
+
+def rated_bitmap(user_id):
+    """
+    Get a bitmap of the dogs a user has decided on,
+    i.e. liked, disliked or blacklisted.
+    """
+    if dog_sets.enabled():
+        return to_bitmap(dog_sets.decided(dog_sets.get_sets(user_id)))
+    rated = models.UserDog.objects.filter(user_id=user_id).exclude(status='u', blacklist=False)
+    return to_bitmap(rated.values_list('dog_id', flat=True))
+
+
+def next_dogs(prefs, pk, count=1):
+    """
+    Get the next undecided dogs that match the user's preferences,
+    in id order after pk, looping back around.
+    :param prefs: a preferences.Prefs instance
+    :param pk: the id of the current dog
+    :param count: the most dogs to return
+    :return: a list of Dog instances
+    """
+    rated = rated_bitmap(prefs.user_id)
+    dog_index = get_index()
+    with dog_index.lock:
+        dog_ids = next_ids(dog_index.match(prefs, rated), pk, count)
+    dogs = models.Dog.objects.filter(is_active=True).in_bulk(dog_ids)
+    return [dogs[dog_id] for dog_id in dog_ids if dog_id in dogs]
@@ -0,0 +1,96 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, quote_etag
+
+from . import images
+
+
+def dog_etag(dogs):
+    """
+    Get the ETag of the representation of one or more dogs, from their
+    versions and image variants so it can be checked without serializing.
+    :param dogs: a Dog instance or a list of them
+    :return: a quoted ETag
+    """
+    if not isinstance(dogs, (list, tuple)):
+        dogs = [dogs]
+    digest = hashlib.md5()
+    for dog in dogs:
+        digest.update('{}:{}:{};'.format(
+            dog.id, dog.version, images.get_srcset(dog.image_filename)).encode())
+    return quote_etag(digest.hexdigest()[:16])
+
+
+def prefs_etag(prefs):
+    """
+    Get the ETag of a user's preferences, which changes on every save.
+    :param prefs: a preferences.Prefs or UserPref instance
+    :return: a quoted ETag
+    """
+    return quote_etag('pref-{}-{}'.format(prefs.id, prefs.version))
+
+
+def not_modified(request, etag):
+    """
+    Check a request's If-None-Match against an ETag.
+    :return: a 304 response if the client's copy is current, otherwise None
+    """
+    return get_conditional_response(request, etag=etag)
+
+
+def get_cache():
+    """
+    Get the cache for get-next responses, or None if it is switched off.
+    """
+    alias = getattr(settings, 'NEXT_DOG_CACHE_ALIAS', None)
+    return caches[alias] if alias is not None else None
+
+
+def generation(cache, key):
+    value = cache.get(key)
+    if value is None:
+        value = int(time.time())
+        cache.add(key, value, None)
+    return value
+
+
+def next_cache_key(cache, user_id, prefs_version, status, pk, count):
+    """
+    Cached responses are keyed on the user's preference version and
+    cursor, and on generation numbers that change whenever the user
+    rates a dog or any dog changes, so no stale dogs are served.
+    """
+    return 'pugorugh:next:{}:{}:{}:{}:{}:{}:{}'.format(
+        user_id, prefs_version,
+        generation(cache, 'pugorugh:next:generation:{}'.format(user_id)),
+        generation(cache, 'pugorugh:next:generation'),
+        status, pk, count or '')
+
+
+def bump(cache, key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time()), None)
+
+
+def invalidate_user(user_id):
+    """
+    Drop the user's cached get-next responses, e.g. after they rate a dog.
+    """
+    cache = get_cache()
+    if cache is not None:
+        bump(cache, 'pugorugh:next:generation:{}'.format(user_id))
+
+
+def invalidate_all():
+    """
+    Drop every cached get-next response, e.g. after a dog or its
+    image variants change.
+    """
+    cache = get_cache()
+    if cache is not None:
+        bump(cache, 'pugorugh:next:generation')
@@ -22,3 +22,15 @@ class BlacklistConverter:
 
     def to_url(self, value):
         return '%s' % value
+
+
+# noinspection PyMethodMayBeStatic
+class CollectionConverter:
+
+    regex = 'liked|disliked|blacklisted'
+
+    def to_python(self, value):
+        return str(value)
+
+    def to_url(self, value):
+        return '%s' % value
@@ -0,0 +1,5 @@
+#  The pooled backend to use in place of each of Django's own
+POOLED_ENGINES = {
+    'django.db.backends.mysql': 'pugorugh.db.backends.mysql',
+    'django.db.backends.sqlite3': 'pugorugh.db.backends.sqlite3',
+}
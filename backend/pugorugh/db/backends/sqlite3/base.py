@@ -0,0 +1,9 @@
+from django.db.backends.sqlite3 import base
+
+from ...pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def pooled(self):
+        # Closing an in-memory database destroys it, so there is nothing to pool
+        return super().pooled() and not self.is_in_memory_db()
@@ -0,0 +1,187 @@
+import os
+import threading
+import time
+
+from django.db.utils import OperationalError
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """
+    A process-wide pool of DB-API connections shared by every thread.
+    At most size connections are open at once; a thread that needs one
+    when all are in use waits up to timeout seconds for one to be released.
+    Connections are recycled once they are max_age seconds old, and any
+    that have been idle for more than check_after seconds are checked
+    before being handed out again.
+    """
+    def __init__(self, size=10, max_age=300, timeout=10, check_after=30):
+        self.size = size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.check_after = check_after
+        self.condition = threading.Condition()
+        self.idle = []  # (connection, created, released), most recently released last
+        self.in_use = {}  # id(connection): created
+        self.open = 0
+
+    def acquire(self, connect, check):
+        """
+        Get an idle connection, or open a new one if there are none.
+        :param connect: a callable that opens a new connection
+        :param check: a callable that returns whether a connection still works
+        :return: a DB-API connection
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            with self.condition:
+                while not self.idle and self.open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise OperationalError(
+                            'Timed out after {}s waiting for one of {} pooled connections'.format(
+                                self.timeout, self.size))
+                    self.condition.wait(remaining)
+                if self.idle:
+                    connection, created, released = self.idle.pop()
+                else:
+                    connection = None
+                    self.open += 1
+
+            now = time.monotonic()
+            if connection is None:
+                try:
+                    connection = connect()
+                except Exception:
+                    self.closed()
+                    raise
+                created = now
+            elif now - created >= self.max_age or (now - released >= self.check_after and not check(connection)):
+                self.closed()
+                close_quietly(connection)
+                continue
+
+            with self.condition:
+                self.in_use[id(connection)] = created
+            return connection
+
+    def release(self, connection):
+        """
+        Return a connection to the pool, closing it instead if it is too old.
+        """
+        now = time.monotonic()
+        with self.condition:
+            created = self.in_use.pop(id(connection), None)
+            if created is not None and now - created < self.max_age:
+                self.idle.append((connection, created, now))
+                self.condition.notify()
+                return
+        if created is not None:
+            self.closed()
+        close_quietly(connection)
+
+    def discard(self, connection):
+        """
+        Close a connection that is broken or left mid-transaction.
+        """
+        with self.condition:
+            owned = self.in_use.pop(id(connection), None) is not None
+        if owned:
+            self.closed()
+        close_quietly(connection)
+
+    def closed(self):
+        # Free the slot of a connection that has been closed
+        with self.condition:
+            self.open -= 1
+            self.condition.notify()
+
+    def close_idle(self):
+        """
+        Close every idle connection, e.g. before a process exits.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.open -= len(idle)
+            self.condition.notify_all()
+        for connection, created, released in idle:
+            close_quietly(connection)
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+def get_pool(settings_dict, alias):
+    """
+    Get the pool for a database, creating it on first use. Pools are
+    per process, so connections are never shared across a fork.
+    :param settings_dict: the database's settings, with pool options under POOL
+    :param alias: the database alias
+    :return: a ConnectionPool
+    """
+    key = (os.getpid(), alias, settings_dict['HOST'], settings_dict['PORT'],
+           settings_dict['NAME'], settings_dict['USER'])
+    with pools_lock:
+        pool = pools.get(key)
+        if pool is None:
+            options = settings_dict.get('POOL') or {}
+            pool = pools[key] = ConnectionPool(
+                size=options.get('SIZE', 10),
+                max_age=options.get('MAX_AGE', 300),
+                timeout=options.get('TIMEOUT', 10),
+                check_after=options.get('CHECK_AFTER', 30),
+            )
+        return pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Take connections from a ConnectionPool instead of opening a new one
+    for each request, and give them back when Django closes them. Enabled
+    by a POOL entry in the database settings, e.g.
+        'POOL': {'SIZE': 10, 'MAX_AGE': 300, 'TIMEOUT': 10, 'CHECK_AFTER': 30}
+    Leave CONN_MAX_AGE at 0 so that connections go back to the pool at
+    the end of each request.
+    """
+    def pooled(self):
+        return bool(self.settings_dict.get('POOL'))
+
+    def get_pool(self):
+        return get_pool(self.settings_dict, self.alias)
+
+    def ping(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        if not self.pooled():
+            return super().get_new_connection(conn_params)
+        connect = super().get_new_connection
+        return self.get_pool().acquire(lambda: connect(conn_params), self.ping)
+
+    def _close(self):
+        if not self.pooled() or self.connection is None:
+            return super()._close()
+
+        pool = self.get_pool()
+        if self.in_atomic_block or (self.errors_occurred and not self.ping(self.connection)):
+            pool.discard(self.connection)
+            return
+        try:
+            # End any transaction left open before the next thread gets it
+            self.connection.rollback()
+        except Exception:
+            pool.discard(self.connection)
+        else:
+            pool.release(self.connection)
@@ -0,0 +1,185 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+
+from django.conf import settings
+from django.db import transaction
+
+from . import models
+from .ratings import COLLECTIONS
+
+#  The UserDog values of the dogs in each of a user's sets
+SETS = dict(COLLECTIONS, undecided={'status': 'u', 'blacklist': False})
+
+#  Array typecode of the packed dog ids, 4 bytes each
+TYPECODE = 'I'
+
+
+def enabled():
+    return getattr(settings, 'USER_DOG_SETS', False)
+
+
+def set_name(status, blacklist):
+    """
+    :return: the name of the set a UserDog belongs in
+    """
+    if blacklist:
+        return 'blacklisted'
+    return {'l': 'liked', 'd': 'disliked', 'u': 'undecided'}.get(status)
+
+
+def unpack(data):
+    dog_ids = array(TYPECODE)
+    dog_ids.frombytes(bytes(data))
+    return dog_ids
+
+
+def build(user_id):
+    """
+    Read a user's sets from their UserDog rows.
+    :param user_id: a user id
+    :return: {set name: a sorted array of dog ids}
+    """
+    sets = {name: array(TYPECODE) for name in SETS}
+    rows = models.UserDog.objects.filter(user_id=user_id).order_by('dog_id')
+    for dog_id, status, blacklist in rows.values_list('dog_id', 'status', 'blacklist').iterator():
+        name = set_name(status, blacklist)
+        if name is not None:
+            sets[name].append(dog_id)
+    return sets
+
+
+def get_sets(user_id):
+    """
+    Get a user's sets in one query, building them from UserDog the first
+    time they are needed. The empty row is created before the sets are
+    built, under its lock, so a swipe made during the build is either read
+    by it or patched in by refresh once it is stored, never lost.
+    :param user_id: a user id
+    :return: {set name: a sorted array of dog ids}
+    """
+    row = models.UserDogSet.objects.filter(user_id=user_id).values_list('built', *SETS).first()
+    if row is not None and row[0]:
+        return {name: unpack(data) for name, data in zip(SETS, row[1:])}
+
+    models.UserDogSet.objects.get_or_create(user_id=user_id)
+    with transaction.atomic():
+        row = models.UserDogSet.objects.select_for_update().get(user_id=user_id)
+        if row.built:
+            return {name: unpack(getattr(row, name)) for name in SETS}
+        sets = build(user_id)
+        for name, dog_ids in sets.items():
+            setattr(row, name, dog_ids.tobytes())
+        row.built = True
+        row.save()
+    return sets
+
+
+def refresh(user_id, dog_ids):
+    """
+    Patch a user's sets with the current ratings of the given dogs,
+    after they are rated, re-rated or un-rated. Users whose sets have
+    not been built yet are left for get_sets to build, which reads the
+    ratings once it holds the row's lock.
+    :param user_id: a user id
+    :param dog_ids: the ids of the changed dogs
+    """
+    dog_ids = [int(dog_id) for dog_id in dog_ids]
+    with transaction.atomic():
+        row = models.UserDogSet.objects.select_for_update().filter(user_id=user_id).first()
+        if row is None or not row.built:
+            return
+        current = models.UserDog.objects.filter(user_id=user_id, dog_id__in=dog_ids).values_list(
+            'dog_id', 'status', 'blacklist')
+        current = {dog_id: set_name(status, blacklist) for dog_id, status, blacklist in current}
+
+        changed = []
+        for name in SETS:
+            members = unpack(getattr(row, name))
+            updated = False
+            for dog_id in dog_ids:
+                index = bisect_left(members, dog_id)
+                present = index < len(members) and members[index] == dog_id
+                if present and current.get(dog_id) != name:
+                    members.pop(index)
+                    updated = True
+                elif not present and current.get(dog_id) == name:
+                    members.insert(index, dog_id)
+                    updated = True
+            if updated:
+                setattr(row, name, members.tobytes())
+                changed.append(name)
+        if changed:
+            row.save(update_fields=changed)
+
+
+def remove_dog(user_ids, dog_id):
+    """
+    Take a purged dog out of its users' sets.
+    :param user_ids: the ids of the users who had rated the dog
+    :param dog_id: a dog id
+    """
+    for user_id in user_ids:
+        refresh(user_id, [dog_id])
+
+
+def next_dogs(user_id, name, pk, count=1):
+    """
+    Get the dogs that follow pk in one of a user's sets, looping back
+    around to the first. A binary search on the sorted ids rather than
+    a scan of the user's ratings.
+    :param user_id: a user id
+    :param name: liked, disliked, undecided or blacklisted
+    :param pk: the id of the current dog
+    :param count: the most dogs to return
+    :return: a list of Dog instances
+    """
+    dog_ids = get_sets(user_id)[name]
+    start = bisect_right(dog_ids, int(pk))
+    ordered = chain(islice(dog_ids, start, None), islice(dog_ids, 0, start))
+
+    # Archived dogs stay in the sets until they are purged, so skip them
+    dogs = []
+    while len(dogs) < count:
+        batch = list(islice(ordered, count - len(dogs)))
+        if not batch:
+            break
+        found = models.Dog.objects.filter(is_active=True).in_bulk(batch)
+        dogs.extend(found[dog_id] for dog_id in batch if dog_id in found)
+    return dogs
+
+
+def decided(sets):
+    """
+    :param sets: a user's sets
+    :return: the ids of the dogs the user has liked, disliked or blacklisted
+    """
+    return chain(sets['liked'], sets['disliked'], sets['blacklisted'])
+
+
+def check(user_ids=None, fix=False):
+    """
+    Compare stored sets with the sets built from UserDog.
+    :param user_ids: the users to check, or None for every user with built sets
+    :param fix: whether to overwrite sets that differ
+    :return: {user id: {set name: (missing dog ids, unexpected dog ids)}} for each user whose sets differ
+    """
+    stored = models.UserDogSet.objects.filter(built=True).order_by('user_id')
+    if user_ids is not None:
+        stored = stored.filter(user_id__in=user_ids)
+
+    differences = {}
+    for row in stored.iterator():
+        expected = build(row.user_id)
+        differ = {}
+        for name in SETS:
+            have = unpack(getattr(row, name))
+            if have != expected[name]:
+                have, want = set(have), set(expected[name])
+                differ[name] = (sorted(want - have), sorted(have - want))
+        if differ:
+            differences[row.user_id] = differ
+            if fix:
+                models.UserDogSet.objects.filter(id=row.id).update(
+                    **{name: expected[name].tobytes() for name in differ})
+    return differences
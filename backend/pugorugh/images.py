@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'images', 'dogs')
+VARIANT_DIR = os.path.join(IMAGE_DIR, 'variants')
+VARIANT_URL = settings.STATIC_URL + 'images/dogs/variants/'
+
+#  The width in pixels of each variant, all saved as WebP
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+}
+WEBP_QUALITY = 80
+
+#  Seconds between checks for a manifest rewritten by another process
+MANIFEST_CHECK_INTERVAL = 1.0
+
+manifest_lock = threading.Lock()
+manifest_cache = {'mtime': None, 'checked': 0.0, 'entries': {}}
+
+#  Builds the variants of dogs added through the API outside the request, one at a time
+background = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-variants')
+
+
+def inside(directory, path):
+    """
+    :return: whether path, with any symlinks and '..' resolved, is inside directory
+    """
+    directory = os.path.realpath(directory)
+    return os.path.commonpath([directory, os.path.realpath(path)]) == directory
+
+
+def source_hash(path):
+    """
+    Hash the contents of an image so variants are only rebuilt when it changes.
+    """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(64 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def build_variants(filename, force=False):
+    """
+    Create the WebP variants of a dog image that do not exist yet.
+    Safe to run in a worker process.
+    :param filename: an image_filename in IMAGE_DIR
+    :param force: rebuild variants even if they exist
+    :return: (filename, {variant name: (variant filename, width)}),
+             or (filename, None) if the image is missing, outside IMAGE_DIR
+             or Pillow is not installed
+    """
+    path = os.path.join(IMAGE_DIR, filename)
+    if not inside(IMAGE_DIR, path) or not os.path.isfile(path):
+        return filename, None
+    try:
+        from PIL import Image
+    except ImportError:
+        return filename, None
+
+    stem = os.path.splitext(filename)[0]
+    digest = source_hash(path)
+    os.makedirs(VARIANT_DIR, exist_ok=True)
+
+    variants = {}
+    image = None
+    for name, width in VARIANTS.items():
+        variant = '{}-{}-{}.webp'.format(stem, digest, name)
+        variant_path = os.path.join(VARIANT_DIR, variant)
+        if not inside(VARIANT_DIR, variant_path):
+            return filename, None
+        if force or not os.path.isfile(variant_path):
+            if image is None:
+                image = Image.open(path)
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            resized = image.copy()
+            resized.thumbnail((width, width * 4))
+            resized.save(variant_path, 'WEBP', quality=WEBP_QUALITY)
+        variants[name] = (variant, width)
+    return filename, variants
+
+
+def manifest_path():
+    return os.path.join(VARIANT_DIR, 'manifest.json')
+
+
+def read_manifest():
+    """
+    Get the variants of every image, reloading the manifest if another
+    process has rewritten it. That is checked at most once every
+    MANIFEST_CHECK_INTERVAL seconds, rather than once per dog serialized.
+    :return: {image_filename: {variant name: (variant filename, width)}}
+    """
+    now = time.monotonic()
+    if now - manifest_cache['checked'] < MANIFEST_CHECK_INTERVAL:
+        return manifest_cache['entries']
+
+    try:
+        mtime = os.path.getmtime(manifest_path())
+    except OSError:
+        mtime = None
+    with manifest_lock:
+        if manifest_cache['mtime'] != mtime:
+            manifest_cache['entries'] = {} if mtime is None else load_manifest()
+            manifest_cache['mtime'] = mtime
+        manifest_cache['checked'] = now
+        return manifest_cache['entries']
+
+
+def load_manifest():
+    try:
+        with open(manifest_path()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def update_manifest(results):
+    """
+    Record built variants in the manifest.
+    :param results: an iterable of build_variants results
+    """
+    built = {filename: variants for filename, variants in results if variants is not None}
+    if not built:
+        return
+    with manifest_lock:
+        entries = load_manifest()
+        entries.update(built)
+        os.makedirs(VARIANT_DIR, exist_ok=True)
+        temporary = '{}.{}.tmp'.format(manifest_path(), os.getpid())
+        with open(temporary, 'w') as file:
+            json.dump(entries, file, indent=1, sort_keys=True)
+        os.replace(temporary, manifest_path())
+        manifest_cache['mtime'] = None
+        manifest_cache['checked'] = 0.0
+
+
+def get_srcset(filename):
+    """
+    Get the srcset of the variants of a dog image.
+    :param filename: an image_filename
+    :return: e.g. '/static/images/dogs/variants/1-ab12-thumbnail.webp 160w, ...',
+             or an empty string if no variants have been built
+    """
+    variants = read_manifest().get(filename)
+    if not variants:
+        return ''
+    return ', '.join(
+        '{}{} {}w'.format(VARIANT_URL, variant, width)
+        for variant, width in sorted(variants.values(), key=lambda item: item[1])
+    )
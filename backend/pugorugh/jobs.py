@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.models import F
+from django.utils import timezone
+
+from . import models
+
+#  The functions jobs can run, by name, see task
+TASKS = {}
+
+#  Seconds to wait before retrying a job after attempt n is 2 ** n, up to BACKOFF_MAX
+BACKOFF_MAX = 600
+
+#  Due jobs read per claim, so workers racing for the first can take the next
+CLAIM_BATCH_SIZE = 10
+
+
+def enabled():
+    return getattr(settings, 'BACKGROUND_JOBS', False)
+
+
+def lease_time():
+    return timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', 300))
+
+
+def task(name=None, max_attempts=5):
+    """
+    Register a function as a task that jobs can run.
+    Its keyword arguments are stored as JSON, so they should be simple values.
+    :param name: the task name, defaults to the function name
+    :param max_attempts: attempts before a failing job is given up on
+    """
+    def register(function):
+        function.max_attempts = max_attempts
+        TASKS[name or function.__name__] = function
+        return function
+    return register
+
+
+def enqueue(name, key=None, **kwargs):
+    """
+    Queue a job to run a task in the background. Jobs are rows in the same
+    database, so a job queued in a transaction that is rolled back is too.
+    :param name: a registered task name
+    :param key: an idempotency key; if a job with it is pending, running or
+                done that job is returned instead of queuing another, and
+                if it failed it is queued again with these kwargs
+    :param kwargs: the task's keyword arguments
+    :return: a Job instance
+    """
+    if name not in TASKS:
+        raise ValueError('Unknown task: {}'.format(name))
+    values = {
+        'name': name,
+        'kwargs': json.dumps(kwargs, sort_keys=True),
+        'max_attempts': TASKS[name].max_attempts,
+        'run_after': timezone.now(),
+    }
+    if key is None:
+        return models.Job.objects.create(**values)
+    job, created = models.Job.objects.get_or_create(key=key, defaults=values)
+    if not created and job.status == models.Job.FAILED:
+        requeued = models.Job.objects.filter(id=job.id, status=models.Job.FAILED).update(
+            attempts=0, status=models.Job.PENDING, error='', updated=values['run_after'], **values)
+        if requeued:
+            job.refresh_from_db()
+    return job
+
+
+def backoff(attempts):
+    """
+    :return: the delay before retrying a job that has failed attempts times
+    """
+    return timedelta(seconds=min(2 ** attempts, BACKOFF_MAX))
+
+
+def claim():
+    """
+    Take the next due job, or a running job whose worker let its lease run
+    out. Claimed with a conditional update rather than a row lock, so two
+    workers never take the same job on any database. A running job whose
+    lease ran out on its last attempt is marked failed instead.
+    :return: a Job instance or None if no job is due
+    """
+    now = timezone.now()
+    models.Job.objects.filter(
+        status=models.Job.RUNNING, run_after__lte=now, attempts__gte=F('max_attempts'),
+    ).update(status=models.Job.FAILED, error='Lease ran out on the last attempt', updated=now)
+
+    due = models.Job.objects.filter(
+        status__in=(models.Job.PENDING, models.Job.RUNNING), run_after__lte=now,
+    ).order_by('run_after', 'id').values_list('id', 'status', 'run_after')[:CLAIM_BATCH_SIZE]
+
+    for job_id, status, run_after in due:
+        claimed = models.Job.objects.filter(id=job_id, status=status, run_after=run_after).update(
+            status=models.Job.RUNNING, run_after=now + lease_time(), attempts=F('attempts') + 1, updated=now)
+        if claimed:
+            return models.Job.objects.get(id=job_id)
+    return None
+
+
+def heartbeat(job, stop):
+    """
+    Renew a running job's lease every third of JOB_LEASE_SECONDS until
+    stop is set, so jobs that take longer than a lease aren't taken by
+    another worker. Stops early if the job is no longer this attempt's.
+    :param job: a claimed Job instance
+    :param stop: a threading.Event set once the job has finished
+    """
+    lease = lease_time()
+    try:
+        while not stop.wait(lease.total_seconds() / 3):
+            renewed = models.Job.objects.filter(
+                id=job.id, status=models.Job.RUNNING, attempts=job.attempts,
+            ).update(run_after=timezone.now() + lease)
+            if not renewed:
+                return
+    finally:
+        connections.close_all()
+
+
+def run(job):
+    """
+    Run a claimed job, renewing its lease while it runs, then mark it done,
+    or queue a retry after a backoff until it has used up its attempts.
+    The job is only marked if this attempt still holds it, so a worker whose
+    lease ran out and was taken over leaves the new attempt alone.
+    :param job: a Job instance
+    :return: True if the job succeeded
+    """
+    held = models.Job.objects.filter(id=job.id, status=models.Job.RUNNING, attempts=job.attempts)
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(job, stop), name='job-heartbeat', daemon=True).start()
+    try:
+        TASKS[job.name](**json.loads(job.kwargs))
+    except Exception:
+        now = timezone.now()
+        retry = job.attempts < job.max_attempts
+        held.update(
+            status=models.Job.PENDING if retry else models.Job.FAILED,
+            run_after=now + backoff(job.attempts) if retry else now,
+            error=traceback.format_exc(),
+            updated=now,
+        )
+        return False
+    finally:
+        stop.set()
+
+    held.update(status=models.Job.DONE, error='', updated=timezone.now())
+    return True
+
+
+def work(poll=1.0, once=False):
+    """
+    Claim and run jobs one at a time, waiting poll seconds whenever none
+    are due.
+    :param poll: seconds to wait between checks for due jobs
+    :param once: return once no jobs are due, rather than waiting for more
+    :return: the number of jobs run
+    """
+    count = 0
+    while True:
+        close_old_connections()
+        job = claim()
+        if job is not None:
+            run(job)
+            count += 1
+        elif once:
+            return count
+        else:
+            time.sleep(poll)
+
+
+def pool_worker(poll=1.0, once=False):
+    """
+    work in a thread or process of run_jobs's pool, closing the
+    connections it opened when it is done.
+    """
+    try:
+        return work(poll, once)
+    finally:
+        connections.close_all()
+
+
+def delete_finished(days):
+    """
+    Delete jobs that finished successfully more than days ago.
+    Their idempotency keys can then be queued again.
+    :return: the number of jobs deleted
+    """
+    cutoff = timezone.now() - timedelta(days=days)
+    return models.Job.objects.filter(status=models.Job.DONE, updated__lt=cutoff).delete()[0]
@@ -0,0 +1,95 @@
+import json
+import os
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from pugorugh import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate synthetic data in a throwaway test database, replay swipe '
+        'sessions against the API and report latency percentiles, queries '
+        'and scan cost per endpoint.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dogs', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--ratings', type=int, default=50, help='dogs rated by each user')
+        parser.add_argument('--sessions', type=int, default=20, help='users to replay sessions for')
+        parser.add_argument('--swipes', type=int, default=50, help='dogs swiped per session')
+        parser.add_argument('--bulk', type=int, default=50, help='entries in the bulk vs single comparison')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='requests in flight in the WSGI vs ASGI comparison, 0 to skip it')
+        parser.add_argument('--connections', type=int, default=200,
+                            help='get-next requests in the new vs pooled connection comparison, 0 to skip it')
+        parser.add_argument('--searches', type=int, default=100, help='dog searches to run')
+        parser.add_argument('--ranking', action='store_true', help='rank undecided dogs, see DOG_RANKING')
+        parser.add_argument('--catalogue', action='store_true',
+                            help='match undecided dogs in memory, see DOG_CATALOGUE_INDEX')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write the results to this JSON file')
+        parser.add_argument('--compare', help='a previous JSON results file to compare against')
+
+    def handle(self, *args, **options):
+        # Measure the API as deployed, without the debug toolbar
+        production = override_settings(
+            DEBUG=False,
+            DOG_RANKING=options['ranking'],
+            DOG_CATALOGUE_INDEX=options['catalogue'],
+            MIDDLEWARE=[name for name in settings.MIDDLEWARE if not name.startswith('debug_toolbar')],
+        )
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        if connection.vendor == 'sqlite' and not connection.settings_dict['TEST']['NAME']:
+            # Use a file rather than memory, as deployed, so connections can be closed and reopened
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), 'pugorugh_benchmark.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        production.enable()
+        try:
+            user_ids = benchmark.generate_data(
+                options['dogs'], options['users'], options['ratings'],
+                seed=options['seed'], stdout=self.stdout)
+            results = benchmark.run_benchmark(
+                user_ids, options['sessions'], options['swipes'],
+                bulk=options['bulk'], concurrency=options['concurrency'],
+                connection_requests=options['connections'], searches=options['searches'],
+                seed=options['seed'])
+        finally:
+            production.disable()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        results.update({
+            'commit': self.commit(),
+            'created': datetime.now(timezone.utc).isoformat(),
+            'vendor': connection.vendor,
+            'sizes': {name: options[name] for name in ('dogs', 'users', 'ratings', 'sessions', 'swipes')},
+        })
+        output = json.dumps(results, indent=2)
+        self.stdout.write(output)
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output)
+
+        if options['compare']:
+            with open(options['compare']) as file:
+                for line in benchmark.compare(json.load(file), results):
+                    self.stdout.write(line)
+
+    def commit(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,23 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from pugorugh import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the validation of synthetic dog rows, as an import would, '
+        'through DogSerializer and through the validators it uses.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--serializer-rows', type=int, default=None,
+                            help='rows to validate through DogSerializer, defaults to all of them')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = benchmark.generate_rows(options['rows'], seed=options['seed'])
+        results = benchmark.run_validation_benchmark(rows, options['serializer_rows'])
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,43 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh import conditional, images
+from pugorugh.models import Dog
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the resized WebP variants of every dog image that has changed '
+        'since they were last built, in parallel over a process pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='processes to build variants in')
+        parser.add_argument('--force', action='store_true', help='rebuild variants that already exist')
+
+    def handle(self, *args, **options):
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            raise CommandError('Pillow is required to build image variants')
+
+        filenames = sorted(set(Dog.objects.values_list('image_filename', flat=True)))
+        build = partial(images.build_variants, force=options['force'])
+
+        if options['workers'] > 1:
+            with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+                results = list(executor.map(build, filenames, chunksize=16))
+        else:
+            results = [build(filename) for filename in filenames]
+
+        images.update_manifest(results)
+        conditional.invalidate_all()
+        missing = [filename for filename, variants in results if variants is None]
+        for filename in missing:
+            self.stderr.write('Image not found: {}'.format(filename))
+        self.stdout.write('Built variants for {} of {} images'.format(
+            len(results) - len(missing), len(results)))
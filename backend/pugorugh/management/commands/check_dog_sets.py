@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from pugorugh import dog_sets
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare each user's stored dog sets with their ratings in UserDog "
+        'and report any that differ, optionally overwriting them.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='a user id to check, may be repeated, defaults to every user')
+        parser.add_argument('--fix', action='store_true', help='overwrite the sets that differ')
+
+    def handle(self, *args, **options):
+        differences = dog_sets.check(options['users'], options['fix'])
+        for user_id, sets in differences.items():
+            for name, (missing, unexpected) in sets.items():
+                self.stdout.write('User {} {}: {} missing, {} unexpected{}'.format(
+                    user_id, name, len(missing), len(unexpected), ', fixed' if options['fix'] else ''))
+        self.stdout.write('{} users with differing sets'.format(len(differences)))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pugorugh import swipe_buffer
+
+
+class Command(BaseCommand):
+    help = 'Write the swipes waiting in the swipe buffer to UserDog, once or every --interval seconds.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=swipe_buffer.FLUSH_BATCH_SIZE,
+                            help='swipes written per upsert batch')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='keep flushing, waiting this many seconds in between')
+
+    def handle(self, *args, **options):
+        if not swipe_buffer.enabled():
+            raise CommandError('SWIPE_BUFFER_PATH is not set')
+
+        while True:
+            flushed = swipe_buffer.flush_all(options['batch_size'])
+            self.stdout.write('Flushed {} swipes'.format(flushed))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from pugorugh import archive
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete the ratings and queue entries of archived dogs in small batches, '
+        'then the dogs themselves, so deletes never hold up swipes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=archive.PURGE_BATCH_SIZE,
+                            help='rows deleted per transaction')
+        parser.add_argument('--pause', type=float, default=0.05, help='seconds to wait between batches')
+
+    def handle(self, *args, **options):
+        dogs, ratings = archive.purge_archived(options['batch_size'], options['pause'])
+        self.stdout.write('Purged {} archived dogs and {} ratings'.format(dogs, ratings))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from pugorugh import search
+from pugorugh.models import Dog
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the dog search index from scratch, e.g. after changing dogs in bulk.'
+
+    def handle(self, *args, **options):
+        search.rebuild_index()
+        self.stdout.write('Indexed {} dogs'.format(Dog.objects.count()))
@@ -0,0 +1,38 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from pugorugh import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs over a pool of worker threads or processes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='jobs to run at once')
+        parser.add_argument('--pool', choices=('thread', 'process'), default='thread',
+                            help='run the workers in threads or in processes')
+        parser.add_argument('--poll', type=float, default=1.0, help='seconds to wait when no jobs are due')
+        parser.add_argument('--once', action='store_true', help='exit once no jobs are due')
+        parser.add_argument('--keep-days', type=int, default=7, help='days to keep finished jobs for')
+
+    def handle(self, *args, **options):
+        deleted = jobs.delete_finished(options['keep_days'])
+        if deleted:
+            self.stdout.write('Deleted {} finished jobs'.format(deleted))
+
+        workers, poll, once = options['workers'], options['poll'], options['once']
+        if workers > 1 and options['pool'] == 'process':
+            # Child processes must not share the parent's connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+                counts = list(executor.map(jobs.pool_worker, [poll] * workers, [once] * workers))
+        elif workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                counts = list(executor.map(jobs.pool_worker, [poll] * workers, [once] * workers))
+        else:
+            counts = [jobs.work(poll, once)]
+
+        self.stdout.write('Ran {} jobs'.format(sum(counts)))
@@ -0,0 +1,162 @@
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from . import models
+from . import preferences
+from .utils import AGE_BITS, GENDER_BITS, SIZE_BITS
+
+#  Number of queue rows inserted per query when rebuilding a queue
+QUEUE_BATCH_SIZE = 1000
+
+
+def matching_dogs(prefs):
+    """
+    Get all dogs that match the user's preferences.
+    :param prefs: a preferences.Prefs instance
+    :return: a Dog queryset
+    """
+    #  Filer by Microchipped (no_preference, yes or no), leaving out archived dogs
+    if prefs.chipped == 'no_preference':
+        chipped_dogs = models.Dog.objects.filter(is_active=True)
+    else:
+        chipped_dogs = models.Dog.objects.filter(is_active=True).filter(
+            microchipped__exact=prefs.chipped)
+
+    # Filter by Gender, Size and Age bucket
+    return chipped_dogs.filter(
+        Q(gender__in=prefs.genders) &
+        Q(size__in=prefs.sizes) &
+        Q(age_bucket__in=prefs.ages)
+    )
+
+
+def decided_user_dogs(user_id, dog_id):
+    """
+    Get the UserDog entries that take a dog out of the undecided queue,
+    i.e. liked, disliked or blacklisted.
+    :param user_id: a user id (or OuterRef)
+    :param dog_id: a dog id (or OuterRef)
+    :return: a UserDog queryset
+    """
+    return models.UserDog.objects.filter(
+        Q(user_id=user_id) &
+        Q(dog_id=dog_id) &
+        (~Q(status='u') | Q(blacklist=True))
+    )
+
+
+def undecided_dogs(prefs):
+    """
+    Get all dogs that match the user's preferences and that the user has
+    not rated, or has explicitly rated as 'undecided' without blacklisting.
+    A single NOT EXISTS keeps this to one anti-join on UserDog.
+    :param prefs: a preferences.Prefs instance
+    :return: a Dog queryset
+    """
+    return matching_dogs(prefs).annotate(
+        decided=Exists(decided_user_dogs(prefs.user_id, OuterRef('pk')))
+    ).filter(decided=False)
+
+
+def rebuild_queue(prefs):
+    """
+    Replace the user's match queue with every undecided dog
+    that matches their current preferences.
+    :param prefs: a preferences.Prefs instance
+    """
+    with transaction.atomic():
+        models.MatchQueue.objects.filter(user_id=prefs.user_id).delete()
+
+        batch = []
+        for dog_id in undecided_dogs(prefs).values_list('id', flat=True).iterator():
+            batch.append(models.MatchQueue(user_id=prefs.user_id, dog_id=dog_id))
+            if len(batch) == QUEUE_BATCH_SIZE:
+                models.MatchQueue.objects.bulk_create(batch)
+                batch = []
+        models.MatchQueue.objects.bulk_create(batch)
+
+        models.UserPref.objects.filter(id=prefs.id).update(match_queue_built=True)
+    preferences.invalidate(prefs.user_id, prefs.version, match_queue_built=True)
+
+
+def queue_dog(dog):
+    """
+    Add a new or changed dog to the queue of every user whose
+    preferences it matches and who has not yet decided on it.
+    Archived dogs are left where they are for archive.purge_dog to remove.
+    :param dog: a Dog instance
+    """
+    if not dog.is_active:
+        return
+
+    chipped = 'y' if dog.microchipped else 'n'
+    user_prefs = models.UserPref.objects.annotate(
+        age_match=F('age_mask').bitand(AGE_BITS.get(dog.age_bucket, 0)),
+        gender_match=F('gender_mask').bitand(GENDER_BITS.get(dog.gender, 0)),
+        size_match=F('size_mask').bitand(SIZE_BITS.get(dog.size, 0)),
+        decided=Exists(decided_user_dogs(OuterRef('user_id'), dog.id)),
+    ).filter(
+        match_queue_built=True,
+        age_match__gt=0,
+        gender_match__gt=0,
+        size_match__gt=0,
+        microchipped__in=('e', chipped),
+        decided=False,
+    )
+
+    with transaction.atomic():
+        models.MatchQueue.objects.filter(dog_id=dog.id).delete()
+
+        batch = []
+        for user_id in user_prefs.values_list('user_id', flat=True).iterator():
+            batch.append(models.MatchQueue(user_id=user_id, dog_id=dog.id))
+            if len(batch) == QUEUE_BATCH_SIZE:
+                models.MatchQueue.objects.bulk_create(batch)
+                batch = []
+        models.MatchQueue.objects.bulk_create(batch)
+
+
+def dequeue_dogs(user_id, dog_ids):
+    """
+    Remove dogs the user has decided on from their queue.
+    :param user_id: a user id
+    :param dog_ids: an iterable of dog ids
+    """
+    models.MatchQueue.objects.filter(user_id=user_id, dog_id__in=dog_ids).delete()
+
+
+def refresh_queue(user_id, dog_ids):
+    """
+    Re-evaluate whether each dog belongs in the user's queue,
+    e.g. after a rating is reset to undecided or removed.
+    :param user_id: a user id
+    :param dog_ids: an iterable of dog ids
+    """
+    prefs = preferences.get_prefs(user_id, create=False)
+    if prefs is None or not prefs.match_queue_built:
+        return  # The queue is built in full when first needed
+
+    dog_ids = set(dog_ids)
+    undecided = set(undecided_dogs(prefs).filter(id__in=dog_ids).values_list('id', flat=True))
+    dequeue_dogs(user_id, dog_ids - undecided)
+    models.MatchQueue.objects.bulk_create(
+        [models.MatchQueue(user_id=user_id, dog_id=dog_id) for dog_id in undecided],
+        ignore_conflicts=True,
+    )
+
+
+def next_in_queue(user_id, pk):
+    """
+    Get the dog that follows pk in the user's queue, looping back around
+    to the first dog. Both candidates are seeks on the (user, dog) index,
+    made in a single query. Archived dogs waiting to be purged are skipped.
+    :param user_id: a user id
+    :param pk: the id of the current dog
+    :return: a Dog instance or None if the queue is empty
+    """
+    entries = models.MatchQueue.objects.filter(
+        user_id=user_id, dog__is_active=True).order_by('dog_id').values('dog_id')
+    return models.Dog.objects.filter(
+        id=Coalesce(Subquery(entries.filter(dog_id__gt=pk)[:1]), Subquery(entries[:1]))
+    ).first()
@@ -0,0 +1,177 @@
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import routers
+
+logger = logging.getLogger('pugorugh.slow_requests')
+
+#  Upper bounds, in seconds, of the request duration histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+#  Statements kept per request for the slow request log
+MAX_LOGGED_QUERIES = 50
+
+
+class ViewMetrics:
+    """
+    Running totals for the requests handled by one view.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.duplicate_queries = 0
+        self.buckets = [0] * len(BUCKETS)
+
+
+class Metrics:
+    """
+    Thread-safe, in-process metrics per view, exposed in the
+    Prometheus text format by views.metrics.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = defaultdict(ViewMetrics)
+
+    def record(self, view, seconds, db_seconds, queries, duplicate_queries):
+        with self.lock:
+            metrics = self.views[view]
+            metrics.requests += 1
+            metrics.seconds += seconds
+            metrics.db_seconds += db_seconds
+            metrics.queries += queries
+            metrics.duplicate_queries += duplicate_queries
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    metrics.buckets[index] += 1
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+    def render(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            lines = [
+                '# HELP pugorugh_request_duration_seconds Wall time of requests per view.',
+                '# TYPE pugorugh_request_duration_seconds histogram',
+            ]
+            for view, metrics in views:
+                for bound, count in zip(BUCKETS, metrics.buckets):
+                    lines.append('pugorugh_request_duration_seconds_bucket{{view="{}",le="{}"}} {}'.format(
+                        view, bound, count))
+                lines.append('pugorugh_request_duration_seconds_bucket{{view="{}",le="+Inf"}} {}'.format(
+                    view, metrics.requests))
+                lines.append('pugorugh_request_duration_seconds_sum{{view="{}"}} {:.6f}'.format(
+                    view, metrics.seconds))
+                lines.append('pugorugh_request_duration_seconds_count{{view="{}"}} {}'.format(
+                    view, metrics.requests))
+
+            for name, help_text, attribute, template in (
+                    ('pugorugh_db_seconds_total', 'Time spent in the database per view.', 'db_seconds', '{:.6f}'),
+                    ('pugorugh_queries_total', 'Queries executed per view.', 'queries', '{}'),
+                    ('pugorugh_duplicate_queries_total',
+                     'Queries repeating an earlier query of the same request per view.', 'duplicate_queries', '{}')):
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} counter'.format(name))
+                for view, metrics in views:
+                    lines.append('{}{{view="{}"}} {}'.format(
+                        name, view, template.format(getattr(metrics, attribute))))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class QueryRecorder:
+    """
+    A database execute_wrapper that times each query of a request.
+    Unlike connection.queries it works with DEBUG = False.
+    """
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.seen = set()
+        self.duplicates = 0
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            key = hash((sql, repr(params)))
+            if key in self.seen:
+                self.duplicates += 1
+            self.seen.add(key)
+            if len(self.statements) < MAX_LOGGED_QUERIES:
+                self.statements.append(sql)
+
+
+class InstrumentationMiddleware:
+    """
+    Record the wall time, database time, query count and duplicate query
+    count of each request against the view that handled it. Timings are
+    returned in a Server-Timing header, totalled for the metrics endpoint,
+    and a sample of slow requests is logged with their SQL.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        seconds = time.perf_counter() - started
+
+        view = getattr(request, 'instrumentation_view', None)
+        if view is None:
+            return response
+
+        metrics.record(view, seconds, recorder.seconds, recorder.count, recorder.duplicates)
+
+        response['Server-Timing'] = 'total;dur={:.1f}, db;dur={:.1f};desc="{} queries, {} duplicates"'.format(
+            seconds * 1000, recorder.seconds * 1000, recorder.count, recorder.duplicates)
+
+        slow_ms = getattr(settings, 'SLOW_REQUEST_MS', 500)
+        sample_rate = getattr(settings, 'SLOW_REQUEST_SAMPLE_RATE', 0.1)
+        if seconds * 1000 >= slow_ms and random.random() < sample_rate:
+            logger.warning(
+                'Slow request %s %s (%s) took %.1fms, %.1fms in %d queries:\n%s',
+                request.method, request.path, view, seconds * 1000, recorder.seconds * 1000,
+                recorder.count, '\n'.join(recorder.statements))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        request.instrumentation_view = view_class.__name__ if view_class else view_func.__name__
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Track each request for routers.ReplicaRouter, and pin users whose
+    request wrote to the database to the primary for a while afterwards.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routers.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            # DRF sets request.user once it has authenticated the request
+            routers.finish_request(getattr(request, 'user', None))
@@ -0,0 +1,38 @@
+# Generated by Django 3.0.5 on 2026-10-18 07:48
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_user_dogs(apps, schema_editor):
+    """
+    Keep only the most recent UserDog row for each (user, dog)
+    so that the unique constraint can be applied.
+    """
+    UserDog = apps.get_model('pugorugh', 'UserDog')
+    duplicates = UserDog.objects.values('user_id', 'dog_id').annotate(
+        rows=Count('id'), latest=Max('id')).filter(rows__gt=1)
+    for duplicate in duplicates:
+        UserDog.objects.filter(
+            user_id=duplicate['user_id'],
+            dog_id=duplicate['dog_id'],
+            id__lt=duplicate['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0006_userdog_blacklist'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_user_dogs, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='userdog',
+            index=models.Index(fields=['user', 'status', 'blacklist', 'dog'], name='userdog_user_status_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='userdog',
+            constraint=models.UniqueConstraint(fields=('user', 'dog'), name='unique_user_dog'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.0.5 on 2026-10-18 07:49
+
+from django.db import migrations, models
+
+from pugorugh.utils import AGE_BITS, GENDER_BITS, SIZE_BITS, get_age_bucket, to_mask
+
+
+def populate_preference_masks(apps, schema_editor):
+    """
+    Derive the age bucket of every Dog and the bitmasks of every
+    UserPref from the existing values.
+    """
+    Dog = apps.get_model('pugorugh', 'Dog')
+    UserPref = apps.get_model('pugorugh', 'UserPref')
+
+    for dog in Dog.objects.only('id', 'age').iterator():
+        Dog.objects.filter(id=dog.id).update(age_bucket=get_age_bucket(dog.age))
+
+    for user_pref in UserPref.objects.all().iterator():
+        UserPref.objects.filter(id=user_pref.id).update(
+            age_mask=to_mask(user_pref.age, AGE_BITS),
+            gender_mask=to_mask(user_pref.gender, GENDER_BITS),
+            size_mask=to_mask(user_pref.size, SIZE_BITS),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0007_userdog_unique_user_dog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='age_bucket',
+            field=models.CharField(blank=True, editable=False, max_length=1),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='age_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='gender_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='userpref',
+            name='size_mask',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_preference_masks, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='dog',
+            index=models.Index(fields=['gender', 'size', 'age_bucket', 'microchipped'], name='dog_preference_idx'),
+        ),
+    ]
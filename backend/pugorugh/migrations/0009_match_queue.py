@@ -0,0 +1,33 @@
+# Generated by Django 3.0.5 on 2026-10-18 07:51
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pugorugh', '0008_preference_masks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userpref',
+            name='match_queue_built',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.CreateModel(
+            name='MatchQueue',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dog', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_queue', to='pugorugh.Dog')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_queue', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='matchqueue',
+            constraint=models.UniqueConstraint(fields=('user', 'dog'), name='unique_match_queue'),
+        ),
+    ]
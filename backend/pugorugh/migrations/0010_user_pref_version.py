@@ -0,0 +1,38 @@
+# Generated by Django 3.0.5 on 2026-10-18 07:57
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def remove_duplicate_user_prefs(apps, schema_editor):
+    """
+    Keep only the most recent UserPref for each user
+    so that the unique constraint can be applied.
+    """
+    UserPref = apps.get_model('pugorugh', 'UserPref')
+    duplicates = UserPref.objects.values('user_id').annotate(
+        rows=Count('id'), latest=Max('id')).filter(rows__gt=1)
+    for duplicate in duplicates:
+        UserPref.objects.filter(
+            user_id=duplicate['user_id'],
+            id__lt=duplicate['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0009_match_queue'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_user_prefs, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='userpref',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddConstraint(
+            model_name='userpref',
+            constraint=models.UniqueConstraint(fields=('user',), name='unique_user_pref'),
+        ),
+    ]
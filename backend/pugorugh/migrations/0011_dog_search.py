@@ -0,0 +1,64 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:12
+
+from itertools import product
+
+from django.db import migrations
+
+#  Copied from pugorugh.search as it was when this migration was written,
+#  so that later changes there do not change what this migration does
+FACETS = (
+    ('gender', ('m', 'f', 'u')),
+    ('size', ('s', 'm', 'l', 'xl')),
+    ('age', ('b', 'y', 'a', 's')),
+    ('microchipped', ('n', 'y')),
+)
+COMBO_NUMBERS = {combo: number for number, combo in enumerate(product(*(values for name, values in FACETS)))}
+COMBO_BITS = 7
+INDEX_TABLE = 'pugorugh_dog_search'
+
+
+def get_combo(dog):
+    return COMBO_NUMBERS.get((dog.gender, dog.size, dog.age_bucket, 'y' if dog.microchipped else 'n'))
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Create the index searched by pugorugh.search for the database's
+    vendor and fill it from the existing dogs.
+    """
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        Dog = apps.get_model('pugorugh', 'Dog')
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE {} USING fts5("
+            "name, breed, tokenize='unicode61 remove_diacritics 2', "
+            "prefix='2 3 4 5 6 7 8', detail=none)".format(INDEX_TABLE))
+        for dog in Dog.objects.iterator():
+            combo = get_combo(dog)
+            if combo is None:
+                continue  # A facet value search does not know, leave the dog out
+            schema_editor.execute(
+                'INSERT INTO {} (rowid, name, breed) VALUES (%s, %s, %s)'.format(INDEX_TABLE),
+                [(dog.id << COMBO_BITS) | combo, dog.name, dog.breed])
+    elif vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE pugorugh_dog ADD FULLTEXT INDEX dog_search_idx (name, breed)')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE {}'.format(INDEX_TABLE))
+    elif vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE pugorugh_dog DROP INDEX dog_search_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0010_user_pref_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 3.0.5 on 2026-10-18 08:38
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+import django.db.models.deletion
+
+
+def count_user_dogs(apps, schema_editor):
+    """
+    Count the liked, disliked and blacklisted dogs of every user.
+    """
+    UserDog = apps.get_model('pugorugh', 'UserDog')
+    UserDogCount = apps.get_model('pugorugh', 'UserDogCount')
+
+    counts = UserDog.objects.values('user_id').annotate(
+        liked=Count('id', filter=Q(status='l', blacklist=False)),
+        disliked=Count('id', filter=Q(status='d', blacklist=False)),
+        blacklisted=Count('id', filter=Q(blacklist=True)),
+    ).order_by()
+    UserDogCount.objects.bulk_create([UserDogCount(**row) for row in counts.iterator()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pugorugh', '0011_dog_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDogCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('liked', models.PositiveIntegerField(default=0)),
+                ('disliked', models.PositiveIntegerField(default=0)),
+                ('blacklisted', models.PositiveIntegerField(default=0)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='user_dog_count', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(count_user_dogs, migrations.RunPython.noop),
+    ]
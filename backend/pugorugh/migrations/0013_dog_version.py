@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 08:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0012_user_dog_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
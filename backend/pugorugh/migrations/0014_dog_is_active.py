@@ -0,0 +1,18 @@
+# Generated by Django 3.0.5 on 2026-10-18 08:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0013_dog_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='is_active',
+            field=models.BooleanField(default=True, editable=False),
+        ),
+    ]
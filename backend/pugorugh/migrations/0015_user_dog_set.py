@@ -0,0 +1,27 @@
+# Generated by Django 3.0.5 on 2026-10-18 09:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('pugorugh', '0014_dog_is_active'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserDogSet',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('liked', models.BinaryField(default=b'')),
+                ('disliked', models.BinaryField(default=b'')),
+                ('undecided', models.BinaryField(default=b'')),
+                ('blacklisted', models.BinaryField(default=b'')),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='user_dog_set', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
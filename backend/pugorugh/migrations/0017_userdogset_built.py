@@ -0,0 +1,27 @@
+# Generated by Django 3.0.5 on 2026-10-18 12:00
+
+from django.db import migrations, models
+
+
+def mark_built(apps, schema_editor):
+    """
+    Sets stored before the field was added were built when they were created.
+    """
+    UserDogSet = apps.get_model('pugorugh', 'UserDogSet')
+    UserDogSet.objects.update(built=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0016_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userdogset',
+            name='built',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_built, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.0.5 on 2026-10-18 15:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def set_import_keys(apps, schema_editor):
+    """
+    Imports used to match dogs on their image filename, so key the dogs
+    that are the only one with their image on it. Dogs sharing an image
+    are left without a key rather than guessing which one an import meant.
+    """
+    Dog = apps.get_model('pugorugh', 'Dog')
+    unique_images = Dog.objects.values('image_filename').annotate(dogs=Count('id')).filter(dogs=1)
+    Dog.objects.filter(image_filename__in=unique_images.values('image_filename')).update(
+        import_key=models.F('image_filename'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pugorugh', '0017_userdogset_built'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dog',
+            name='import_key',
+            field=models.CharField(blank=True, editable=False, max_length=255, null=True, unique=True),
+        ),
+        migrations.RunPython(set_import_keys, migrations.RunPython.noop),
+    ]
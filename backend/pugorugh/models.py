@@ -1,5 +1,8 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import connections, models, transaction
+
+from .signals import user_dogs_upserted
+from .utils import AGE_BITS, GENDER_BITS, SIZE_BITS, get_age_bucket, to_mask
 
 
 class Dog(models.Model):
@@ -13,10 +16,126 @@ class Dog(models.Model):
     gender = models.CharField(max_length=1)
     size = models.CharField(max_length=2)
     microchipped = models.BooleanField(default=False)
+    age_bucket = models.CharField(max_length=1, blank=True, editable=False)  # Derived from age, see utils.AGE_RANGES
+    version = models.PositiveIntegerField(default=0, editable=False)  # Incremented on every save, see conditional.py
+    is_active = models.BooleanField(default=True, editable=False)  # False once archived, see archive.py
+    #  The import's identifier for the dog, see scripts/data_import.py
+    import_key = models.CharField(max_length=255, null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            #  Covers the preference match in views.Dogs
+            models.Index(fields=['gender', 'size', 'age_bucket', 'microchipped'], name='dog_preference_idx'),
+        ]
 
     def __str__(self):
         return '{}, {} ({})'.format(self.id, self.name, self.gender)
 
+    def save(self, *args, **kwargs):
+        self.version += 1
+        self.age_bucket = get_age_bucket(self.age)
+        super().save(*args, **kwargs)
+
+
+class UserDogQuerySet(models.QuerySet):
+    """
+    QuerySet for UserDog with an upsert keyed on (user, dog).
+    """
+    def previous(self, rows):
+        """
+        Read the ratings the given rows will overwrite, locking them where
+        the database can, so the receivers can count what changed.
+        :return: {(user_id, dog_id): (id, status, blacklist)}
+        """
+        keys = {(row['user_id'], row['dog_id']) for row in rows}
+        existing = self.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in keys}, dog_id__in={dog_id for _, dog_id in keys},
+        ).values_list('user_id', 'dog_id', 'id', 'status', 'blacklist')
+        return {(user_id, dog_id): values
+                for user_id, dog_id, *values in existing if (user_id, dog_id) in keys}
+
+    def upsert(self, rows, update_fields):
+        """
+        Insert the given rows, or update update_fields on rows that
+        already exist for the same (user, dog), in a single statement.
+        :param rows: a list of dicts of UserDog column values,
+                     each including user_id and dog_id
+        :param update_fields: the fields to overwrite on conflict
+        :return: an unsaved UserDog for each row, with the values it has once
+                 written. The id of a row inserted by a multi-row statement
+                 is not known and left as None.
+        """
+        if not rows:
+            return []
+        self._for_write = True
+        connection = connections[self.db]
+        vendor = connection.vendor
+        opts = self.model._meta
+        columns = [opts.get_field(name).column for name in rows[0]]
+        updates = [opts.get_field(name).column for name in update_fields]
+        qn = connection.ops.quote_name
+
+        if vendor in ('sqlite', 'postgresql'):
+            conflict = 'ON CONFLICT (user_id, dog_id) DO UPDATE SET ' + ', '.join(
+                '{0} = excluded.{0}'.format(qn(column)) for column in updates)
+        elif vendor == 'mysql':
+            conflict = 'ON DUPLICATE KEY UPDATE ' + ', '.join(
+                '{0} = VALUES({0})'.format(qn(column)) for column in updates)
+        else:
+            # No native upsert, so fall back to update-then-insert
+            with transaction.atomic(using=self.db):
+                previous = self.previous(rows)
+                ids = {}
+                for row in rows:
+                    values = {name: row[name] for name in update_fields}
+                    if not self.filter(user_id=row['user_id'], dog_id=row['dog_id']).update(**values):
+                        ids[row['user_id'], row['dog_id']] = self.create(**row).id
+            return self.upserted(rows, update_fields, previous, ids)
+
+        placeholders = '({})'.format(', '.join(['%s'] * len(columns)))
+        sql = 'INSERT INTO {} ({}) VALUES {} {}'.format(
+            qn(opts.db_table),
+            ', '.join(qn(column) for column in columns),
+            ', '.join([placeholders] * len(rows)),
+            conflict,
+        )
+        params = []
+        for row in rows:
+            for name in rows[0]:
+                field = opts.get_field(name)
+                params.append(field.get_db_prep_save(row[name], connection))
+        with transaction.atomic(using=self.db, savepoint=False):
+            previous = self.previous(rows)
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                ids = {}
+                if len(rows) == 1 and (rows[0]['user_id'], rows[0]['dog_id']) not in previous:
+                    #  The row was inserted rather than updated
+                    ids[rows[0]['user_id'], rows[0]['dog_id']] = cursor.lastrowid
+        return self.upserted(rows, update_fields, previous, ids)
+
+    def upserted(self, rows, update_fields, previous, ids):
+        """
+        Send user_dogs_upserted and build the upserted UserDogs.
+        :param previous: the existing entries, as returned by previous
+        :param ids: {(user_id, dog_id): id} of the inserted entries that are known
+        """
+        user_dogs_upserted.send(
+            sender=self.model, rows=rows, update_fields=update_fields,
+            previous={key: tuple(values[1:]) for key, values in previous.items()})
+
+        user_dogs = []
+        for row in rows:
+            key = (row['user_id'], row['dog_id'])
+            values = dict(row)
+            if key in previous:
+                id, values['status'], values['blacklist'] = previous[key]
+                values.update((name, row[name]) for name in update_fields)
+            else:
+                id = ids.get(key)
+            user_dogs.append(self.model(id=id, **values))
+        return user_dogs
+
 
 class UserDog(models.Model):
     """
@@ -27,6 +146,25 @@ class UserDog(models.Model):
     status = models.CharField(max_length=1)
     blacklist = models.BooleanField(default=False)
 
+    objects = UserDogQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dog'], name='unique_user_dog'),
+        ]
+        indexes = [
+            #  Covers the liked / disliked / undecided lookups in views.Dogs
+            models.Index(fields=['user', 'status', 'blacklist', 'dog'], name='userdog_user_status_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        #  The rating as stored, so receivers.count_user_dog can count what a save changes
+        if 'status' in instance.__dict__ and 'blacklist' in instance.__dict__:
+            instance._stored_rating = (instance.status, instance.blacklist)
+        return instance
+
 
 class UserPref(models.Model):
     """
@@ -38,7 +176,87 @@ class UserPref(models.Model):
     size = models.CharField(max_length=255)
     microchipped = models.CharField(default='e', max_length=1)  # Set default to 'e' for either
 
+    #  Bitmask copies of age, gender and size, see utils.to_mask
+    age_mask = models.PositiveSmallIntegerField(default=0, editable=False)
+    gender_mask = models.PositiveSmallIntegerField(default=0, editable=False)
+    size_mask = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    match_queue_built = models.BooleanField(default=False, editable=False)  # See MatchQueue
+    version = models.PositiveIntegerField(default=0, editable=False)  # Incremented on every save
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user'], name='unique_user_pref'),
+        ]
 
+    def save(self, *args, **kwargs):
+        self.version += 1
+        self.age_mask = to_mask(self.age, AGE_BITS)
+        self.gender_mask = to_mask(self.gender, GENDER_BITS)
+        self.size_mask = to_mask(self.size, SIZE_BITS)
+        super().save(*args, **kwargs)
 
 
+class MatchQueue(models.Model):
+    """
+    This model holds the undecided dogs that match a user's preferences.
+    It is rebuilt when the preferences change and kept up to date by the
+    receivers in receivers.py as dogs are added and rated.
+    """
+    user = models.ForeignKey(User, related_name='match_queue', on_delete=models.CASCADE)
+    dog = models.ForeignKey(Dog, related_name='match_queue', on_delete=models.CASCADE)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'dog'], name='unique_match_queue'),
+        ]
+
+
+class UserDogCount(models.Model):
+    """
+    This model holds the number of dogs in each of a user's collections,
+    kept up to date by the receivers in receivers.py as dogs are rated.
+    """
+    user = models.OneToOneField(User, related_name='user_dog_count', on_delete=models.CASCADE)
+    liked = models.PositiveIntegerField(default=0)
+    disliked = models.PositiveIntegerField(default=0)
+    blacklisted = models.PositiveIntegerField(default=0)
+
+
+class UserDogSet(models.Model):
+    """
+    This model holds the ids of the dogs in each of a user's collections
+    as packed, sorted arrays, see dog_sets.py. Kept up to date by the
+    receivers in receivers.py as dogs are rated, when USER_DOG_SETS is on.
+    """
+    user = models.OneToOneField(User, related_name='user_dog_set', on_delete=models.CASCADE)
+    liked = models.BinaryField(default=b'')
+    disliked = models.BinaryField(default=b'')
+    undecided = models.BinaryField(default=b'')
+    blacklisted = models.BinaryField(default=b'')
+    built = models.BooleanField(default=False)  # False until dog_sets.get_sets has built the sets
+
+
+class Job(models.Model):
+    """
+    This model is a background job, queued by jobs.enqueue and run by the
+    run_jobs worker, see jobs.py.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+    name = models.CharField(max_length=100)  # A task registered with jobs.task
+    kwargs = models.TextField(default='{}')  # JSON
+    key = models.CharField(max_length=255, unique=True, null=True, blank=True)  # Idempotency key
+    status = models.CharField(max_length=7, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_after = models.DateTimeField()  # When a pending job is due, or a running job's lease runs out
+    error = models.TextField(blank=True)  # The traceback of the last failed attempt
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            #  Covers the due job lookup in jobs.claim
+            models.Index(fields=['status', 'run_after'], name='job_due_idx'),
+        ]
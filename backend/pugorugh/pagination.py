@@ -0,0 +1,24 @@
+from collections import OrderedDict
+
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class CollectionPagination(CursorPagination):
+    """
+    Keyset pagination over the dog ids of a user's ratings, so each page
+    is a seek on the (user, status, blacklist, dog) index however deep it
+    is. The view supplies the total from the user's counts.
+    """
+    ordering = 'dog_id'
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def get_paginated_response(self, data, count=None):
+        return Response(OrderedDict([
+            ('count', count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
@@ -0,0 +1,145 @@
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import models
+from .utils import AGE_BITS, GENDER_BITS, SIZE_BITS, from_mask, get_microchipped
+
+#  A read-only copy of a UserPref. The raw fields can be serialized by
+#  UserPrefSerializer, the parsed fields are ready to filter dogs with.
+Prefs = namedtuple('Prefs', [
+    'id',
+    'user_id',
+    'version',
+    'age',
+    'gender',
+    'size',
+    'microchipped',
+    'ages',  # e.g. ['b', 'y']
+    'genders',  # e.g. ['m', 'f']
+    'sizes',  # e.g. ['s', 'xl']
+    'chipped',  # True, False or 'no_preference'
+    'match_queue_built',
+])
+
+#  Cached in place of a user's Prefs when they are invalidated, so Prefs read
+#  before the change can't be cached over it, see get_prefs
+Invalidated = namedtuple('Invalidated', ['freshness'])
+
+
+def parse(user_pref):
+    """
+    Convert a UserPref into Prefs.
+    :param user_pref: a UserPref instance
+    :return: a Prefs instance
+    """
+    return Prefs(
+        id=user_pref.id,
+        user_id=user_pref.user_id,
+        version=user_pref.version,
+        age=user_pref.age,
+        gender=user_pref.gender,
+        size=user_pref.size,
+        microchipped=user_pref.microchipped,
+        ages=from_mask(user_pref.age_mask, AGE_BITS),
+        genders=from_mask(user_pref.gender_mask, GENDER_BITS),
+        sizes=from_mask(user_pref.size_mask, SIZE_BITS),
+        chipped=get_microchipped(user_pref.microchipped),
+        match_queue_built=user_pref.match_queue_built,
+    )
+
+
+def freshness(version, match_queue_built):
+    """
+    A user's Prefs order by version, then by whether their match queue is
+    built, which changes without the version changing.
+    """
+    return version, match_queue_built
+
+
+def get_cache():
+    return caches[getattr(settings, 'USER_PREF_CACHE_ALIAS', 'default')]
+
+
+def cache_key(user_id):
+    """
+    Cached Prefs are keyed on a generation number as well as the user,
+    so that invalidate_all can drop every entry at once.
+    """
+    cache = get_cache()
+    generation = cache.get('pugorugh:prefs:generation')
+    if generation is None:
+        generation = 1
+        cache.add('pugorugh:prefs:generation', generation, None)
+    return 'pugorugh:prefs:{}:{}'.format(generation, user_id)
+
+
+def get_or_create_user_pref(user_id):
+    """
+    Get the UserPref for a user, creating an empty one on first use.
+    The unique user constraint makes this safe under concurrent first
+    requests, as get_or_create falls back to a get if the create loses.
+    :param user_id: a user id
+    :return: a UserPref instance
+    """
+    user_pref, created = models.UserPref.objects.get_or_create(user_id=user_id)
+    return user_pref
+
+
+def get_prefs(user_id, create=True):
+    """
+    Get a user's Prefs from the cache, or from the DB on a miss. Prefs
+    read from the DB are only cached if they were not invalidated since,
+    added on an empty key or replacing an Invalidated marker they are at
+    least as fresh as. Without a compare-and-set, Prefs read just before
+    another save can still replace that save's marker.
+    :param user_id: a user id
+    :param create: whether to create empty preferences if the user has none
+    :return: a Prefs instance, or None if create is False and there are none
+    """
+    cache = get_cache()
+    key = cache_key(user_id)
+    cached = cache.get(key)
+    if isinstance(cached, Prefs):
+        return cached
+
+    # Only fall back to get_or_create when needed, as it reads from the primary
+    user_pref = models.UserPref.objects.filter(user_id=user_id).first()
+    if user_pref is None:
+        if not create:
+            return None
+        user_pref = get_or_create_user_pref(user_id)
+
+    prefs = parse(user_pref)
+    timeout = getattr(settings, 'USER_PREF_CACHE_TTL', None)
+    if cached is None:
+        cache.add(key, prefs, timeout)
+    elif freshness(prefs.version, prefs.match_queue_built) >= cached.freshness:
+        cache.set(key, prefs, timeout)
+    return prefs
+
+
+def invalidate(user_id, version=0, match_queue_built=False):
+    """
+    Drop a user's cached Prefs, e.g. after their preferences are saved,
+    leaving an Invalidated marker with the version saved.
+    :param user_id: a user id
+    :param version: the UserPref version saved, 0 for none
+    :param match_queue_built: whether the saved match queue is built
+    """
+    get_cache().set(cache_key(user_id), Invalidated(freshness(version, match_queue_built)),
+                    getattr(settings, 'USER_PREF_CACHE_TTL', None))
+
+
+def invalidate_all():
+    """
+    Drop every user's cached Prefs, e.g. after a bulk update.
+    """
+    cache = get_cache()
+    try:
+        cache.incr('pugorugh:prefs:generation')
+    except ValueError:
+        # The generation was evicted, so start a new one past any old entries
+        cache.set('pugorugh:prefs:generation', int(time.time()), None)
@@ -0,0 +1,383 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import models
+
+#  The fields each dog is described by, in the order of a combination
+COMBO_FIELDS = ('breed', 'size', 'age_bucket', 'gender', 'microchipped')
+
+#  The fields whose affinities are learned from a user's ratings
+FEATURES = ('breed', 'size', 'age_bucket', 'gender')
+FEATURE_INDEXES = [COMBO_FIELDS.index(feature) for feature in FEATURES]
+
+#  Pseudo-ratings that shrink the affinities learned from only a few ratings towards 0
+PRIOR = 2
+
+#  Changes logged before a process reloads every dog rather than catching up
+MAX_CHANGES = 1000
+LOAD_BATCH_SIZE = 5000
+
+CHANGES_KEY = 'pugorugh:ranking:changes'
+
+
+def get_cache():
+    return caches[getattr(settings, 'DOG_RANKING_CACHE_ALIAS', 'default')]
+
+
+def enabled():
+    return getattr(settings, 'DOG_RANKING', False)
+
+
+class DogFeatures:
+    """
+    A compact copy of every active dog's features, for ranking without
+    reading Dog. Dogs are described by the number of their combination of
+    COMBO_FIELDS values, so a score is worked out once per combination
+    rather than once per dog: two parallel arrays hold each dog's id (in
+    ascending order) and combination, and members holds the sorted ids of
+    the dogs with each combination.
+    """
+    NONE = 0xFFFFFFFF  # The combination of a dog that has been removed
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.ids = array('q')
+        self.codes = array('I')
+        self.combos = []  # code: combination
+        self.combo_codes = {}  # combination: code
+        self.members = {}  # code: array of dog ids
+        self.change = None  # The last change in the shared log that has been applied
+
+    def code_of(self, dog_id):
+        """
+        :return: the combination of a dog, or None if it is not known
+        """
+        index = bisect_left(self.ids, dog_id)
+        if index < len(self.ids) and self.ids[index] == dog_id and self.codes[index] != self.NONE:
+            return self.codes[index]
+        return None
+
+    def code_for(self, combo):
+        code = self.combo_codes.get(combo)
+        if code is None:
+            code = self.combo_codes[combo] = len(self.combos)
+            self.combos.append(combo)
+            self.members[code] = array('q')
+        return code
+
+    def add(self, dog_id, combo):
+        """
+        Add a dog, or move it to a new combination.
+        """
+        code = self.code_for(combo)
+        index = bisect_left(self.ids, dog_id)
+        if index < len(self.ids) and self.ids[index] == dog_id:
+            if self.codes[index] == code:
+                return
+            self.discard(dog_id)
+            self.codes[index] = code
+        else:
+            self.ids.insert(index, dog_id)
+            self.codes.insert(index, code)
+        members = self.members[code]
+        members.insert(bisect_left(members, dog_id), dog_id)
+
+    def discard(self, dog_id):
+        """
+        Remove a dog. Its id stays in ids, so removal doesn't shift the arrays.
+        """
+        index = bisect_left(self.ids, dog_id)
+        if index == len(self.ids) or self.ids[index] != dog_id or self.codes[index] == self.NONE:
+            return
+        members = self.members[self.codes[index]]
+        del members[bisect_left(members, dog_id)]
+        self.codes[index] = self.NONE
+
+    def update(self, rows, dog_ids=()):
+        """
+        Apply the current state of some dogs.
+        :param rows: (id, *COMBO_FIELDS) of each active dog
+        :param dog_ids: the ids of dogs to remove if they are not in rows
+        """
+        seen = set()
+        for row in rows:
+            seen.add(row[0])
+            self.add(row[0], tuple(row[1:]))
+        for dog_id in set(dog_ids) - seen:
+            self.discard(dog_id)
+
+    def load(self):
+        """
+        Reload every active dog.
+        """
+        self.reset()
+        dogs = models.Dog.objects.filter(is_active=True).order_by('id').values_list('id', *COMBO_FIELDS)
+        for row in dogs.iterator(chunk_size=LOAD_BATCH_SIZE):
+            code = self.code_for(tuple(row[1:]))
+            # Rows arrive in id order, so they can be appended
+            self.ids.append(row[0])
+            self.codes.append(code)
+            self.members[code].append(row[0])
+
+    def refresh(self):
+        """
+        Catch up with the dogs changed by any process since the last
+        refresh, from the log kept by log_changes, or reload every dog if
+        the log has moved on too far or been lost.
+        """
+        cache = get_cache()
+        cache.add(CHANGES_KEY, 0, None)
+        latest = cache.get(CHANGES_KEY, 0)
+        if latest == self.change:
+            return
+
+        changed = None
+        if self.change is not None and self.change < latest <= self.change + MAX_CHANGES:
+            keys = ['{}:{}'.format(CHANGES_KEY, number) for number in range(self.change + 1, latest + 1)]
+            logged = cache.get_many(keys)
+            if len(logged) == len(keys):
+                changed = set(logged.values())
+
+        if changed is None:
+            self.load()
+        else:
+            rows = models.Dog.objects.filter(id__in=changed, is_active=True).values_list('id', *COMBO_FIELDS)
+            self.update(rows, changed)
+        self.change = latest
+
+
+features = DogFeatures()
+
+
+def invalidate():
+    """
+    Make every process reload every dog, e.g. after dogs are saved in bulk.
+    """
+    cache = get_cache()
+    cache.add(CHANGES_KEY, 0, None)
+    cache.incr(CHANGES_KEY, MAX_CHANGES + 1)
+
+
+def get_features():
+    """
+    Get this process's DogFeatures, brought up to date.
+    """
+    with features.lock:
+        features.refresh()
+    return features
+
+
+def log_changes(dog_ids):
+    """
+    Log changed dogs for every process to pick up on its next refresh,
+    once the transaction that changed them has been committed.
+    """
+    def log():
+        cache = get_cache()
+        for dog_id in dog_ids:
+            try:
+                number = cache.incr(CHANGES_KEY)
+            except ValueError:
+                # The log was lost, so every process reloads
+                cache.add(CHANGES_KEY, 0, None)
+                number = cache.incr(CHANGES_KEY)
+            cache.set('{}:{}'.format(CHANGES_KEY, number), dog_id, None)
+    transaction.on_commit(log)
+
+
+def learn(user_id, dog_features):
+    """
+    Learn a user's affinity for each breed, size, age and gender from
+    their ratings.
+    :param user_id: a user id
+    :param dog_features: a DogFeatures instance
+    :return: ({feature: {value: affinity}}, {id of every dog the user has decided on})
+    """
+    rows = list(models.UserDog.objects.filter(user_id=user_id).values_list('dog_id', 'status', 'blacklist'))
+    return learn_from(rows, dog_features)
+
+
+def learn_from(rows, dog_features):
+    """
+    Learn affinities from ratings. Likes count for a value and dislikes
+    and blacklists against it, so affinities range from -1 to 1.
+    :param rows: (dog_id, status, blacklist) of each rating
+    :param dog_features: a DogFeatures instance
+    :return: ({feature: {value: affinity}}, {id of every dog decided on})
+    """
+    tallies = [{} for feature in FEATURES]
+    decided = set()
+    with dog_features.lock:
+        for dog_id, status, blacklist in rows:
+            if status == 'u' and not blacklist:
+                continue
+            decided.add(dog_id)
+            code = dog_features.code_of(dog_id)
+            if code is None:
+                continue
+            combo = dog_features.combos[code]
+            liked = status == 'l' and not blacklist
+            for tally, index in zip(tallies, FEATURE_INDEXES):
+                counts = tally.setdefault(combo[index], [0, 0])
+                counts[0 if liked else 1] += 1
+
+    affinities = {
+        feature: {value: (likes - dislikes) / (likes + dislikes + PRIOR) for value, (likes, dislikes) in tally.items()}
+        for feature, tally in zip(FEATURES, tallies)
+    }
+    return affinities, decided
+
+
+def score(combo, affinities):
+    return round(sum(
+        affinities[feature].get(combo[index], 0) for feature, index in zip(FEATURES, FEATURE_INDEXES)), 9)
+
+
+def ranked_ids(prefs, pk, dog_features, affinities, decided):
+    """
+    Yield the ids of the undecided dogs that match the user's preferences,
+    best scoring first and in id order within a score, starting after pk
+    and looping back around to the first dog. Each dog is yielded once.
+    :param prefs: a preferences.Prefs instance
+    :param pk: the id of the current dog
+    :param dog_features: a DogFeatures instance
+    :param affinities: the first result of learn
+    :param decided: the second result of learn
+    """
+    # Score each combination that matches the preferences and has dogs
+    sizes, ages, genders = set(prefs.sizes), set(prefs.ages), set(prefs.genders)
+    chipped = {True: (True,), False: (False,)}.get(prefs.chipped, (True, False))
+    levels = {}
+    for code, combo in enumerate(dog_features.combos):
+        breed, size, age_bucket, gender, microchipped = combo
+        if dog_features.members[code] and size in sizes and age_bucket in ages and \
+                gender in genders and microchipped in chipped:
+            levels.setdefault(score(combo, affinities), []).append(code)
+    scores = sorted(levels, reverse=True)
+
+    def members_after(ids, cursor):
+        for index in range(bisect_right(ids, cursor), len(ids)):
+            yield ids[index]
+
+    def after(start, cursor):
+        for level in scores[start:]:
+            members = [dog_features.members[code] for code in levels[level]]
+            for dog_id in heapq.merge(*(members_after(ids, cursor) for ids in members)):
+                if dog_id not in decided:
+                    yield dog_id
+            cursor = -1
+
+    # Carry on from the current dog's place in the ranking
+    start, cursor = 0, -1
+    code = dog_features.code_of(int(pk))
+    if code is not None:
+        current = score(dog_features.combos[code], affinities)
+        start = next((index for index, level in enumerate(scores) if level <= current), len(scores))
+        if start < len(scores) and scores[start] == current:
+            cursor = int(pk)
+
+    seen = set()
+    for dog_id in chain(after(start, cursor), after(0, -1)):
+        if dog_id in seen:
+            return
+        seen.add(dog_id)
+        yield dog_id
+
+
+def next_dogs(prefs, pk, count=1):
+    """
+    Get the next dogs for a user, ranked by their affinity for each dog's
+    features rather than by id.
+    :param prefs: a preferences.Prefs instance
+    :param pk: the id of the current dog
+    :param count: the most dogs to return
+    :return: a list of Dog instances
+    """
+    dog_features = get_features()
+    affinities, decided = learn(prefs.user_id, dog_features)
+    with dog_features.lock:
+        dog_ids = list(islice(ranked_ids(prefs, pk, dog_features, affinities, decided), count))
+    dogs = models.Dog.objects.filter(is_active=True).in_bulk(dog_ids)
+    return [dogs[dog_id] for dog_id in dog_ids if dog_id in dogs]
+
+
+def auc(scored):
+    """
+    The chance that a liked dog is scored above a disliked one, counting
+    ties as half, or None without both.
+    :param scored: (score, liked) pairs
+    """
+    liked = [value for value, like in scored if like]
+    disliked = [value for value, like in scored if not like]
+    if not liked or not disliked:
+        return None
+    wins = sum((a > b) + (a == b) / 2 for a in liked for b in disliked)
+    return wins / (len(liked) * len(disliked))
+
+
+def evaluate(min_ratings=10, holdout=0.2, top=5, dog_features=None):
+    """
+    Replay each user's recorded swipes in the order they were made: learn
+    from the earlier ones, then score the dogs in the later ones, and
+    compare against the id order served without ranking.
+    :param min_ratings: skip users with fewer likes and dislikes than this
+    :param holdout: the share of each user's latest swipes to score
+    :param top: the number of best scored held out dogs to count likes in
+    :return: a dict of results, ready to be saved as JSON
+    """
+    if dog_features is None:
+        dog_features = DogFeatures()
+        dog_features.load()
+
+    swipes = {}
+    rows = models.UserDog.objects.exclude(status='u', blacklist=False).order_by('id').values_list(
+        'user_id', 'dog_id', 'status', 'blacklist')
+    for user_id, dog_id, status, blacklist in rows.iterator():
+        if dog_features.code_of(dog_id) is not None:
+            swipes.setdefault(user_id, []).append((dog_id, status, blacklist))
+
+    ranked_aucs, id_aucs = [], []
+    likes = top_likes = held_out = top_count = 0
+    for user_id, user_swipes in swipes.items():
+        if len(user_swipes) < min_ratings:
+            continue
+        split = len(user_swipes) - max(1, int(len(user_swipes) * holdout))
+        affinities = learn_from(user_swipes[:split], dog_features)[0]
+
+        scored = []
+        for dog_id, status, blacklist in user_swipes[split:]:
+            combo = dog_features.combos[dog_features.code_of(dog_id)]
+            scored.append((score(combo, affinities), -dog_id, status == 'l' and not blacklist))
+
+        ranked = auc([(value, liked) for value, dog_id, liked in scored])
+        by_id = auc([(dog_id, liked) for value, dog_id, liked in scored])
+        if ranked is not None:
+            ranked_aucs.append(ranked)
+            id_aucs.append(by_id)
+        best = sorted(scored, reverse=True)[:top]
+        likes += sum(liked for value, dog_id, liked in scored)
+        held_out += len(scored)
+        top_likes += sum(liked for value, dog_id, liked in best)
+        top_count += len(best)
+
+    def mean(values):
+        return round(sum(values) / len(values), 4) if values else None
+
+    return {
+        'users': len(ranked_aucs),
+        'held_out_swipes': held_out,
+        'ranked_auc': mean(ranked_aucs),
+        'id_order_auc': mean(id_aucs),
+        'like_rate': round(likes / held_out, 4) if held_out else None,
+        'top_{}_like_rate'.format(top): round(top_likes / top_count, 4) if top_count else None,
+    }
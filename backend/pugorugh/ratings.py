@@ -0,0 +1,118 @@
+from django.db.models import Case, Count, F, Q, When
+
+from . import models
+
+#  The UserDog values of the dogs in each of a user's collections
+COLLECTIONS = {
+    'liked': {'status': 'l', 'blacklist': False},
+    'disliked': {'status': 'd', 'blacklist': False},
+    'blacklisted': {'blacklist': True},
+}
+
+
+def collection(user_id, name):
+    """
+    Get the dogs in one of a user's collections.
+    A single join on the (user, status, blacklist, dog) index.
+    :param user_id: a user id
+    :param name: liked, disliked or blacklisted
+    :return: a Dog queryset
+    """
+    values = {'dog_user__' + field: value for field, value in COLLECTIONS[name].items()}
+    return models.Dog.objects.filter(is_active=True, dog_user__user_id=user_id, **values)
+
+
+def rated(user_id, name):
+    """
+    Get the ratings of the dogs in one of a user's collections, with their
+    dogs. Ordered by dog_id they are read straight off the index, without
+    sorting the whole collection.
+    :param user_id: a user id
+    :param name: liked, disliked or blacklisted
+    :return: a UserDog queryset
+    """
+    return models.UserDog.objects.filter(
+        user_id=user_id, dog__is_active=True, **COLLECTIONS[name]).select_related('dog')
+
+
+def refresh_counts(user_id):
+    """
+    Recount the dogs in each of a user's collections.
+    :param user_id: a user id
+    """
+    counts = models.UserDog.objects.filter(user_id=user_id).aggregate(**{
+        name: Count('id', filter=Q(**values)) for name, values in COLLECTIONS.items()
+    })
+    # Users without ratings need no row, which also keeps the receivers from
+    # recreating it while a user is deleted
+    updated = models.UserDogCount.objects.filter(user_id=user_id).update(**counts)
+    if not updated and any(counts.values()):
+        models.UserDogCount.objects.update_or_create(user_id=user_id, defaults=counts)
+
+
+def collections_of(rating):
+    """
+    :param rating: (status, blacklist), or None for no rating
+    :return: the names of the collections a rating puts a dog in
+    """
+    if rating is None:
+        return []
+    row = {'status': rating[0], 'blacklist': rating[1]}
+    return [name for name, values in COLLECTIONS.items()
+            if all(row[field] == value for field, value in values.items())]
+
+
+def change_counts(changes):
+    """
+    Move changed ratings between their users' counts without recounting,
+    one F() update for each set of users whose counts change alike.
+    Users without a count yet are recounted instead.
+    :param changes: (user_id, old, new) of each changed UserDog, where old
+                    and new are (status, blacklist), or None when there was
+                    or is no UserDog
+    """
+    deltas = {}
+    for user_id, old, new in changes:
+        delta = deltas.setdefault(user_id, dict.fromkeys(COLLECTIONS, 0))
+        for name in collections_of(old):
+            delta[name] -= 1
+        for name in collections_of(new):
+            delta[name] += 1
+
+    groups = {}
+    for user_id, delta in deltas.items():
+        key = tuple((name, count) for name, count in delta.items() if count)
+        if key:
+            groups.setdefault(key, []).append(user_id)
+
+    for key, user_ids in groups.items():
+        # Counts that drifted low stop at 0, rather than going negative
+        updated = models.UserDogCount.objects.filter(user_id__in=user_ids).update(**{
+            name: F(name) + count if count > 0 else
+            Case(When(**{name + '__gte': -count}, then=F(name) + count), default=0)
+            for name, count in key
+        })
+        if updated < len(user_ids) and any(count > 0 for _, count in key):
+            counted = set(models.UserDogCount.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+            for user_id in set(user_ids) - counted:
+                refresh_counts(user_id)
+
+
+def remove_from_counts(rows):
+    """
+    Take deleted ratings off their users' counts without recounting,
+    e.g. when an archived dog is purged.
+    :param rows: (user_id, status, blacklist) of each deleted UserDog
+    """
+    change_counts((user_id, (status, blacklist), None) for user_id, status, blacklist in rows)
+
+
+def get_count(user_id, name):
+    """
+    Get the number of dogs in one of a user's collections.
+    :param user_id: a user id
+    :param name: liked, disliked or blacklisted
+    :return: an integer
+    """
+    count = models.UserDogCount.objects.filter(user_id=user_id).values_list(name, flat=True).first()
+    return count or 0
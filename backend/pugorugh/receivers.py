@@ -0,0 +1,244 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from rest_framework.authtoken.models import Token
+
+from . import catalogue
+from . import conditional
+from . import dog_sets
+from . import jobs
+from . import matching
+from . import preferences
+from . import ranking
+from . import ratings
+from . import search
+from .authentication import invalidate_token
+from .models import Dog, UserDog, UserPref
+from .signals import receivers_skipped, user_dogs_upserted
+
+
+@receiver(post_save, sender=UserPref)
+def rebuild_match_queue(sender, instance, **kwargs):
+    """
+    Rebuild the user's match queue whenever their preferences are saved,
+    in a background job if BACKGROUND_JOBS is on. Until the job runs, the
+    first get-next to need the queue rebuilds it. This also drops their
+    cached Prefs.
+    """
+    if jobs.enabled():
+        UserPref.objects.filter(id=instance.id).update(match_queue_built=False)
+        preferences.invalidate(instance.user_id, instance.version)
+        jobs.enqueue(
+            'rebuild_queue', key='rebuild-queue:{}:{}'.format(instance.user_id, instance.version),
+            user_id=instance.user_id, version=instance.version,
+        )
+    else:
+        matching.rebuild_queue(preferences.parse(instance))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_prefs(sender, instance, created=False, **kwargs):
+    """
+    Drop any cached Prefs left under the id of a new or deleted user.
+    """
+    if created or kwargs['signal'] is post_delete:
+        preferences.invalidate(instance.id)
+
+
+@receiver(post_save, sender=Dog)
+def queue_saved_dog(sender, instance, **kwargs):
+    """
+    Add a new or edited dog to the queues it now matches, in a background
+    job if BACKGROUND_JOBS is on.
+    Archived dogs are skipped by the queues until they are purged.
+    """
+    if jobs.enabled():
+        if instance.is_active:
+            jobs.enqueue('queue_dog', key='queue-dog:{}:{}'.format(instance.id, instance.version),
+                         dog_id=instance.id)
+    else:
+        matching.queue_dog(instance)
+
+
+@receiver(post_save, sender=Dog)
+def index_saved_dog(sender, instance, **kwargs):
+    """
+    Add a new or edited dog to the search index, or remove an archived one.
+    """
+    if instance.is_active:
+        search.index_dogs([instance])
+    else:
+        search.remove_dogs([instance.id])
+
+
+@receiver(post_delete, sender=Dog)
+def remove_deleted_dog(sender, instance, **kwargs):
+    """
+    Remove a deleted dog from the search index.
+    """
+    search.remove_dogs([instance.id])
+
+
+@receiver(post_save, sender=UserDog)
+@receiver(post_delete, sender=UserDog)
+def refresh_user_dog(sender, instance, **kwargs):
+    """
+    Re-evaluate a dog in the user's queue after it is rated or un-rated.
+    """
+    if receivers_skipped():
+        return
+    matching.refresh_queue(instance.user_id, [instance.dog_id])
+
+
+@receiver(post_save, sender=UserDog)
+@receiver(post_delete, sender=UserDog)
+def count_user_dog(sender, instance, created=False, **kwargs):
+    """
+    Move the dog between the user's counts after it is rated or un-rated,
+    from the rating it was loaded with. A rating saved without having been
+    loaded recounts the user's collections.
+    """
+    if receivers_skipped():
+        return
+    rating = (instance.status, instance.blacklist)
+    if kwargs['signal'] is post_delete:
+        ratings.change_counts([(instance.user_id, getattr(instance, '_stored_rating', rating), None)])
+    elif created or hasattr(instance, '_stored_rating'):
+        ratings.change_counts([(instance.user_id, None if created else instance._stored_rating, rating)])
+    else:
+        ratings.refresh_counts(instance.user_id)
+    instance._stored_rating = rating
+
+
+@receiver(user_dogs_upserted, sender=UserDog)
+def refresh_upserted_user_dogs(sender, rows, update_fields, **kwargs):
+    """
+    Update the user's queue after an upsert. Rows set to liked, disliked or
+    blacklisted are decided whatever their other values so can be removed
+    directly, anything else is re-evaluated.
+    """
+    decided, changed = {}, {}
+    for row in rows:
+        if ('status' in update_fields and row['status'] != 'u') or \
+                ('blacklist' in update_fields and row['blacklist']):
+            decided.setdefault(row['user_id'], []).append(row['dog_id'])
+        else:
+            changed.setdefault(row['user_id'], []).append(row['dog_id'])
+
+    for user_id, dog_ids in decided.items():
+        matching.dequeue_dogs(user_id, dog_ids)
+    for user_id, dog_ids in changed.items():
+        matching.refresh_queue(user_id, dog_ids)
+
+
+@receiver(user_dogs_upserted, sender=UserDog)
+def count_upserted_user_dogs(sender, rows, update_fields, previous, **kwargs):
+    """
+    Move the dogs in an upsert between their users' counts, from the
+    ratings they had before it.
+    """
+    changes = []
+    for row in rows:
+        old = previous.get((row['user_id'], row['dog_id']))
+        if old is None:
+            new = (row['status'], row['blacklist'])
+        else:
+            new = tuple(row[field] if field in update_fields else value
+                        for field, value in zip(('status', 'blacklist'), old))
+        changes.append((row['user_id'], old, new))
+    ratings.change_counts(changes)
+
+
+@receiver(post_save, sender=UserDog)
+@receiver(post_delete, sender=UserDog)
+def refresh_user_dog_sets(sender, instance, **kwargs):
+    """
+    Move a dog between the user's sets after it is rated or un-rated.
+    """
+    if receivers_skipped():
+        return
+    if dog_sets.enabled():
+        dog_sets.refresh(instance.user_id, [instance.dog_id])
+
+
+@receiver(user_dogs_upserted, sender=UserDog)
+def refresh_upserted_dog_sets(sender, rows, **kwargs):
+    """
+    Move the dogs in an upsert between their users' sets.
+    """
+    if dog_sets.enabled():
+        dog_ids = {}
+        for row in rows:
+            dog_ids.setdefault(row['user_id'], []).append(row['dog_id'])
+        for user_id, ids in dog_ids.items():
+            dog_sets.refresh(user_id, ids)
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def invalidate_next_dogs(sender, instance, **kwargs):
+    """
+    Drop every cached get-next response after a dog is added, edited or deleted.
+    """
+    conditional.invalidate_all()
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def log_changed_dog(sender, instance, **kwargs):
+    """
+    Log an added, edited, archived or deleted dog for every process's
+    copy of the dog features to pick up.
+    """
+    if ranking.enabled():
+        ranking.log_changes([instance.id])
+
+
+@receiver(post_save, sender=Dog)
+@receiver(post_delete, sender=Dog)
+def update_catalogue(sender, instance, **kwargs):
+    """
+    Patch the catalogue index with an added, edited, archived or deleted dog.
+    """
+    if catalogue.enabled():
+        catalogue.update_dog(instance, deleted=kwargs['signal'] is post_delete)
+
+
+@receiver(post_save, sender=UserDog)
+@receiver(post_delete, sender=UserDog)
+def invalidate_user_next_dogs(sender, instance, **kwargs):
+    """
+    Drop the user's cached get-next responses after a dog is rated or un-rated.
+    """
+    if receivers_skipped():
+        return
+    conditional.invalidate_user(instance.user_id)
+
+
+@receiver(user_dogs_upserted, sender=UserDog)
+def invalidate_upserted_next_dogs(sender, rows, **kwargs):
+    """
+    Drop the cached get-next responses of each user with rows in an upsert.
+    """
+    for user_id in {row['user_id'] for row in rows}:
+        conditional.invalidate_user(user_id)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_deleted_token(sender, instance, **kwargs):
+    """
+    Stop accepting a token from the authentication cache once it is deleted.
+    """
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_inactive_user_tokens(sender, instance, **kwargs):
+    """
+    Stop accepting a deactivated user's tokens from the authentication cache.
+    """
+    if not instance.is_active:
+        for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+            invalidate_token(key)
@@ -0,0 +1,117 @@
+import random
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+
+#  The routing state of the request being handled by this thread
+state = threading.local()
+
+#  Cache backends that keep entries in the process, so cannot share pins between workers
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def get_cache():
+    return caches[getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')]
+
+
+def check_pin_cache():
+    """
+    Refuse to start with replicas but a pin cache that each worker keeps
+    to itself, where a user's write on one worker would not stop their
+    reads on another from going to a replica that has not caught up.
+    :raise ImproperlyConfigured: if the REPLICA_PIN_CACHE_ALIAS cache is not shared
+    """
+    if not getattr(settings, 'REPLICA_DATABASES', []):
+        return
+    alias = getattr(settings, 'REPLICA_PIN_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None or backend in PROCESS_CACHES:
+        raise ImproperlyConfigured(
+            'REPLICA_DATABASES needs REPLICA_PIN_CACHE_ALIAS to name a cache shared between '
+            'workers, e.g. memcached, but {!r} is {}'.format(alias, backend or 'not in CACHES'))
+
+
+def pin_key(user_id):
+    return 'pugorugh:replica-pin:{}'.format(user_id)
+
+
+def start_request():
+    """
+    Send the reads of a new request to the primary until the view opts in
+    to replicas with read_from_replica.
+    """
+    state.active = True
+    state.replica = None
+    state.wrote = False
+
+
+def finish_request(user):
+    """
+    Pin the user to the primary if the request wrote to the database,
+    so their next reads see the write even if the replicas lag behind.
+    :param user: the request's user
+    """
+    if state.wrote and user is not None and user.is_authenticated:
+        pin(user.id)
+    state.active = False
+    state.replica = None
+    state.wrote = False
+
+
+def pin(user_id):
+    get_cache().set(pin_key(user_id), True, getattr(settings, 'REPLICA_PIN_SECONDS', 5))
+
+
+def is_pinned(user_id):
+    return bool(get_cache().get(pin_key(user_id)))
+
+
+def read_from_replica(user):
+    """
+    Send the rest of the request's reads to a replica, unless the user
+    wrote recently or there are no replicas.
+    :param user: the request's user
+    """
+    replicas = getattr(settings, 'REPLICA_DATABASES', [])
+    if not getattr(state, 'active', False) or not replicas or state.wrote:
+        return
+    if user.is_authenticated and is_pinned(user.id):
+        return
+    state.replica = random.choice(replicas)
+
+
+class ReplicaRouter:
+    """
+    Route the reads of read-only views to a replica, chosen per request,
+    and everything else to the primary. A request that writes reads from
+    the primary from then on, and so does its user for REPLICA_PIN_SECONDS.
+    Replicas are never migrated; they copy the primary's schema.
+    """
+    def db_for_read(self, model, **hints):
+        if getattr(state, 'active', False) and not state.wrote:
+            return state.replica
+        return None
+
+    def db_for_write(self, model, **hints):
+        if getattr(state, 'active', False):
+            state.wrote = True
+            state.replica = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same data as the primary
+        databases = {DEFAULT_DB_ALIAS, *getattr(settings, 'REPLICA_DATABASES', [])}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in getattr(settings, 'REPLICA_DATABASES', []):
+            return False
+        return None
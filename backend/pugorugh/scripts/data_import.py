@@ -1,40 +1,286 @@
+import argparse
+import csv
 import json
 from os import environ
 from os import path
+import re
 import sys
+import time
 
 import django
+from django.apps import apps
 
 PROJ_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
 
+# Run as a script, rather than imported by the app, e.g. by tasks.import_dogs
+if not apps.ready:
+    sys.path.append(PROJ_DIR)
+    environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.deploy_settings")
+    django.setup()
 
-def load_data():
-    filepath = path.join(PROJ_DIR, 'pugorugh', 'static', 'dog_details.json')
-    
-    with open(filepath, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+# These have to be imported after django.setup()
+from django.db import IntegrityError, transaction  # noqa: E402
+from pugorugh import catalogue, conditional, preferences, ranking, search  # noqa: E402
+from pugorugh.models import Dog, UserPref  # noqa: E402
+from pugorugh.utils import get_age_bucket  # noqa: E402
+from pugorugh.validators import validate_dog  # noqa: E402
 
-        serializer = DogSerializer(data=data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-        else:
-            print(serializer.errors)
+DEFAULT_FILE = path.join(PROJ_DIR, 'pugorugh', 'static', 'dog_details.json')
+DEFAULT_CHUNK_SIZE = 1000
+READ_SIZE = 64 * 1024
 
-    print('load_data done.')
+#  The longest JSON array item read before giving up on finding its end
+MAX_ROW_SIZE = 1024 * 1024
 
+#  The characters that start or end strings and items, outside and inside a string
+JSON_DELIMITERS = re.compile(r'["{}\[\],]')
+JSON_STRING_DELIMITERS = re.compile(r'["\\]')
+
+#  Dogs are matched on their unique Dog.import_key so that re-running an import
+#  updates them. Rows without an import_key are keyed on their image filename.
+KEY_FIELD = 'import_key'
+KEY_MAX_LENGTH = 255
+FIELDS = ('name', 'image_filename', 'breed', 'age', 'gender', 'size', 'microchipped')
 
-if __name__ == '__main__':
-    sys.path.append(PROJ_DIR)
-    environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.deploy_settings")
-    django.setup()
 
-    # Assuming your serializer is named DogSerializer
-    # has to be imported after django.setup()
+class InvalidRow:
+    """
+    A row a reader could not decode, written to the error file rather
+    than ending the import.
+    """
+    def __init__(self, data, error):
+        self.data = data
+        self.error = error
+
+
+def decode(text):
+    """
+    :return: the decoded JSON text, or an InvalidRow
+    """
     try:
+        return json.loads(text)
+    except ValueError as error:
+        return InvalidRow(text.strip(), str(error))
+
+
+def read_json(file):
+    """
+    Yield each item of a JSON array without loading the whole file.
+    Items are split on the commas outside strings, objects and arrays,
+    reading on until an item is complete, then decoded one at a time.
+    :param file: a text file containing a JSON array of objects
+    """
+    buffer = ''
+    position = 0
+    item = None  # Where the current item starts in buffer, once the array has started
+    depth = 0
+    in_string = False
+
+    while True:
+        delimiters = JSON_STRING_DELIMITERS if in_string else JSON_DELIMITERS
+        match = delimiters.search(buffer, position)
+        if match is None:
+            more = file.read(READ_SIZE)
+            if not more:
+                break
+            if item is None:
+                if buffer.strip():
+                    raise ValueError('Expected a JSON array')
+                buffer, position = more, 0
+            else:
+                if len(buffer) - item > MAX_ROW_SIZE:
+                    raise ValueError('Found no end to the item starting {!r}'.format(buffer[item:item + 100]))
+                buffer, position, item = buffer[item:] + more, position - item, 0
+            continue
+
+        character, position = match.group(), match.end()
+        if in_string:
+            if character == '\\':
+                position += 1  # Skip the escaped character, reading on for it if need be
+            else:
+                in_string = False
+        elif item is None:
+            if character != '[' or buffer[:match.start()].strip():
+                raise ValueError('Expected a JSON array')
+            item = position
+        elif character == '"':
+            in_string = True
+        elif character in '{[':
+            depth += 1
+        elif depth:
+            if character in '}]':
+                depth -= 1
+        elif character == ',' or character == ']':
+            text = buffer[item:match.start()]
+            if text.strip():
+                yield decode(text)
+            item = position
+            if character == ']':
+                return
+
+    # The array was never closed, so its last item is most likely cut short
+    if item is not None and buffer[item:].strip():
+        yield decode(buffer[item:])
+
+
+def read_ndjson(file):
+    """
+    Yield each object of a newline-delimited JSON file.
+    """
+    for line in file:
+        if line.strip():
+            yield decode(line)
+
+
+def read_csv(file):
+    """
+    Yield each row of a CSV file with a header row.
+    """
+    yield from csv.DictReader(file)
+
+
+READERS = {
+    'json': read_json,
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
 
-        from pugorugh.serializers import DogSerializer
-    except ImportError:
-        raise ImportError('serializers.py must contain a properly '
-            'implemented DogSerializer class for this import to work.')
+def get_key(row):
+    """
+    :param row: a decoded row
+    :return: (the row's import key, or None if it is invalid, {field: errors})
+    """
+    key = row.get(KEY_FIELD)
+    if key is None or key == '':
+        key = row.get('image_filename')
+        if not isinstance(key, str) or not key:
+            return None, {}  # validate_dog reports the missing image_filename
+    if isinstance(key, bool) or not isinstance(key, (str, int)):
+        return None, {KEY_FIELD: ['Expected a string or an integer']}
+    key = str(key)
+    if len(key) > KEY_MAX_LENGTH:
+        return None, {KEY_FIELD: ['Ensure this field has no more than {} characters.'.format(KEY_MAX_LENGTH)]}
+    return key, {}
+
+
+def save_chunk(chunk):
+    """
+    Create or update a chunk of validated dogs in a single transaction.
+    If a concurrent import creates one of the dogs first, the chunk's
+    insert fails on the unique import_key and the chunk is retried once,
+    updating that dog instead.
+    :param chunk: a list of validated_data dicts, each with its import_key
+    :return: the number of dogs created and updated
+    """
+    # Later rows for the same dog win
+    rows = {row[KEY_FIELD]: row for row in chunk}
+
+    try:
+        return write_chunk(rows)
+    except IntegrityError:
+        return write_chunk(rows)
+
+
+def write_chunk(rows):
+    with transaction.atomic():
+        existing = {dog.import_key: dog for dog in Dog.objects.filter(import_key__in=list(rows))}
+
+        new_dogs = []
+        changed_dogs = []
+        for key, row in rows.items():
+            dog = existing.get(key, Dog())
+            for field, value in row.items():
+                setattr(dog, field, value)
+            # bulk_create and bulk_update skip save()
+            dog.age_bucket = get_age_bucket(dog.age)
+            dog.version += 1
+            if dog.pk is None:
+                new_dogs.append(dog)
+            else:
+                changed_dogs.append(dog)
+
+        Dog.objects.bulk_create(new_dogs)
+        Dog.objects.bulk_update(changed_dogs, FIELDS + ('age_bucket', 'version'))
+
+    return len(new_dogs), len(changed_dogs)
+
+
+def load_data(filepath=DEFAULT_FILE, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE, error_path=None):
+    """
+    Stream dogs from a JSON, NDJSON or CSV file into the DB in chunks.
+    Invalid rows are skipped and written to error_path as NDJSON.
+    """
+    file_format = file_format or path.splitext(filepath)[1].lstrip('.').lower()
+    reader = READERS[file_format]
+    error_path = error_path or filepath + '.errors.ndjson'
+
+    created = updated = errors = 0
+    started = time.time()
+    chunk = []
+
+    def flush():
+        nonlocal created, updated
+        new, changed = save_chunk(chunk)
+        created += new
+        updated += changed
+        chunk.clear()
+        elapsed = time.time() - started
+        print('{} rows: {} created, {} updated, {} errors ({:.0f} rows/s)'.format(
+            number, created, updated, errors, number / elapsed if elapsed else 0))
+
+    number = 0
+    error_file = None
+    with open(filepath, 'r', encoding='utf-8', newline='') as file:
+        for number, row in enumerate(reader(file), start=1):
+            # Validated as DogSerializer would, without a serializer per row
+            if isinstance(row, InvalidRow):
+                data, row_errors, row = None, {'non_field_errors': [row.error]}, row.data
+            elif not isinstance(row, dict):
+                data, row_errors = None, {'non_field_errors': ['Expected an object']}
+            else:
+                data, row_errors = validate_dog(row)
+                key, key_errors = get_key(row)
+                row_errors.update(key_errors)
+                if not row_errors:
+                    data[KEY_FIELD] = key
+            if not row_errors:
+                chunk.append(data)
+            else:
+                errors += 1
+                if error_file is None:
+                    error_file = open(error_path, 'w', encoding='utf-8')
+                error_file.write(json.dumps({'row': number, 'data': row, 'errors': row_errors}) + '\n')
+
+            if len(chunk) == chunk_size:
+                flush()
+        flush()
+
+    if error_file is not None:
+        error_file.close()
+
+    if created or updated:
+        # Dogs saved in bulk skip the receivers, so rebuild queues on next use,
+        # rebuild the search index now, drop any cached get-next responses
+        # and reload the dog features and catalogue index held in memory
+        UserPref.objects.update(match_queue_built=False)
+        preferences.invalidate_all()
+        search.rebuild_index()
+        conditional.invalidate_all()
+        ranking.invalidate()
+        catalogue.invalidate()
+
+    if errors:
+        print('{} invalid rows written to {}'.format(errors, error_path))
+    print('load_data done.')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import dogs from a JSON, NDJSON or CSV file.')
+    parser.add_argument('file', nargs='?', default=DEFAULT_FILE)
+    parser.add_argument('--format', choices=sorted(READERS), help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--errors', help='where to write invalid rows, defaults to <file>.errors.ndjson')
+    args = parser.parse_args()
 
-    load_data()
\ No newline at end of file
+    load_data(args.file, args.format, args.chunk_size, args.errors)
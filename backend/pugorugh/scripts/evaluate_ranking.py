@@ -0,0 +1,34 @@
+import argparse
+import json
+from os import environ
+from os import path
+import sys
+
+import django
+
+PROJ_DIR = path.dirname(path.dirname(path.dirname(path.abspath(__file__))))
+
+
+if __name__ == '__main__':
+    sys.path.append(PROJ_DIR)
+    environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.deploy_settings")
+    django.setup()
+
+    parser = argparse.ArgumentParser(
+        description="Replay recorded swipes to compare the ranking of undecided dogs with id order.")
+    parser.add_argument('--min-ratings', type=int, default=10,
+                        help='skip users with fewer likes and dislikes than this')
+    parser.add_argument('--holdout', type=float, default=0.2, help="the share of each user's latest swipes to score")
+    parser.add_argument('--top', type=int, default=5, help='count the likes among this many best scored dogs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    # Has to be imported after django.setup()
+    from pugorugh import ranking
+
+    results = ranking.evaluate(args.min_ratings, args.holdout, args.top)
+    output = json.dumps(results, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
@@ -0,0 +1,326 @@
+import hashlib
+import logging
+import re
+import time
+from functools import lru_cache
+from itertools import product
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, router, transaction
+from django.db.models import Count, Q
+from django.utils.module_loading import import_string
+
+from . import models
+from .utils import AGE_RANGES
+
+logger = logging.getLogger('pugorugh.search')
+
+#  The values of each facet, in the order used to number their combinations
+FACETS = (
+    ('gender', ('m', 'f', 'u')),
+    ('size', ('s', 'm', 'l', 'xl')),
+    ('age', tuple(AGE_RANGES)),
+    ('microchipped', ('n', 'y')),
+)
+COMBOS = list(product(*(values for name, values in FACETS)))
+COMBO_NUMBERS = {combo: number for number, combo in enumerate(COMBOS)}
+
+#  Bits of an index rowid that hold the facet combination, the rest hold the dog id
+COMBO_BITS = 7
+COMBO_MASK = (1 << COMBO_BITS) - 1
+
+#  Words of a query that are searched for, the last one as a prefix
+MAX_TOKENS = 8
+
+INDEX_TABLE = 'pugorugh_dog_search'
+INDEX_BATCH_SIZE = 1000
+
+
+def get_combo(dog):
+    """
+    Number the combination of facet values of a dog.
+    :param dog: a Dog instance (or any object with the same fields)
+    :return: an integer below 2 ** COMBO_BITS, or None if a facet value
+        is not one of FACETS, e.g. an age out of range saved without the serializer
+    """
+    return COMBO_NUMBERS.get((dog.gender, dog.size, dog.age_bucket, 'y' if dog.microchipped else 'n'))
+
+
+def get_tokens(query):
+    """
+    Split a query into the lower case words to search for.
+    """
+    return re.findall(r'\w+', query.lower())[:MAX_TOKENS]
+
+
+def allowed_combos(filters):
+    """
+    Get the numbers of every facet combination that passes the filters.
+    :param filters: {facet name: a collection of allowed values}
+    """
+    names = [name for name, values in FACETS]
+    return [
+        number for number, combo in enumerate(COMBOS)
+        if all(combo[names.index(name)] in values for name, values in filters.items())
+    ]
+
+
+def count_facets(counts, filters):
+    """
+    Count the matches per facet value. Each facet is counted with the
+    filters on every other facet applied, so the counts show how many
+    dogs selecting each value would add or leave.
+    :param counts: {combo number: matches}
+    :param filters: {facet name: a collection of allowed values}
+    :return: (matches passing every filter, {facet name: {value: count}})
+    """
+    names = [name for name, values in FACETS]
+    facets = {name: dict.fromkeys(values, 0) for name, values in FACETS}
+    total = 0
+    for number, count in counts.items():
+        combo = COMBOS[number]
+        failed = [name for name, values in filters.items() if combo[names.index(name)] not in values]
+        if not failed:
+            total += count
+            for name, value in zip(names, combo):
+                facets[name][value] += count
+        elif len(failed) == 1:
+            facets[failed[0]][combo[names.index(failed[0])]] += count
+    return total, facets
+
+
+class SQLiteSearchBackend:
+    """
+    Search an SQLite FTS5 table, kept in sync with Dog by the receivers in
+    receivers.py. Each row's rowid is the dog id shifted left by COMBO_BITS
+    plus its facet combination, so facets are counted and filtered on
+    rowids alone without reading any stored columns. Dogs with a facet
+    value outside FACETS have no combination, so are left out.
+    """
+    def index(self, dogs, replace=True):
+        connection = connections[router.db_for_write(models.Dog)]
+        with connection.cursor() as cursor:
+            for start in range(0, len(dogs), INDEX_BATCH_SIZE):
+                batch = dogs[start:start + INDEX_BATCH_SIZE]
+                if replace:
+                    self.delete(cursor, [dog.id for dog in batch])
+                rows = []
+                for dog in batch:
+                    combo = get_combo(dog)
+                    if combo is None:
+                        logger.warning('Dog %s left out of the search index, its facet values are unknown', dog.id)
+                    else:
+                        rows.append(((dog.id << COMBO_BITS) | combo, dog.name, dog.breed))
+                cursor.executemany(
+                    'INSERT INTO {} (rowid, name, breed) VALUES (%s, %s, %s)'.format(INDEX_TABLE), rows)
+
+    def remove(self, dog_ids):
+        connection = connections[router.db_for_write(models.Dog)]
+        with connection.cursor() as cursor:
+            self.delete(cursor, dog_ids)
+
+    def delete(self, cursor, dog_ids):
+        for dog_id in dog_ids:
+            cursor.execute(
+                'DELETE FROM {} WHERE rowid BETWEEN %s AND %s'.format(INDEX_TABLE),
+                [dog_id << COMBO_BITS, (dog_id << COMBO_BITS) | COMBO_MASK])
+
+    def rebuild(self):
+        # A single transaction lets FTS5 merge the index once, rather than on every batch
+        db = router.db_for_write(models.Dog)
+        with transaction.atomic(using=db):
+            with connections[db].cursor() as cursor:
+                cursor.execute('DELETE FROM {}'.format(INDEX_TABLE))
+            dogs = models.Dog.objects.using(db).filter(is_active=True).values_list(
+                'id', 'name', 'breed', 'gender', 'size', 'age_bucket', 'microchipped', named=True)
+            batch = []
+            for dog in dogs.iterator(chunk_size=INDEX_BATCH_SIZE):
+                batch.append(dog)
+                if len(batch) == INDEX_BATCH_SIZE:
+                    self.index(batch, replace=False)
+                    batch = []
+            self.index(batch, replace=False)
+
+    def expression(self, tokens):
+        # Each token is a word, so quoting it is enough to escape it
+        return ' '.join('"{}"'.format(token) for token in tokens) + '*'
+
+    def match_counts(self, tokens):
+        connection = connections[router.db_for_read(models.Dog)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid & {mask}, COUNT(*) FROM {table} WHERE {table} MATCH %s '
+                'GROUP BY rowid & {mask}'.format(table=INDEX_TABLE, mask=COMBO_MASK),
+                [self.expression(tokens)])
+            return dict(cursor.fetchall())
+
+    def match_ids(self, tokens, filters, limit, offset):
+        sql = 'SELECT rowid >> {bits} FROM {table} WHERE {table} MATCH %s'.format(
+            table=INDEX_TABLE, bits=COMBO_BITS)
+        params = [self.expression(tokens)]
+        if filters:
+            combos = allowed_combos(filters)
+            sql += ' AND rowid & {} IN ({})'.format(COMBO_MASK, ', '.join(['%s'] * len(combos)))
+            params += combos
+        sql += ' ORDER BY rowid LIMIT %s OFFSET %s'
+        connection = connections[router.db_for_read(models.Dog)]
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params + [limit, offset])
+            return [row[0] for row in cursor.fetchall()]
+
+
+class DatabaseSearchBackend:
+    """
+    Search Dog directly, for databases without an index set up for it.
+    Matching with LIKE scans the table, so use it for small catalogues only.
+    Dogs with a facet value outside FACETS are left out, as they are from the index.
+    """
+    def index(self, dogs, replace=True):
+        pass
+
+    def remove(self, dog_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def searchable(self):
+        values = dict(FACETS)
+        return models.Dog.objects.filter(
+            is_active=True, gender__in=values['gender'], size__in=values['size'], age_bucket__in=values['age'])
+
+    def matching(self, tokens):
+        dogs = self.searchable()
+        for token in tokens:
+            dogs = dogs.filter(Q(name__icontains=token) | Q(breed__icontains=token))
+        return dogs
+
+    def match_counts(self, tokens):
+        counts = {}
+        rows = self.matching(tokens).values_list(
+            'gender', 'size', 'age_bucket', 'microchipped').annotate(Count('id')).order_by()
+        for gender, size, age_bucket, microchipped, count in rows:
+            number = COMBO_NUMBERS[(gender, size, age_bucket, 'y' if microchipped else 'n')]
+            counts[number] = counts.get(number, 0) + count
+        return counts
+
+    def match_ids(self, tokens, filters, limit, offset):
+        dogs = self.matching(tokens)
+        fields = {'gender': 'gender', 'size': 'size', 'age': 'age_bucket'}
+        for name, values in filters.items():
+            if name == 'microchipped':
+                dogs = dogs.filter(microchipped__in=[value == 'y' for value in values])
+            else:
+                dogs = dogs.filter(**{fields[name] + '__in': values})
+        return list(dogs.order_by('id').values_list('id', flat=True)[offset:offset + limit])
+
+
+class MySQLSearchBackend(DatabaseSearchBackend):
+    """
+    Search the InnoDB FULLTEXT index on Dog's name and breed,
+    which MySQL keeps in sync itself.
+    """
+    def matching(self, tokens):
+        return self.searchable().extra(
+            where=['MATCH (name, breed) AGAINST (%s IN BOOLEAN MODE)'],
+            params=[' '.join('+{}'.format(token) for token in tokens) + '*'],
+        )
+
+
+@lru_cache(maxsize=None)
+def load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    """
+    Get the search backend named by DOG_SEARCH_BACKEND, or the one for the
+    database's vendor if it is not set.
+    """
+    path = getattr(settings, 'DOG_SEARCH_BACKEND', None)
+    if path is None:
+        vendor = connections[router.db_for_read(models.Dog)].vendor
+        path = {
+            'sqlite': 'pugorugh.search.SQLiteSearchBackend',
+            'mysql': 'pugorugh.search.MySQLSearchBackend',
+        }.get(vendor, 'pugorugh.search.DatabaseSearchBackend')
+    return load_backend(path)
+
+
+def get_cache():
+    return caches[getattr(settings, 'DOG_SEARCH_CACHE_ALIAS', 'default')]
+
+
+def cache_key(tokens):
+    """
+    Cached counts are keyed on a generation number that changes whenever
+    the index does, so no stale counts are served after it changes.
+    """
+    cache = get_cache()
+    generation = cache.get('pugorugh:search:generation')
+    if generation is None:
+        generation = int(time.time())
+        cache.add('pugorugh:search:generation', generation, None)
+    digest = hashlib.md5(' '.join(tokens).encode()).hexdigest()
+    return 'pugorugh:search:{}:{}'.format(generation, digest)
+
+
+def invalidate():
+    cache = get_cache()
+    try:
+        cache.incr('pugorugh:search:generation')
+    except ValueError:
+        cache.set('pugorugh:search:generation', int(time.time()), None)
+
+
+def index_dogs(dogs):
+    """
+    Add new or changed dogs to the search index.
+    Archived dogs should be removed with remove_dogs instead.
+    """
+    get_backend().index(list(dogs))
+    invalidate()
+
+
+def remove_dogs(dog_ids):
+    """
+    Remove deleted dogs from the search index.
+    """
+    get_backend().remove(list(dog_ids))
+    invalidate()
+
+
+def rebuild_index():
+    """
+    Rebuild the search index from scratch, e.g. after a bulk import.
+    """
+    get_backend().rebuild()
+    invalidate()
+
+
+def search(query, filters, limit, offset):
+    """
+    Search dogs by name and breed. Counting the matches per facet value
+    reads every match, so the counts are cached per query.
+    :param query: the words to search for
+    :param filters: {facet name: a collection of allowed values}
+    :param limit: the most dog ids to return
+    :param offset: the number of matching dogs to skip
+    :return: (the number of matches, [dog id], {facet name: {value: count}})
+    """
+    tokens = get_tokens(query)
+    if not tokens:
+        total, facets = count_facets({}, filters)
+        return total, [], facets
+
+    backend = get_backend()
+    key = cache_key(tokens)
+    counts = get_cache().get(key)
+    if counts is None:
+        counts = backend.match_counts(tokens)
+        get_cache().set(key, counts, getattr(settings, 'DOG_SEARCH_CACHE_TTL', None))
+
+    total, facets = count_facets(counts, filters)
+    dog_ids = backend.match_ids(tokens, filters, limit, offset) if offset < total else []
+    return total, dog_ids, facets
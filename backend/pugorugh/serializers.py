@@ -1,11 +1,10 @@
-import re
 from django.contrib.auth import get_user_model
 
 from rest_framework import serializers
 
+from . import images
 from . import models
-
-from .utils import clean_input
+from . import validators
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -30,6 +29,8 @@ class UserSerializer(serializers.ModelSerializer):
 
 # noinspection PyMethodMayBeStatic
 class DogSerializer(serializers.ModelSerializer):
+    srcset = serializers.SerializerMethodField()
+
     class Meta:
         fields = (
             'id',
@@ -39,41 +40,30 @@ class DogSerializer(serializers.ModelSerializer):
             'age',
             'gender',
             'size',
-            'microchipped'
+            'microchipped',
+            'srcset',
         )
         model = models.Dog
 
+    #  The resized WebP variants of the image, if they have been built
+    def get_srcset(self, obj):
+        return images.get_srcset(obj.image_filename)
+
     # Ensure the the image_filename ends with .jpg, .jpeg or .png
     def validate_image_filename(self, value):
-        if re.match(r'^.+\.(jpg|jpeg|png)$', value):
-            return value
-        raise serializers.ValidationError(
-            "image_filename must end with '.jpg', '.jpeg' or '.png'"
-        )
+        return validators.validate_image_filename(value)
 
     #  Ensure that Age is an integer between 1 and 200
     def validate_age(self, value):
-        if value in range(1, 201):
-            return value
-        raise serializers.ValidationError(
-            "Age must be an integer between 1 and 200"
-        )
+        return validators.validate_age(value)
 
     #  Ensure that Gender is either m, f or u
     def validate_gender(self, value):
-        if re.match(r'^[mfu]$', value):
-            return value
-        raise serializers.ValidationError(
-            "Gender must be 'm' for male, 'f' for female or 'u' for unknown"
-        )
+        return validators.DOG_GENDERS.check(value)
 
     #  Ensure that size is either s, m, l or xl
     def validate_size(self, value):
-        if re.match(r'^(s|m|l|xl)$', value):
-            return value
-        raise serializers.ValidationError(
-            "Size must be 's' for small, 'm' for medium, 'l' for large or 'xl' for extra large"
-        )
+        return validators.DOG_SIZES.check(value)
 
 
 # noinspection PyMethodMayBeStatic
@@ -90,41 +80,22 @@ class UserPrefSerializer(serializers.ModelSerializer):
 
     #  Ensure that size is a comma-separated string containing only s, m, l or xl
     def validate_size(self, value):
-        value, value_list = clean_input(value)
-        for element in value_list:
-            if not re.match(r'^(s|m|l|xl)$', element):
-                raise serializers.ValidationError(
-                    "Size must a comma-separated string containing only s, m, l or xl"
-                )
+        value, value_list = validators.PREF_SIZES.check_list(value)
         return value
 
-    #  Ensure that gender is a comma-separated string containing only m, f or u
+    #  Ensure that gender is a comma-separated string containing only m or f
     def validate_gender(self, value):
-        value, value_list = clean_input(value)
-        for element in value_list:
-            if not re.match(r'^(m|f)$', element):
-                raise serializers.ValidationError(
-                    "Gender must a comma-separated string containing only m or f"
-                )
+        value, value_list = validators.PREF_GENDERS.check_list(value)
         return value
 
     #  Ensure that age is a comma-separated string containing only b, y, a or s
     def validate_age(self, value):
-        value, value_list = clean_input(value)
-        for element in value_list:
-            if not re.match(r'^(b|y|a|s)$', element):
-                raise serializers.ValidationError(
-                    "Age must a comma-separated string containing only b, y, a or s"
-                )
+        value, value_list = validators.PREF_AGES.check_list(value)
         return value
 
     #  Ensure that microchipped is a comma-separated string containing only y, n, e
     def validate_microchipped(self, value):
-        if not re.match(r'^(y|n|e)$', value):
-            raise serializers.ValidationError(
-                "Microchipped must contain only y, n or e"
-            )
-        return value
+        return validators.PREF_MICROCHIPPED.check(value)
 
 
 class UserDogSerializer(serializers.ModelSerializer):
@@ -135,3 +106,64 @@ class UserDogSerializer(serializers.ModelSerializer):
             'dog_id',
         )
         model = models.UserDog
+
+
+class UserDogBulkSerializer(UserDogSerializer):
+    """
+    Validate a single entry of a bulk status / blacklist update.
+    """
+    dog_id = serializers.IntegerField(min_value=1)
+    status = serializers.ChoiceField(choices=('liked', 'disliked', 'undecided'), required=False)
+    blacklist = serializers.BooleanField(required=False)
+
+    class Meta(UserDogSerializer.Meta):
+        fields = (
+            'dog_id',
+            'status',
+            'blacklist',
+        )
+
+    #  Store the status as l, d or u
+    def validate_status(self, value):
+        return value[0]
+
+    #  Ensure that there is something to update
+    def validate(self, attrs):
+        if 'status' not in attrs and 'blacklist' not in attrs:
+            raise serializers.ValidationError(
+                "Each entry must contain a status, a blacklist or both"
+            )
+        return attrs
+
+
+# noinspection PyMethodMayBeStatic
+class DogSearchSerializer(serializers.Serializer):
+    """
+    Validate the query parameters of a dog search.
+    """
+    q = serializers.CharField(max_length=100)
+    gender = serializers.CharField(required=False)
+    size = serializers.CharField(required=False)
+    age = serializers.CharField(required=False)
+    microchipped = serializers.ChoiceField(choices=('y', 'n'), required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=50, default=20)
+    offset = serializers.IntegerField(min_value=0, max_value=10000, default=0)
+
+    #  Ensure that gender is a comma-separated string containing only m, f or u
+    def validate_gender(self, value):
+        value, value_list = validators.SEARCH_GENDERS.check_list(value)
+        return value_list
+
+    #  Ensure that size is a comma-separated string containing only s, m, l or xl
+    def validate_size(self, value):
+        value, value_list = validators.PREF_SIZES.check_list(value)
+        return value_list
+
+    #  Ensure that age is a comma-separated string containing only b, y, a or s
+    def validate_age(self, value):
+        value, value_list = validators.PREF_AGES.check_list(value)
+        return value_list
+
+    #  Filter on a list of values like the other facets
+    def validate_microchipped(self, value):
+        return [value]
@@ -0,0 +1,28 @@
+import threading
+from contextlib import contextmanager
+
+from django.dispatch import Signal
+
+#  Sent by UserDogQuerySet.upsert, which bypasses post_save. previous holds
+#  the (status, blacklist) each existing (user_id, dog_id) had before it
+user_dogs_upserted = Signal(providing_args=['rows', 'update_fields', 'previous'])
+
+#  Set in a thread while it does the UserDog receivers' work itself, see skip_receivers
+local = threading.local()
+
+
+@contextmanager
+def skip_receivers():
+    """
+    Skip the per-row UserDog receivers in this thread, while the caller
+    updates what they would for a whole batch at once, e.g. archive.purge_dog.
+    """
+    local.skipping = True
+    try:
+        yield
+    finally:
+        local.skipping = False
+
+
+def receivers_skipped():
+    return getattr(local, 'skipping', False)
@@ -11,16 +11,24 @@ var Dog = React.createClass({
     this.serverRequest.abort();
   },
   componentWillReceiveProps: function (props) {
+    this.buffer = [];
     this.setState({ details: undefined, message: undefined, filter: props.filter }, this.getNext);
   },
+  prefetchCount: 10,
   getNext: function () {
+    // Serve from the prefetched dogs and only call back once they run out
+    if (this.buffer.length) {
+      this.setState({ details: this.buffer.shift(), message: undefined });
+      return;
+    }
     this.serverRequest = $.ajax({
-      url: `api/dog/${ this.state.details ? this.state.details.id : -1 }/${ this.state.filter }/next/`,
+      url: `api/dog/${ this.state.details ? this.state.details.id : -1 }/${ this.state.filter }/next/?count=${ this.prefetchCount }`,
       method: "GET",
       dataType: "json",
       headers: TokenAuth.getAuthHeader()
     }).done(function (data) {
-      this.setState({ details: data, message: undefined });
+      this.buffer = data;
+      this.setState({ details: this.buffer.shift(), message: undefined });
     }.bind(this)).fail(function (response) {
       var message = null;
       if (response.status == 404) {
@@ -48,6 +56,7 @@ var Dog = React.createClass({
     }.bind(this));
   },
   getFirst: function () {
+    this.buffer = [];
     this.getNext();
   },
   handlePreferencesClick: function (event) {
@@ -153,7 +162,9 @@ var Dog = React.createClass({
     return React.createElement(
       "div",
       null,
-      React.createElement("img", { src: "static/images/dogs/" + this.state.details.image_filename }),
+      React.createElement("img", { src: "static/images/dogs/" + this.state.details.image_filename,
+        srcSet: this.state.details.srcset || undefined,
+        sizes: "(max-width: 480px) 100vw, 480px" }),
       React.createElement(
         "p",
         { className: "dog-card" },
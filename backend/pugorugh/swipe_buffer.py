@@ -0,0 +1,270 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import conditional
+from . import models
+
+logger = logging.getLogger('pugorugh.swipe_buffer')
+
+#  The log of swipes waiting to be written to UserDog. status and blacklist
+#  are NULL when the swipe left them as they were. claim and claimed_at are
+#  set on the swipes a flush is writing, see claim.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS swipe (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    dog_id INTEGER NOT NULL,
+    status TEXT,
+    blacklist INTEGER,
+    claim TEXT,
+    claimed_at REAL
+);
+CREATE INDEX IF NOT EXISTS swipe_user_idx ON swipe (user_id);
+CREATE INDEX IF NOT EXISTS swipe_claim_idx ON swipe (claim);
+'''
+
+#  Swipes read from the log per flush
+FLUSH_BATCH_SIZE = 1000
+
+#  Seconds after which the swipes claimed by a flush that never finished,
+#  e.g. because its process exited, are claimed again
+CLAIM_TIMEOUT = 60
+
+local = threading.local()
+flusher = None
+flusher_lock = threading.Lock()
+
+
+def enabled():
+    return bool(getattr(settings, 'SWIPE_BUFFER_PATH', None))
+
+
+def get_connection():
+    """
+    Get this thread's connection to the log, a SQLite database in WAL mode
+    so the flusher never blocks swipes being appended or read.
+    """
+    path = settings.SWIPE_BUFFER_PATH
+    if getattr(local, 'path', None) != path:
+        connection = sqlite3.connect(path, timeout=10, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(swipe)')]
+        if columns and 'claim' not in columns:
+            # A log written before swipes were claimed
+            connection.executescript('ALTER TABLE swipe ADD COLUMN claim TEXT; '
+                                     'ALTER TABLE swipe ADD COLUMN claimed_at REAL;')
+        connection.executescript(SCHEMA)
+        local.connection, local.path = connection, path
+    return local.connection
+
+
+def close():
+    """
+    Close this thread's connection to the log.
+    """
+    if getattr(local, 'path', None) is not None:
+        local.connection.close()
+        local.connection = local.path = None
+
+
+def append(user_id, dog_id, status=None, blacklist=None):
+    """
+    Log a swipe to be written to UserDog by the next flush. It is on disk
+    once this returns, so it survives the process exiting.
+    :param user_id: a user id
+    :param dog_id: a dog id
+    :param status: l, d or u, or None to leave the status as it is
+    :param blacklist: True or False, or None to leave the blacklist as it is
+    """
+    get_connection().execute(
+        'INSERT INTO swipe (user_id, dog_id, status, blacklist) VALUES (?, ?, ?, ?)',
+        (user_id, dog_id, status, blacklist),
+    )
+    conditional.invalidate_user(user_id)
+    start_flusher()
+
+
+def coalesce(rows):
+    """
+    Merge the swipes on each (user, dog), later swipes winning.
+    :param rows: (user_id, dog_id, status, blacklist) in the order swiped
+    :return: {(user_id, dog_id): {field: value}} of the fields swiped
+    """
+    entries = {}
+    for user_id, dog_id, status, blacklist in rows:
+        entry = entries.setdefault((user_id, dog_id), {})
+        if status is not None:
+            entry['status'] = status
+        if blacklist is not None:
+            entry['blacklist'] = bool(blacklist)
+    return entries
+
+
+def pending(user_id):
+    """
+    Get a user's swipes that are waiting to be flushed.
+    :param user_id: a user id
+    :return: {dog_id: {field: value}}
+    """
+    rows = get_connection().execute(
+        'SELECT user_id, dog_id, status, blacklist FROM swipe WHERE user_id = ? ORDER BY seq', (user_id,))
+    start_flusher()
+    return {dog_id: entry for (_, dog_id), entry in coalesce(rows).items()}
+
+
+def decided(user_id):
+    """
+    :param user_id: a user id
+    :return: the ids of the dogs a user has liked, disliked or blacklisted
+             in swipes waiting to be flushed
+    """
+    return {
+        dog_id for dog_id, entry in pending(user_id).items()
+        if entry.get('status', 'u') != 'u' or entry.get('blacklist')
+    }
+
+
+def pending_ratings(user_id):
+    """
+    Get the ratings a user's swipes waiting to be flushed will leave,
+    their stored ratings with the swipes applied.
+    :param user_id: a user id
+    :return: {dog_id: (status, blacklist)}
+    """
+    entries = pending(user_id)
+    if not entries:
+        return {}
+    stored = {
+        dog_id: (status, blacklist) for dog_id, status, blacklist in models.UserDog.objects.filter(
+            user_id=user_id, dog_id__in=entries).values_list('dog_id', 'status', 'blacklist')
+    }
+    ratings = {}
+    for dog_id, entry in entries.items():
+        status, blacklist = stored.get(dog_id, ('u', False))
+        ratings[dog_id] = (entry.get('status', status), entry.get('blacklist', blacklist))
+    return ratings
+
+
+def user_dog(user_id, dog_id):
+    """
+    Get a user's rating of a dog with their pending swipes applied,
+    as it will be once flushed.
+    :return: an unsaved UserDog instance
+    """
+    user_dog = models.UserDog.objects.filter(user_id=user_id, dog_id=dog_id).first()
+    if user_dog is None:
+        user_dog = models.UserDog(user_id=user_id, dog_id=dog_id, status='u', blacklist=False)
+    for field, value in pending(user_id).get(int(dog_id), {}).items():
+        setattr(user_dog, field, value)
+    return user_dog
+
+
+def claim(connection, batch_size):
+    """
+    Claim the oldest swipes in the log for this flush, in a transaction
+    that only lasts as long as the claim. Nothing is claimed while another
+    flush's claim is live, so swipes on a dog are always written in order.
+    :return: the claim, or None if there was nothing to claim
+    """
+    token, now = uuid.uuid4().hex, time.time()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        live = connection.execute(
+            'SELECT 1 FROM swipe WHERE claim IS NOT NULL AND claimed_at >= ? LIMIT 1',
+            (now - CLAIM_TIMEOUT,)).fetchone()
+        claimed = 0
+        if live is None:
+            claimed = connection.execute(
+                'UPDATE swipe SET claim = ?, claimed_at = ? WHERE seq IN '
+                '(SELECT seq FROM swipe ORDER BY seq LIMIT ?)', (token, now, batch_size)).rowcount
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+    return token if claimed else None
+
+
+def flush(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Claim the oldest swipes in the log, write them to UserDog, one upsert
+    for each set of fields swiped, then take them off the log. The log is
+    only locked while claiming and deleting, so swipes are appended while
+    UserDog is written. If the write fails the claim is released, and if
+    the process exits it runs out, so swipes are never lost. Swipes on
+    dogs that have since been archived are dropped.
+    :param batch_size: the most swipes to read
+    :return: the number of swipes read
+    """
+    connection = get_connection()
+    token = claim(connection, batch_size)
+    if token is None:
+        return 0
+    try:
+        rows = connection.execute(
+            'SELECT user_id, dog_id, status, blacklist FROM swipe WHERE claim = ? ORDER BY seq',
+            (token,)).fetchall()
+        entries = coalesce(rows)
+        existing = set(models.Dog.objects.filter(
+            id__in={dog_id for _, dog_id in entries}, is_active=True).values_list('id', flat=True))
+
+        # New entries default to 'undecided', as in views.BulkStatus
+        groups = {}
+        for (user_id, dog_id), entry in entries.items():
+            if dog_id in existing:
+                update_fields = tuple(field for field in ('status', 'blacklist') if field in entry)
+                row = {'user_id': user_id, 'dog_id': dog_id, 'status': 'u', 'blacklist': False}
+                row.update(entry)
+                groups.setdefault(update_fields, []).append(row)
+        with transaction.atomic():
+            for update_fields, group in groups.items():
+                models.UserDog.objects.upsert(group, update_fields=list(update_fields))
+    except BaseException:
+        connection.execute('UPDATE swipe SET claim = NULL, claimed_at = NULL WHERE claim = ?', (token,))
+        raise
+
+    connection.execute('DELETE FROM swipe WHERE claim = ?', (token,))
+    return len(rows)
+
+
+def flush_all(batch_size=FLUSH_BATCH_SIZE):
+    """
+    Flush until the log is empty.
+    :return: the number of swipes read
+    """
+    flushed = 0
+    while True:
+        count = flush(batch_size)
+        flushed += count
+        if count < batch_size:
+            return flushed
+
+
+def run_flusher(interval):
+    while True:
+        time.sleep(interval)
+        close_old_connections()
+        try:
+            flush_all()
+        except Exception:
+            logger.exception('Failed to flush the swipe buffer')
+
+
+def start_flusher():
+    """
+    Start this process's background flusher, unless it is already running
+    or SWIPE_BUFFER_FLUSH_INTERVAL is 0, e.g. when flush_swipes runs instead.
+    """
+    global flusher
+    interval = getattr(settings, 'SWIPE_BUFFER_FLUSH_INTERVAL', 1.0)
+    if not interval or (flusher is not None and flusher.is_alive()):
+        return
+    with flusher_lock:
+        if flusher is None or not flusher.is_alive():
+            flusher = threading.Thread(target=run_flusher, args=(interval,), name='swipe-flusher', daemon=True)
+            flusher.start()
@@ -0,0 +1,58 @@
+from . import archive
+from . import conditional
+from . import images
+from . import jobs
+from . import matching
+from . import models
+from . import preferences
+
+
+@jobs.task()
+def rebuild_queue(user_id, version):
+    """
+    Rebuild a user's match queue after their preferences are saved, unless
+    they have been saved again or get-next has rebuilt it in the meantime.
+    """
+    prefs = preferences.get_prefs(user_id, create=False)
+    if prefs is not None and prefs.version == version and not prefs.match_queue_built:
+        matching.rebuild_queue(prefs)
+
+
+@jobs.task()
+def queue_dog(dog_id):
+    """
+    Add a new or edited dog to the queues it now matches.
+    """
+    dog = models.Dog.objects.filter(id=dog_id).first()
+    if dog is not None:
+        matching.queue_dog(dog)
+
+
+@jobs.task()
+def build_image_variants(filename):
+    """
+    Build the image variants of a new dog, then drop the cached get-next
+    responses that were served without them.
+    """
+    images.update_manifest([images.build_variants(filename)])
+    conditional.invalidate_all()
+
+
+@jobs.task()
+def purge_dog(dog_id):
+    """
+    Purge an archived dog, pausing between batches to let swipes through.
+    """
+    archive.purge_dog(dog_id, pause=0.05)
+
+
+@jobs.task(max_attempts=1)
+def import_dogs(file, chunk_size=None):
+    """
+    Import dogs from a file with scripts/data_import.py.
+    Not retried, as a failed import may be part way through.
+    """
+    # Imported here, as importing it sets Django up when it is run as a script
+    from .scripts import data_import
+
+    data_import.load_data(file, chunk_size=chunk_size or data_import.DEFAULT_CHUNK_SIZE)
@@ -1,14 +1,25 @@
+import shutil
+import tempfile
+from unittest import mock
+
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
-from pugorugh import models
+from pugorugh import images, models
 
 
 class AddDeleteTests(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user('david', 'holmes@davidholmes.com', 'mymatepaul')
 
+        # Keep the image variants built on upload out of the static files
+        variant_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, variant_dir)
+        patcher = mock.patch.object(images, 'VARIANT_DIR', variant_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
         self.dog_1 = models.Dog.objects.create(
             name='Snoopy',
             image_filename='snoopy.jpg',
@@ -49,9 +60,27 @@ class AddDeleteTests(APITestCase):
                 'age': 76,
                 'gender': 'm',
                 'size': 'm',
-                'microchipped': False
+                'microchipped': False,
+                'srcset': ''
             }
         )
+        # The variants are built after the response, wait for them
+        images.background.submit(lambda: None).result()
+        self.assertIn('-card.webp 480w', images.get_srcset('gnasher.jpg'))
+
+    def test_add_dog_outside_images(self):
+        """
+        Ensure an image_filename that would reach outside the image directory is refused.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for filename in ('../../settings.jpg', 'dogs/gnasher.jpg', '..\\gnasher.jpg'):
+            response = self.client.post(reverse('add-dog'), {
+                'name': 'Gnasher', 'image_filename': filename, 'age': 76, 'gender': 'm', 'size': 'm',
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('image_filename', response.data)
 
     def test_delete_dog(self):
         """
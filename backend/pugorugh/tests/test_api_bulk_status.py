@@ -0,0 +1,75 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth.models import User
+
+from pugorugh import models
+
+
+class BulkStatusTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('scooby', 'scooby@scooby-doo.com', 'scoobypassword')
+
+        for number in range(1, 6):
+            models.Dog.objects.create(
+                name='Dog {}'.format(number),
+                image_filename='{}.jpg'.format(number),
+                breed="Labrador",
+                age=72,
+                gender='f',
+                size='l')
+
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=1, status='d')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_status(self):
+        """
+        Ensure that statuses and blacklists are applied
+        and reported for each entry.
+        """
+        url = reverse('bulk-status')
+        data = [
+            {'dog_id': 1, 'status': 'liked'},
+            {'dog_id': 2, 'blacklist': True},
+            {'dog_id': 3, 'status': 'disliked', 'blacklist': True},
+            {'dog_id': 3, 'status': 'liked'},
+            {'dog_id': 99, 'status': 'liked'},
+            {'dog_id': 4, 'status': 'maybe'},
+            {'dog_id': 5},
+        ]
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [result['ok'] for result in response.data],
+            [True, True, True, True, False, False, False]
+        )
+        self.assertIn('dog_id', response.data[4]['errors'])
+        self.assertIn('status', response.data[5]['errors'])
+
+        entries = {
+            entry.dog_id: (entry.status, entry.blacklist)
+            for entry in models.UserDog.objects.filter(user=self.user)
+        }
+        self.assertEqual(entries, {1: ('l', False), 2: ('u', True), 3: ('l', True)})
+
+    def test_bulk_status_query_count(self):
+        """
+        Ensure that the number of queries does not grow with the number of entries.
+        """
+        url = reverse('bulk-status')
+        data = [{'dog_id': number, 'status': 'liked'} for number in range(1, 6)]
+        # Including reading the ratings overwritten and updating the user's counts
+        with self.assertNumQueries(7):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_bulk_status_invalid(self):
+        """
+        Ensure that a body that is not a list of entries is rejected.
+        """
+        url = reverse('bulk-status')
+        for data in ([], {'dog_id': 1, 'status': 'liked'}):
+            response = self.client.post(url, data, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
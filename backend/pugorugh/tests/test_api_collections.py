@@ -0,0 +1,88 @@
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from pugorugh import models
+
+
+class CollectionTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shaggy', 'rogers@scooby-doo.com', 'shaggypassword')
+        self.client.force_authenticate(self.user)
+
+        for number in range(1, 7):
+            models.Dog.objects.create(
+                name='Dog {}'.format(number), image_filename='{}.jpg'.format(number), breed='Beagle',
+                age=30, gender='m', size='m', microchipped=True)
+        for pk in (1, 2, 4, 5):
+            self.client.put(reverse('set-status', kwargs={'status': 'liked', 'pk': pk}))
+        self.client.put(reverse('set-status', kwargs={'status': 'disliked', 'pk': 3}))
+        self.client.put(reverse('blacklist', kwargs={'blacklist': 'true', 'pk': 5}))
+
+    def test_liked_pages(self):
+        """
+        Ensure liked dogs are listed a page at a time in id order,
+        with the total number liked.
+        """
+        url = reverse('dog-collection', kwargs={'collection': 'liked'})
+        response = self.client.get(url, {'limit': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([dog['id'] for dog in response.data['results']], [1, 2])
+        self.assertIsNone(response.data['previous'])
+
+        response = self.client.get(response.data['next'])
+        self.assertEqual([dog['id'] for dog in response.data['results']], [4])
+        self.assertIsNone(response.data['next'])
+
+    def test_disliked_and_blacklisted(self):
+        """
+        Ensure blacklisted dogs are only listed as blacklisted.
+        """
+        response = self.client.get(reverse('dog-collection', kwargs={'collection': 'disliked'}))
+        self.assertEqual([dog['id'] for dog in response.data['results']], [3])
+        response = self.client.get(reverse('dog-collection', kwargs={'collection': 'blacklisted'}))
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([dog['id'] for dog in response.data['results']], [5])
+
+    def test_counts_updated(self):
+        """
+        Ensure the counts follow ratings being changed and removed.
+        """
+        self.client.put(reverse('set-status', kwargs={'status': 'undecided', 'pk': 1}))
+        models.UserDog.objects.get(user=self.user, dog_id=2).delete()
+        self.client.post(reverse('bulk-status'), [{'dog_id': 6, 'status': 'disliked'}], format='json')
+
+        self.assertEqual(
+            models.UserDogCount.objects.values('liked', 'disliked', 'blacklisted').get(user=self.user),
+            {'liked': 1, 'disliked': 2, 'blacklisted': 1})
+
+    def test_counts_without_recount(self):
+        """
+        Ensure a swipe moves the dog between the counts without recounting.
+        """
+        url = reverse('set-status', kwargs={'status': 'disliked', 'pk': 1})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.put(url)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual(
+            models.UserDogCount.objects.values('liked', 'disliked', 'blacklisted').get(user=self.user),
+            {'liked': 2, 'disliked': 2, 'blacklisted': 1})
+
+        instance = models.UserDog.objects.get(user=self.user, dog_id=1)
+        instance.blacklist = True
+        instance.save()
+        self.assertEqual(
+            models.UserDogCount.objects.values('liked', 'disliked', 'blacklisted').get(user=self.user),
+            {'liked': 2, 'disliked': 1, 'blacklisted': 2})
+
+    def test_page_query_count(self):
+        """
+        Ensure a page is read in one query, plus one for the count.
+        """
+        url = reverse('dog-collection', kwargs={'collection': 'liked'})
+        with self.assertNumQueries(2):
+            self.client.get(url)
@@ -0,0 +1,91 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from pugorugh import models
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('fred', 'jones@scooby-doo.com', 'fredpassword')
+        models.UserPref.objects.create(
+            age='b,y,a,s',
+            gender='m,f',
+            size='s,m,l,xl',
+            user_id=self.user.id)
+
+        self.dog_1 = models.Dog.objects.create(
+            name='Scooby', image_filename='1.jpg', breed='Great Dane',
+            age=84, gender='m', size='xl', microchipped=True)
+        self.dog_2 = models.Dog.objects.create(
+            name='Scrappy', image_filename='2.jpg', breed='Great Dane',
+            age=12, gender='m', size='s', microchipped=False)
+
+        self.client.force_authenticate(self.user)
+        self.next_url = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+
+    def test_prefs_not_modified(self):
+        """
+        Ensure the preferences are answered with a 304 while the ETag
+        matches, and get a new ETag when they are changed.
+        """
+        url = reverse('user-prefs')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+        response = self.client.put(url, {'age': 'b', 'gender': 'f', 'size': 'l'}, format='json')
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['age'], 'b')
+
+    def test_next_not_modified(self):
+        """
+        Ensure the next dog is answered with a 304 while the ETag
+        matches, and in full once the dog is edited.
+        """
+        etag = self.client.get(self.next_url)['ETag']
+
+        response = self.client.get(self.next_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.dog_1.name = 'Scooby-Doo'
+        self.dog_1.save()
+        response = self.client.get(self.next_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['name'], 'Scooby-Doo')
+
+    def test_next_count_etag(self):
+        """
+        Ensure a list of next dogs has an ETag of its own.
+        """
+        etag = self.client.get(self.next_url)['ETag']
+        response = self.client.get(self.next_url, {'count': 2})
+        self.assertNotEqual(response['ETag'], etag)
+
+        response = self.client.get(self.next_url, {'count': 2}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(NEXT_DOG_CACHE_ALIAS='default')
+    def test_next_cached(self):
+        """
+        Ensure a cached next dog is served without any queries,
+        until the user rates a dog.
+        """
+        self.client.get(self.next_url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.next_url)
+        self.assertEqual(response.data['id'], self.dog_1.id)
+
+        self.client.put(reverse('set-status', kwargs={'pk': self.dog_1.id, 'status': 'disliked'}))
+        response = self.client.get(self.next_url)
+        self.assertEqual(response.data['id'], self.dog_2.id)
@@ -1,12 +1,35 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
-from pugorugh import models
+from pugorugh import images, models
+
+#  Variants recorded for three of the dogs' images, the fourth has none
+MANIFEST = {
+    '1.jpg': {'thumbnail': ['1-0a1b-thumbnail.webp', 160], 'card': ['1-0a1b-card.webp', 480]},
+    '2.jpg': {'thumbnail': ['2-2c3d-thumbnail.webp', 160], 'card': ['2-2c3d-card.webp', 480]},
+    '3.jpg': {'thumbnail': ['3-4e5f-thumbnail.webp', 160], 'card': ['3-4e5f-card.webp', 480]},
+}
 
 
 class GetNextTests(APITestCase):
     def setUp(self):
+        variant_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, variant_dir)
+        with open(os.path.join(variant_dir, 'manifest.json'), 'w') as file:
+            json.dump(MANIFEST, file)
+        for patcher in (
+                mock.patch.object(images, 'VARIANT_DIR', variant_dir),
+                mock.patch.dict(images.manifest_cache, {'mtime': None, 'checked': 0.0, 'entries': {}})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
         self.user = User.objects.create_user('ringo', 'starr@thebeatles.com', 'ringopassword')
         self.user_2 = User.objects.create_user('george', 'harrison@thebeatles.com', 'georgepassword')
 
@@ -96,7 +119,9 @@ class GetNextTests(APITestCase):
                 'age': 72,
                 'gender': 'f',
                 'size': 'l',
-                'microchipped': True
+                'microchipped': True,
+                'srcset': ('/static/images/dogs/variants/1-0a1b-thumbnail.webp 160w, '
+                           '/static/images/dogs/variants/1-0a1b-card.webp 480w')
             }
         )
 
@@ -122,7 +147,9 @@ class GetNextTests(APITestCase):
                 'age': 24,
                 'gender': 'f',
                 'size': 'xl',
-                'microchipped': False
+                'microchipped': False,
+                'srcset': ('/static/images/dogs/variants/3-4e5f-thumbnail.webp 160w, '
+                           '/static/images/dogs/variants/3-4e5f-card.webp 480w')
             }
         )
 
@@ -148,7 +175,9 @@ class GetNextTests(APITestCase):
                 'age': 72,
                 'gender': 'f',
                 'size': 'l',
-                'microchipped': True
+                'microchipped': True,
+                'srcset': ('/static/images/dogs/variants/1-0a1b-thumbnail.webp 160w, '
+                           '/static/images/dogs/variants/1-0a1b-card.webp 480w')
             }
         )
 
@@ -173,7 +202,8 @@ class GetNextTests(APITestCase):
                 'age': 36,
                 'gender': 'm',
                 'size': 'm',
-                'microchipped': True
+                'microchipped': True,
+                'srcset': ''
             }
         )
 
@@ -198,7 +228,9 @@ class GetNextTests(APITestCase):
                 'age': 14,
                 'gender': 'm',
                 'size': 's',
-                'microchipped': True
+                'microchipped': True,
+                'srcset': ('/static/images/dogs/variants/2-2c3d-thumbnail.webp 160w, '
+                           '/static/images/dogs/variants/2-2c3d-card.webp 480w')
             }
         )
 
@@ -214,3 +246,82 @@ class GetNextTests(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_undecided_query_count(self):
+        """
+        Ensure that the next undecided Dog, including the loop back
+        around, is found with a single query using the cached UserPref.
+        """
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        for pk in (-1, 1, 200):
+            url = reverse('get-next', kwargs={'status': 'undecided', 'pk': pk})
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_liked_query_count(self):
+        """
+        Ensure that the next liked Dog is found with a single query,
+        and a second to loop back around to the first.
+        """
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': -1})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], 4)
+
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': 4})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], 4)
+
+    def test_undecided_excludes_blacklisted(self):
+        """
+        Ensure that a Dog rated as 'undecided' but blacklisted is skipped.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.client.get(reverse('blacklist', kwargs={'blacklist': 'true', 'pk': 3}))
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], 1)
+
+    def test_undecided_count(self):
+        """
+        Ensure that the next N undecided Dogs are returned
+        in id order, looping back around with a second query.
+        """
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': 1})
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'count': 5})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([dog['id'] for dog in response.data], [3, 1])
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+        response = self.client.get(url, {'count': 1})
+        self.assertEqual([dog['id'] for dog in response.data], [1])
+
+    def test_invalid_count(self):
+        """
+        Ensure that a count outside 1 to 50 is rejected.
+        """
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': -1})
+        for count in ('0', '51', 'ten'):
+            response = self.client.get(url, {'count': count})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
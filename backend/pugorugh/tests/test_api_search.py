@@ -0,0 +1,111 @@
+from importlib import import_module
+from itertools import product
+
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from pugorugh import models, search
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('fred', 'jones@scooby-doo.com', 'fredpassword')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('dog-search')
+
+        for name, breed, age, gender, size, microchipped in (
+                ('Francesca', 'Labrador', 72, 'f', 'l', True),
+                ('Hank', 'Labrador Retriever', 5, 'm', 'l', False),
+                ('Muffin', 'Boxer', 24, 'f', 'xl', False),
+                ('Labby', 'Pug', 150, 'u', 's', True)):
+            models.Dog.objects.create(
+                name=name, image_filename='1.jpg', breed=breed, age=age,
+                gender=gender, size=size, microchipped=microchipped)
+
+    def test_search(self):
+        """
+        Ensure names and breeds are matched by prefix, with facet counts.
+        """
+        response = self.client.get(self.url, {'q': 'lab'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([dog['name'] for dog in response.data['results']], ['Francesca', 'Hank', 'Labby'])
+        self.assertEqual(response.data['facets']['gender'], {'m': 1, 'f': 1, 'u': 1})
+        self.assertEqual(response.data['facets']['age'], {'b': 1, 'y': 0, 'a': 1, 's': 1})
+        self.assertEqual(response.data['facets']['microchipped'], {'n': 1, 'y': 2})
+
+        response = self.client.get(self.url, {'q': 'Labrador retr'})
+        self.assertEqual([dog['name'] for dog in response.data['results']], ['Hank'])
+
+    def test_filters(self):
+        """
+        Ensure filters narrow the results, and that each facet is
+        counted with the filters on the other facets only.
+        """
+        response = self.client.get(self.url, {'q': 'lab', 'gender': 'f,m', 'microchipped': 'y', 'limit': 1})
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual([dog['name'] for dog in response.data['results']], ['Francesca'])
+        self.assertEqual(response.data['facets']['gender'], {'m': 0, 'f': 1, 'u': 1})
+        self.assertEqual(response.data['facets']['microchipped'], {'n': 1, 'y': 1})
+
+    def test_index_kept_in_sync(self):
+        """
+        Ensure that added, edited and deleted dogs are found accordingly.
+        """
+        response = self.client.post(reverse('add-dog'), {
+            'name': 'Scooby', 'image_filename': 'scooby.jpg', 'breed': 'Great Dane',
+            'age': 84, 'gender': 'm', 'size': 'xl', 'microchipped': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.client.get(self.url, {'q': 'scoo'}).data['count'], 1)
+
+        dog = models.Dog.objects.get(name='Scooby')
+        dog.microchipped = True
+        dog.save()
+        self.assertEqual(self.client.get(self.url, {'q': 'dane', 'microchipped': 'y'}).data['count'], 1)
+
+        self.client.delete(reverse('delete-dog', kwargs={'pk': dog.id}))
+        self.assertEqual(self.client.get(self.url, {'q': 'scoo'}).data['count'], 0)
+
+    def test_invalid_search(self):
+        """
+        Ensure that a missing query or unknown facet value is rejected.
+        """
+        for params in ({}, {'q': 'lab', 'size': 'huge'}, {'q': 'lab', 'limit': 51}):
+            response = self.client.get(self.url, params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_unknown_facet_value(self):
+        """
+        Ensure that a dog with a facet value outside FACETS, e.g. an age out
+        of range saved without the serializer, is saved but left out of the
+        index, and taken out of it if an indexed dog is changed that way.
+        """
+        with self.assertLogs('pugorugh.search', 'WARNING'):
+            old = models.Dog.objects.create(
+                name='Methuselah', image_filename='old.jpg', breed='Pug',
+                age=250, gender='m', size='s', microchipped=False)
+        self.assertEqual(old.age_bucket, '')
+        self.assertEqual(self.client.get(self.url, {'q': 'methuselah'}).data['count'], 0)
+        with override_settings(DOG_SEARCH_BACKEND='pugorugh.search.DatabaseSearchBackend'):
+            self.assertEqual(self.client.get(self.url, {'q': 'methuselah'}).data['count'], 0)
+
+        dog = models.Dog.objects.get(name='Francesca')
+        dog.gender = 'M'
+        with self.assertLogs('pugorugh.search', 'WARNING'):
+            dog.save()
+        self.assertEqual(self.client.get(self.url, {'q': 'francesca'}).data['count'], 0)
+
+    def test_migration_combos(self):
+        """
+        Ensure the combination numbers copied into the migration that
+        created the index are still the ones search uses.
+        """
+        migration = import_module('pugorugh.migrations.0011_dog_search')
+        self.assertEqual(migration.COMBO_BITS, search.COMBO_BITS)
+        self.assertEqual(migration.INDEX_TABLE, search.INDEX_TABLE)
+        for gender, size, age, microchipped in product(*(values for name, values in search.FACETS)):
+            dog = models.Dog(gender=gender, size=size, age_bucket=age, microchipped=microchipped == 'y')
+            self.assertEqual(migration.get_combo(dog), search.get_combo(dog))
@@ -1,3 +1,5 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
@@ -105,4 +107,35 @@ class StatusTests(APITestCase):
                 'user_id': 1,
                 'dog_id': 2,
             }
-        )
\ No newline at end of file
+        )
+    def test_put_writes_once(self):
+        """
+        Ensure that a PUT writes the entry with the one upsert, and the
+        response is built from it without reading it back.
+        """
+        self.client.force_authenticate(self.user)
+        url = reverse('set-status', kwargs={'status': 'liked', 'pk': self.dog_2.id})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.disliked_dog.id)
+
+        user_dog_queries = [query['sql'] for query in queries if 'pugorugh_userdog"' in query['sql']]
+        self.assertEqual(len(user_dog_queries), 2)
+        self.assertTrue(user_dog_queries[0].startswith('SELECT'))
+        self.assertTrue(user_dog_queries[1].startswith('INSERT'))
+        self.assertEqual(models.UserDog.objects.get(id=self.disliked_dog.id).status, 'l')
+
+    def test_missing_or_archived_dog(self):
+        """
+        Ensure that a dog that does not exist, or is archived, cannot be rated.
+        """
+        self.client.force_authenticate(self.user)
+        self.dog_1.is_active = False
+        self.dog_1.save()
+        for pk in (self.dog_1.id, 999):
+            response = self.client.put(reverse('set-status', kwargs={'status': 'liked', 'pk': pk}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            response = self.client.put(reverse('blacklist', kwargs={'blacklist': 'true', 'pk': pk}))
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(models.UserDog.objects.filter(dog_id__in=(self.dog_1.id, 999)).exists())
@@ -2,7 +2,9 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
-from pugorugh import models
+from unittest import mock
+
+from pugorugh import models, preferences
 
 
 class UserTests(APITestCase):
@@ -105,6 +107,54 @@ class UserPrefsTests(APITestCase):
         response = self.client.put(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_prefs_cache_invalidated(self):
+        """
+        Ensure the cached User Prefs are replaced when they are changed.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
 
+        url = reverse('user-prefs')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
 
+        self.client.patch(url, {'size': 'l'}, format='json')
+        response = self.client.get(url)
+        self.assertEqual(response.data['size'], 'l')
 
+    def test_prefs_read_before_save_not_cached(self):
+        """
+        Ensure User Prefs read before a save are not cached over the save's
+        invalidation.
+        """
+        user_pref = preferences.get_or_create_user_pref(self.user.id)
+        preferences.invalidate(self.user.id)
+        cache = preferences.get_cache()
+        add = cache.add
+
+        def save_then_add(*args, **kwargs):
+            # Another request saves the preferences after these were read
+            if user_pref.size != 'l':
+                user_pref.size = 'l'
+                user_pref.save()
+            return add(*args, **kwargs)
+
+        cache.delete(preferences.cache_key(self.user.id))
+        with mock.patch.object(cache, 'add', side_effect=save_then_add):
+            self.assertNotEqual(preferences.get_prefs(self.user.id).size, 'l')
+        self.assertIsInstance(cache.get(preferences.cache_key(self.user.id)), preferences.Invalidated)
+        self.assertEqual(preferences.get_prefs(self.user.id).size, 'l')
+        self.assertEqual(cache.get(preferences.cache_key(self.user.id)).size, 'l')
+
+    def test_prefs_created_once(self):
+        """
+        Ensure only one set of User Prefs is created for a new user.
+        """
+        self.client = APIClient()
+        self.client.force_authenticate(self.user_2)
+
+        url = reverse('user-prefs')
+        self.client.get(url)
+        self.client.put(url, {'age': 'b', 'gender': 'f', 'size': 's', 'microchipped': 'e'}, format='json')
+        self.assertEqual(models.UserPref.objects.filter(user=self.user_2).count(), 1)
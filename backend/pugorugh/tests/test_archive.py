@@ -0,0 +1,85 @@
+import os
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from pugorugh import archive, models, ratings
+
+
+class ArchiveTests(APITestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user('user{}'.format(number), 'user{}@example.com'.format(number), 'password')
+            for number in range(3)
+        ]
+        self.user = self.users[0]
+        for user in self.users:
+            models.UserPref.objects.create(age='b,y,a,s', gender='m,f', size='s,m,l,xl', user_id=user.id)
+
+        self.dog_1 = models.Dog.objects.create(
+            name='Lassie', image_filename='1.jpg', breed='Rough Collie',
+            age=36, gender='f', size='l', microchipped=True)
+        self.dog_2 = models.Dog.objects.create(
+            name='Laddie', image_filename='2.jpg', breed='Rough Collie',
+            age=24, gender='m', size='l', microchipped=True)
+        for user in self.users:
+            models.UserDog.objects.create(user_id=user.id, dog_id=self.dog_1.id, status='l')
+
+        self.client.force_authenticate(self.user)
+        self.client.delete(reverse('delete-dog', kwargs={'pk': self.dog_1.id}))
+
+    def test_archived_dog_hidden(self):
+        """
+        Ensure a deleted dog is archived and hidden straight away,
+        while its ratings stay until it is purged.
+        """
+        self.assertFalse(models.Dog.objects.get(id=self.dog_1.id).is_active)
+        self.assertEqual(models.UserDog.objects.filter(dog_id=self.dog_1.id).count(), 3)
+
+        response = self.client.get(reverse('get-next', kwargs={'status': 'liked', 'pk': -1}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(reverse('dog-collection', kwargs={'collection': 'liked'}))
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get(reverse('dog-search'), {'q': 'collie'})
+        self.assertEqual([dog['id'] for dog in response.data['results']], [self.dog_2.id])
+        response = self.client.delete(reverse('delete-dog', kwargs={'pk': self.dog_1.id}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_archived_dog_skipped_in_queue(self):
+        """
+        Ensure an archived dog still in a queue is skipped.
+        """
+        models.UserDog.objects.filter(user_id=self.user.id, dog_id=self.dog_1.id).update(status='u')
+        models.MatchQueue.objects.create(user_id=self.user.id, dog_id=self.dog_1.id)
+        for pk in (-1, self.dog_2.id):
+            response = self.client.get(reverse('get-next', kwargs={'status': 'undecided', 'pk': pk}))
+            self.assertEqual(response.data['id'], self.dog_2.id)
+
+    def test_purge(self):
+        """
+        Ensure purging removes an archived dog's ratings in batches,
+        takes them off the counts and then deletes the dog.
+        """
+        self.assertEqual(ratings.get_count(self.user.id, 'liked'), 1)
+        with mock.patch('pugorugh.matching.refresh_queue') as refresh_queue, \
+                mock.patch('pugorugh.ratings.change_counts', wraps=ratings.change_counts) as change_counts:
+            self.assertEqual(archive.purge_dog(self.dog_1.id, batch_size=2), 3)
+        # Once per batch, not once per rating
+        refresh_queue.assert_not_called()
+        self.assertEqual(change_counts.call_count, 2)
+
+        self.assertFalse(models.Dog.objects.filter(id=self.dog_1.id).exists())
+        self.assertFalse(models.UserDog.objects.filter(dog_id=self.dog_1.id).exists())
+        for user in self.users:
+            self.assertEqual(ratings.get_count(user.id, 'liked'), 0)
+
+    def test_purge_command(self):
+        """
+        Ensure the command purges every archived dog and leaves the rest.
+        """
+        call_command('purge_archived_dogs', pause=0, stdout=open(os.devnull, 'w'))
+        self.assertEqual(list(models.Dog.objects.values_list('id', flat=True)), [self.dog_2.id])
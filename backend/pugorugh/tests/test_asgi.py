@@ -0,0 +1,83 @@
+import asyncio
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TransactionTestCase
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+
+from pugorugh import asgi, models
+
+
+class ASGITests(TransactionTestCase):
+    """
+    The handler serves requests from other threads, which only see
+    committed rows, hence TransactionTestCase.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('fred', 'jones@scooby-doo.com', 'fredpassword')
+        self.token = Token.objects.create(user=self.user).key
+        models.UserPref.objects.create(
+            age='b,y,a,s',
+            gender='m,f',
+            size='s,m,l,xl',
+            user_id=self.user.id)
+        self.dog = models.Dog.objects.create(
+            name='Scooby', image_filename='1.jpg', breed='Great Dane',
+            age=84, gender='m', size='xl', microchipped=True)
+        self.application = asgi.get_asgi_application()
+
+    def request(self, path, method='GET'):
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': method,
+            'scheme': 'http',
+            'path': path,
+            'query_string': b'',
+            'headers': [(b'host', b'testserver'), (b'authorization', ('Token ' + self.token).encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('testserver', 80),
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(self.application(scope, receive, send))
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        return messages[0]['status'], body
+
+    def test_async_reads(self):
+        """
+        Ensure the next dog and the user's preferences are served by the
+        async handler, off the thread-sensitive executor.
+        """
+        with mock.patch.object(asgi.APIHandler, 'get_read_response', autospec=True,
+                               side_effect=asgi.APIHandler.get_read_response) as get_read_response, \
+                mock.patch.object(asgi, 'sync_to_async', wraps=asgi.sync_to_async) as to_async:
+            status, body = self.request(reverse('get-next', kwargs={'status': 'undecided', 'pk': -1}))
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['id'], self.dog.id)
+
+            status, body = self.request(reverse('user-prefs'))
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['size'], 's,m,l,xl')
+        self.assertEqual(get_read_response.call_count, 2)
+        self.assertEqual(to_async.call_args_list, [mock.call(mock.ANY, thread_sensitive=False)] * 2)
+
+    def test_other_requests(self):
+        """
+        Ensure other requests are served as Django serves them.
+        """
+        with mock.patch.object(asgi.APIHandler, 'get_read_response') as get_read_response:
+            status, body = self.request(reverse('dog-collection', kwargs={'collection': 'liked'}))
+            self.assertEqual(status, 200)
+            status, body = self.request(reverse('user-prefs'), method='PUT')
+            self.assertEqual(status, 400)
+        get_read_response.assert_not_called()
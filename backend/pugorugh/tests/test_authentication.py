@@ -0,0 +1,71 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APITestCase
+
+from pugorugh import models
+from pugorugh.authentication import token_cache
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('velma', 'dinkley@scooby-doo.com', 'velmapassword')
+        self.token = Token.objects.create(user=self.user)
+        models.UserPref.objects.create(
+            age='b,y,a,s',
+            gender='m,f',
+            size='s,m,l,xl',
+            user_id=self.user.id)
+        self.url = reverse('user-prefs')
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def test_token_cached(self):
+        """
+        Ensure that the Token / User lookup is only made on the first request,
+        the preferences are cached after it too.
+        """
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_shared_cache(self):
+        """
+        Ensure that a token is found in the shared cache by another worker.
+        """
+        self.client.get(self.url)
+        token_cache.clear()
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_CACHE_ALIAS='default')
+    def test_deleted_token(self):
+        """
+        Ensure that a deleted token is no longer accepted.
+        """
+        self.client.get(self.url)
+        self.token.delete()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user(self):
+        """
+        Ensure that a deactivated user's token is no longer accepted.
+        """
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,83 @@
+import random
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from pugorugh import benchmark, models
+
+
+class BenchmarkTests(TestCase):
+    def test_generate_data(self):
+        """
+        Ensure the synthetic data is created at the requested sizes.
+        """
+        user_ids = benchmark.generate_data(dogs=50, users=5, ratings=10)
+        self.assertEqual(len(user_ids), 5)
+        self.assertEqual(models.Dog.objects.count(), 50)
+        self.assertEqual(models.UserPref.objects.count(), 5)
+        self.assertEqual(models.UserDog.objects.count(), 50)
+        self.assertFalse(models.Dog.objects.filter(age_bucket='').exists())
+
+    def test_run_benchmark(self):
+        """
+        Ensure a benchmark run reports percentiles for each endpoint.
+        """
+        user_ids = benchmark.generate_data(dogs=50, users=5, ratings=10)
+        results = benchmark.run_benchmark(user_ids, sessions=2, swipes=5, bulk=5)
+
+        self.assertEqual(results['bulk_comparison']['entries'], 5)
+        for name in ('insert', 'update'):
+            self.assertGreater(results['bulk_comparison'][name]['bulk_call_ms'], 0)
+        for name in ('user-prefs', 'get-next', 'set-status'):
+            self.assertIn(name, results['endpoints'])
+            self.assertLessEqual(results['endpoints'][name]['p50_ms'], results['endpoints'][name]['p99_ms'])
+
+        # Scan cost is compared too when it is not zero
+        line = benchmark.compare(results, results)[0]
+        self.assertGreaterEqual(line.count('+0.0%'), 4)
+        self.assertEqual(line.count('+0.0%'), line.count('%'))
+
+    def test_bulk_comparison_like_for_like(self):
+        """
+        Ensure the single calls and the bulk call rate different dogs the
+        user had not rated, inserting then updating the same number of rows.
+        """
+        user_ids = benchmark.generate_data(dogs=50, users=1, ratings=10)
+        recorder = benchmark.Recorder()
+        recorder.client = APIClient()
+        recorder.client.force_authenticate(User.objects.get(id=user_ids[0]))
+        rated = set(models.UserDog.objects.values_list('dog_id', flat=True))
+
+        results = benchmark.run_bulk_comparison(recorder, user_ids[0], 5, random.Random(0))
+        self.assertEqual(results['entries'], 5)
+        self.assertEqual(len(recorder.samples['set-status-single']), 10)
+        self.assertEqual(len(recorder.samples['bulk-status']), 2)
+        new = models.UserDog.objects.exclude(dog_id__in=rated)
+        self.assertEqual(new.count(), 10)
+        self.assertEqual(set(new.values_list('status', flat=True)), {'d'})
+
+    def test_compare_scan_cost(self):
+        """
+        Ensure the scan cost is compared between runs measured in the same unit.
+        """
+        endpoint = {'p50_ms': 2, 'p95_ms': 4, 'p99_ms': 8, 'queries_per_request': 3}
+        previous = {'scan_cost_unit': 'rows_read',
+                    'endpoints': {'get-next': dict(endpoint, scan_cost_per_request=200)}}
+        current = {'scan_cost_unit': 'rows_read',
+                   'endpoints': {'get-next': dict(endpoint, scan_cost_per_request=50)}}
+
+        self.assertIn('scan_cost_per_request -75.0%', benchmark.compare(previous, current)[0])
+        current['scan_cost_unit'] = 'vm_steps_k'
+        self.assertNotIn('scan_cost_per_request', benchmark.compare(previous, current)[0])
+
+    def test_run_validation_benchmark(self):
+        """
+        Ensure the validation benchmark times each validator over the rows.
+        """
+        rows = benchmark.generate_rows(200)
+        results = benchmark.run_validation_benchmark(rows, serializer_rows=50)
+
+        self.assertEqual(results['validate_dog']['rows'], 200)
+        self.assertEqual(results['serializer']['rows'], 50)
+        self.assertGreater(results['invalid_rows'], 0)
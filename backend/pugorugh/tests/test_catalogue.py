@@ -0,0 +1,143 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from pugorugh import catalogue, matching, models, preferences
+from pugorugh.tests.utils import create_dogs
+
+
+#  The fields given for each dog passed to create_dogs
+DOG_FIELDS = ('gender', 'size', 'age', 'microchipped')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class CatalogueTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        catalogue.index.reset()
+        self.user = User.objects.create_user('daphne', 'blake@scooby-doo.com', 'daphnepassword')
+        models.UserPref.objects.create(age='b,y', gender='f', size='s,m', microchipped='y', user_id=self.user.id)
+        self.dogs = create_dogs(DOG_FIELDS, [
+            ('f', 's', 6, True), ('f', 'm', 12, True), ('m', 's', 6, True), ('f', 'xl', 6, True),
+            ('f', 's', 96, True), ('f', 's', 6, False), ('f', 'm', 6, True), ('f', 's', 12, True),
+        ])
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[0].id, status='l')
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[1].id, status='u')
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[6].id, status='u', blacklist=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bitmaps(self):
+        """
+        Ensure ids pack into bitmaps and come back out in order after pk,
+        looping back around to the first.
+        """
+        bitmap = catalogue.to_bitmap([9, 2, 10000, 64])
+        self.assertEqual(bitmap, (1 << 2) | (1 << 9) | (1 << 64) | (1 << 10000))
+        self.assertEqual(catalogue.to_bitmap([]), 0)
+        self.assertEqual(catalogue.next_ids(bitmap, -1, count=10), [2, 9, 64, 10000])
+        self.assertEqual(catalogue.next_ids(bitmap, 9, count=3), [64, 10000, 2])
+        self.assertEqual(catalogue.next_ids(bitmap, 64, count=10), [10000, 2, 9, 64])
+        self.assertEqual(catalogue.next_ids(bitmap, 10000), [2])
+        self.assertEqual(catalogue.next_ids(bitmap, 20000), [2])
+        self.assertEqual(catalogue.next_ids(0, -1), [])
+
+    def test_match(self):
+        """
+        Ensure the index matches the same undecided dogs as the database.
+        """
+        for microchipped in ('y', 'n', 'e'):
+            models.UserPref.objects.filter(user_id=self.user.id).update(microchipped=microchipped)
+            prefs = preferences.parse(models.UserPref.objects.get(user_id=self.user.id))
+            expected = list(matching.undecided_dogs(prefs).order_by('id').values_list('id', flat=True))
+            self.assertTrue(expected)
+            dog_ids = catalogue.next_ids(
+                catalogue.get_index().match(prefs, catalogue.rated_bitmap(self.user.id)), -1, count=10)
+            self.assertEqual(dog_ids, expected)
+
+    def test_set(self):
+        """
+        Ensure dogs can be moved between values and removed.
+        """
+        dog_index = catalogue.DogIndex()
+        dog_index.set(3, {'gender': 'f', 'size': 's', 'age_bucket': 'b', 'microchipped': True})
+        dog_index.set(3, {'gender': 'm', 'size': 's', 'age_bucket': 'b', 'microchipped': True})
+        self.assertEqual(dog_index.bitmaps['gender'], {'f': 0, 'm': 1 << 3})
+        dog_index.set(3)
+        self.assertEqual(dog_index.active, 0)
+        self.assertEqual(dog_index.bitmaps['size'], {'s': 0})
+
+    @override_settings(DOG_CATALOGUE_INDEX=True)
+    def test_get_next(self):
+        """
+        Ensure the next undecided dogs come from the index, in two queries.
+        """
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], self.dogs[1].id)
+
+        response = self.client.get(url, {'count': 3})
+        self.assertEqual([dog['id'] for dog in response.data], [self.dogs[1].id, self.dogs[7].id])
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': self.dogs[7].id})
+        self.assertEqual(self.client.get(url).data['id'], self.dogs[1].id)
+
+    @override_settings(DOG_CATALOGUE_INDEX=True)
+    def test_get_next_skips_queue(self):
+        """
+        Ensure serving from the index leaves an unbuilt match queue unbuilt.
+        """
+        models.UserPref.objects.filter(user_id=self.user.id).update(match_queue_built=False)
+        models.MatchQueue.objects.all().delete()
+        preferences.invalidate(self.user.id)
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+        self.assertEqual(self.client.get(url).data['id'], self.dogs[1].id)
+        self.assertFalse(models.UserPref.objects.get(user_id=self.user.id).match_queue_built)
+        self.assertFalse(models.MatchQueue.objects.exists())
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   DOG_CATALOGUE_INDEX=True)
+class CatalogueRefreshTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        catalogue.index.reset()
+
+    def test_patched(self):
+        """
+        Ensure saved, archived and deleted dogs are patched into this
+        process's index without reloading it.
+        """
+        dog_1, dog_2 = create_dogs(DOG_FIELDS, [('f', 's', 6, True), ('m', 'l', 6, False)])
+        dog_index = catalogue.get_index()
+        version = dog_index.version
+
+        dog_1.size = 'xl'
+        dog_1.save()
+        dog_3, = create_dogs(DOG_FIELDS, [('f', 'm', 12, True)])
+        dog_2.is_active = False
+        dog_2.save()
+        dog_3.delete()
+
+        self.assertEqual(dog_index.version, version + 4)
+        self.assertIs(catalogue.get_index(), dog_index)
+        self.assertEqual(dog_index.active, 1 << dog_1.id)
+        self.assertEqual(dog_index.bitmaps['size'], {'s': 0, 'l': 0, 'xl': 1 << dog_1.id, 'm': 0})
+
+    def test_reloaded(self):
+        """
+        Ensure a change made by another process makes this one reload.
+        """
+        dog_1, = create_dogs(DOG_FIELDS, [('f', 's', 6, True)])
+        dog_index = catalogue.get_index()
+        models.Dog.objects.filter(id=dog_1.id).update(gender='m')  # Skips the receivers
+        self.assertEqual(catalogue.get_index().bitmaps['gender'], {'f': 1 << dog_1.id})
+
+        catalogue.invalidate()
+        self.assertEqual(catalogue.get_index().bitmaps['gender'], {'m': 1 << dog_1.id})
+        self.assertEqual(dog_index.version, catalogue.get_version(cache))
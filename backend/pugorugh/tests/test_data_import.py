@@ -0,0 +1,145 @@
+import json
+import os
+import shutil
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import mock
+
+from django.test import TestCase
+
+from pugorugh import jobs, models
+from pugorugh.scripts import data_import
+
+
+def decoded(rows):
+    return [('invalid', row.data) if isinstance(row, data_import.InvalidRow) else row for row in rows]
+
+
+class ReaderTests(TestCase):
+    def test_json(self):
+        """
+        Ensure JSON array items are read whole across reads, strings
+        included, and items that can't be decoded are passed on as invalid.
+        """
+        text = '[1, 23456789, {"name": "Rex \\"],}", "age": [1, 2]}, {bad}, {"name": "Fido"}]'
+        with mock.patch.object(data_import, 'READ_SIZE', 4):
+            rows = decoded(data_import.read_json(StringIO(text)))
+        self.assertEqual(rows, [1, 23456789, {'name': 'Rex "],}', 'age': [1, 2]}, ('invalid', '{bad}'),
+                                {'name': 'Fido'}])
+
+        self.assertEqual(decoded(data_import.read_json(StringIO('[{"name": "Rex"}, {"na'))),
+                         [{'name': 'Rex'}, ('invalid', '{"na')])
+        self.assertEqual(list(data_import.read_json(StringIO(' [ ] '))), [])
+        with self.assertRaises(ValueError):
+            list(data_import.read_json(StringIO('{"name": "Rex"}')))
+
+    def test_ndjson(self):
+        """
+        Ensure each line is read as an object, skipping blank lines.
+        """
+        rows = decoded(data_import.read_ndjson(StringIO('{"name": "Rex"}\n\n{bad}\n{"name": "Fido"}\n')))
+        self.assertEqual(rows, [{'name': 'Rex'}, ('invalid', '{bad}'), {'name': 'Fido'}])
+
+    def test_csv(self):
+        """
+        Ensure each row is read as a dict keyed by the header row.
+        """
+        rows = list(data_import.read_csv(StringIO('name,age\nRex,12\n"Fido, Jr",3\n')))
+        self.assertEqual(rows, [{'name': 'Rex', 'age': '12'}, {'name': 'Fido, Jr', 'age': '3'}])
+
+
+class LoadDataTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def load(self, name, text, **kwargs):
+        filepath = os.path.join(self.directory, name)
+        with open(filepath, 'w', encoding='utf-8') as file:
+            file.write(text)
+        with redirect_stdout(StringIO()) as out:
+            data_import.load_data(filepath, **kwargs)
+        return out.getvalue()
+
+    def test_chunks(self):
+        """
+        Ensure dogs are created, then updated on their image filename
+        as they have no import_key,
+        a chunk at a time, with invalid rows written to the error file.
+        """
+        rows = [
+            {'name': 'Dog {}'.format(number), 'image_filename': '{}.jpg'.format(number), 'breed': 'Pug',
+             'age': number, 'gender': 'f', 'size': 's'}
+            for number in range(1, 6)
+        ]
+        text = '\n'.join(json.dumps(row) for row in rows) + '\n{bad}\n{"name": "Rex"}\n'
+        out = self.load('dogs.ndjson', text, chunk_size=2)
+        self.assertIn('7 rows: 5 created, 0 updated, 2 errors', out)
+        self.assertEqual(models.Dog.objects.count(), 5)
+        self.assertEqual(models.Dog.objects.get(image_filename='3.jpg').age_bucket, 'b')
+
+        with open(os.path.join(self.directory, 'dogs.ndjson.errors.ndjson')) as file:
+            errors = [json.loads(line) for line in file]
+        self.assertEqual([(error['row'], error['data']) for error in errors], [(6, '{bad}'), (7, {'name': 'Rex'})])
+        self.assertIn('image_filename', errors[1]['errors'])
+
+        out = self.load('dogs.csv', 'name,image_filename,age,gender,size\nRenamed,3.jpg,30,f,s\n')
+        self.assertIn('1 rows: 0 created, 1 updated, 0 errors', out)
+        dog = models.Dog.objects.get(image_filename='3.jpg')
+        self.assertEqual((dog.name, dog.age_bucket), ('Renamed', 'a'))
+        self.assertEqual(models.Dog.objects.count(), 5)
+
+    def test_import_keys(self):
+        """
+        Ensure dogs are matched on their import_key, so dogs sharing an
+        image are kept apart, and that a row without a key is matched on
+        its image filename.
+        """
+        rows = [
+            {'import_key': 'rex', 'name': 'Rex', 'image_filename': 'dog.jpg', 'age': 12, 'gender': 'm', 'size': 'l'},
+            {'import_key': 7, 'name': 'Fido', 'image_filename': 'dog.jpg', 'age': 3, 'gender': 'm', 'size': 's'},
+            {'name': 'Lassie', 'image_filename': 'lassie.jpg', 'age': 30, 'gender': 'f', 'size': 'l'},
+            {'import_key': ['bad'], 'name': 'Odie', 'image_filename': 'odie.jpg', 'age': 3, 'gender': 'm', 'size': 's'},
+        ]
+        out = self.load('dogs.json', json.dumps(rows))
+        self.assertIn('4 rows: 3 created, 0 updated, 1 errors', out)
+        self.assertEqual(
+            sorted(models.Dog.objects.values_list('import_key', 'name')),
+            [('7', 'Fido'), ('lassie.jpg', 'Lassie'), ('rex', 'Rex')])
+
+        out = self.load('dogs.csv', 'import_key,name,image_filename,age,gender,size\n7,Fido Jr,dog.jpg,4,m,s\n')
+        self.assertIn('1 rows: 0 created, 1 updated, 0 errors', out)
+        self.assertEqual(models.Dog.objects.get(import_key='7').name, 'Fido Jr')
+
+    def test_concurrent_import(self):
+        """
+        Ensure a dog created by another import after the chunk looked for
+        it is updated on retry, rather than duplicated.
+        """
+        models.Dog.objects.create(
+            import_key='rex', name='Rex', image_filename='rex.jpg', age=12, gender='m', size='l')
+        filter = models.Dog.objects.filter
+        calls = []
+
+        def missing_once(*args, **kwargs):
+            calls.append(kwargs)
+            return models.Dog.objects.none() if len(calls) == 1 else filter(*args, **kwargs)
+
+        with mock.patch.object(models.Dog.objects, 'filter', side_effect=missing_once):
+            out = self.load('dogs.ndjson', json.dumps(
+                {'import_key': 'rex', 'name': 'Rex II', 'image_filename': 'rex.jpg', 'age': 2, 'gender': 'm', 'size': 'l'}))
+        self.assertIn('1 rows: 0 created, 1 updated, 0 errors', out)
+        self.assertEqual(list(models.Dog.objects.values_list('name', flat=True)), ['Rex II'])
+
+    def test_task(self):
+        """
+        Ensure the import_dogs job imports in the worker's own process.
+        """
+        filepath = os.path.join(self.directory, 'dogs.ndjson')
+        with open(filepath, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'name': 'Rex', 'image_filename': 'rex.jpg', 'age': 12, 'gender': 'm', 'size': 'l'}))
+        jobs.enqueue('import_dogs', file=filepath)
+        with redirect_stdout(StringIO()):
+            self.assertEqual(jobs.work(once=True), 1)
+        self.assertTrue(models.Dog.objects.filter(image_filename='rex.jpg').exists())
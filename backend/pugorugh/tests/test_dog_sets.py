@@ -0,0 +1,122 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from pugorugh import archive, dog_sets, models
+
+
+@override_settings(USER_DOG_SETS=True)
+class DogSetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('velma', 'dinkley@scooby-doo.com', 'velmapassword')
+        self.dogs = [
+            models.Dog.objects.create(
+                name='Dog {}'.format(number), image_filename='{}.jpg'.format(number), breed='Pug',
+                age=24, gender='f', size='s')
+            for number in range(1, 7)
+        ]
+        for dog in self.dogs[:4]:
+            models.UserDog.objects.create(user_id=self.user.id, dog_id=dog.id, status='l')
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[4].id, status='d', blacklist=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, name):
+        return list(dog_sets.get_sets(self.user.id)[name])
+
+    def test_built(self):
+        """
+        Ensure a user's sets are built from their ratings the first time
+        they are read, then stored.
+        """
+        self.assertFalse(models.UserDogSet.objects.exists())
+        self.assertEqual(self.ids('liked'), [dog.id for dog in self.dogs[:4]])
+        self.assertEqual(self.ids('blacklisted'), [self.dogs[4].id])
+        self.assertEqual(self.ids('disliked'), [])
+        with self.assertNumQueries(1):
+            dog_sets.get_sets(self.user.id)
+
+    def test_built_after_row_created(self):
+        """
+        Ensure the sets are built once their row exists, so a swipe made
+        meanwhile is either read by the build or patched in after it.
+        """
+        build = dog_sets.build
+
+        def swipe_then_build(user_id):
+            self.assertTrue(models.UserDogSet.objects.filter(user_id=user_id, built=False).exists())
+            self.client.put(reverse('set-status', kwargs={'pk': self.dogs[5].id, 'status': 'liked'}))
+            return build(user_id)
+
+        with mock.patch('pugorugh.dog_sets.build', side_effect=swipe_then_build):
+            self.assertEqual(self.ids('liked'), [dog.id for dog in self.dogs[:4]] + [self.dogs[5].id])
+        self.client.put(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'disliked'}))
+        self.assertEqual(self.ids('disliked'), [self.dogs[0].id])
+        self.assertEqual(dog_sets.check(), {})
+
+    def test_kept_in_sync(self):
+        """
+        Ensure status, blacklist and bulk writes move dogs between sets.
+        """
+        dog_sets.get_sets(self.user.id)
+        self.client.put(reverse('set-status', kwargs={'pk': self.dogs[1].id, 'status': 'disliked'}))
+        self.client.put(reverse('blacklist', kwargs={'pk': self.dogs[4].id, 'blacklist': 'false'}))
+        self.client.put(reverse('set-status', kwargs={'pk': self.dogs[5].id, 'status': 'undecided'}))
+        self.client.post(reverse('bulk-status'), [{'dog_id': self.dogs[0].id, 'blacklist': True}], format='json')
+        models.UserDog.objects.get(user_id=self.user.id, dog_id=self.dogs[3].id).delete()
+
+        self.assertEqual(self.ids('liked'), [self.dogs[2].id])
+        self.assertEqual(self.ids('disliked'), [self.dogs[1].id, self.dogs[4].id])
+        self.assertEqual(self.ids('undecided'), [self.dogs[5].id])
+        self.assertEqual(self.ids('blacklisted'), [self.dogs[0].id])
+        self.assertEqual(dog_sets.check(), {})
+
+    def test_get_next(self):
+        """
+        Ensure the next liked dogs are read from the user's set in order,
+        looping back around and skipping archived dogs.
+        """
+        dog_sets.get_sets(self.user.id)
+        archive.archive_dog(self.dogs[2])
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': self.dogs[0].id})
+        with self.assertNumQueries(3):  # The sets, then two lookups to skip the archived dog
+            response = self.client.get(url, {'count': 3})
+        self.assertEqual([dog['id'] for dog in response.data],
+                         [self.dogs[1].id, self.dogs[3].id, self.dogs[0].id])
+
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': self.dogs[3].id})
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], self.dogs[0].id)
+
+    def test_purged(self):
+        """
+        Ensure purging an archived dog takes it out of the sets.
+        """
+        dog_sets.get_sets(self.user.id)
+        archive.archive_dog(self.dogs[0])
+        archive.purge_archived()
+        self.assertEqual(self.ids('liked'), [dog.id for dog in self.dogs[1:4]])
+
+    def test_check(self):
+        """
+        Ensure the checker reports sets that drifted from UserDog and fixes them.
+        """
+        dog_sets.get_sets(self.user.id)
+        # update() skips the receivers, leaving the sets behind
+        models.UserDog.objects.filter(dog_id=self.dogs[0].id).update(status='d')
+
+        out = StringIO()
+        call_command('check_dog_sets', stdout=out)
+        self.assertIn('User {} liked: 0 missing, 1 unexpected'.format(self.user.id), out.getvalue())
+        self.assertIn('User {} disliked: 1 missing, 0 unexpected'.format(self.user.id), out.getvalue())
+        self.assertEqual(self.ids('liked'), [dog.id for dog in self.dogs[:4]])
+
+        call_command('check_dog_sets', '--fix', '--user', str(self.user.id), stdout=StringIO())
+        self.assertEqual(self.ids('disliked'), [self.dogs[0].id])
+        self.assertEqual(dog_sets.check(), {})
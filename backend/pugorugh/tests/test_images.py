@@ -0,0 +1,93 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+from PIL import Image
+
+from pugorugh import images, models
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.image_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.image_dir)
+        for patcher in (
+                mock.patch.object(images, 'IMAGE_DIR', self.image_dir),
+                mock.patch.object(images, 'VARIANT_DIR', os.path.join(self.image_dir, 'variants')),
+                mock.patch.dict(images.manifest_cache, {'mtime': None, 'checked': 0.0, 'entries': {}})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        Image.new('RGB', (1000, 800), 'brown').save(os.path.join(self.image_dir, 'rex.jpg'))
+
+    def test_build_variants(self):
+        """
+        Ensure a WebP variant is built at each width, and only rebuilt
+        when the source image changes.
+        """
+        filename, variants = images.build_variants('rex.jpg')
+        self.assertEqual(set(variants), set(images.VARIANTS))
+        card, width = variants['card']
+        self.assertTrue(card.endswith('-card.webp'))
+        with Image.open(os.path.join(images.VARIANT_DIR, card)) as variant:
+            self.assertEqual(variant.format, 'WEBP')
+            self.assertEqual(variant.size, (width, 384))
+
+        self.assertEqual(images.build_variants('rex.jpg')[1], variants)
+        Image.new('RGB', (1000, 800), 'black').save(os.path.join(self.image_dir, 'rex.jpg'))
+        self.assertNotEqual(images.build_variants('rex.jpg')[1]['card'], variants['card'])
+
+    def test_missing_image(self):
+        """
+        Ensure there are no variants or srcset for a missing image.
+        """
+        self.assertEqual(images.build_variants('missing.jpg'), ('missing.jpg', None))
+        self.assertEqual(images.get_srcset('missing.jpg'), '')
+
+    def test_outside_image_dir(self):
+        """
+        Ensure images outside IMAGE_DIR are never read or written beside.
+        """
+        outside = os.path.join(os.path.dirname(self.image_dir), 'outside-{}.jpg'.format(os.getpid()))
+        Image.new('RGB', (10, 10)).save(outside)
+        self.addCleanup(os.remove, outside)
+        self.assertEqual(images.build_variants(os.path.join('..', os.path.basename(outside))),
+                         (os.path.join('..', os.path.basename(outside)), None))
+        self.assertFalse(os.path.exists(images.VARIANT_DIR))
+
+    def test_command_and_srcset(self):
+        """
+        Ensure the command records every dog's variants in the manifest
+        and that the srcset lists them from narrowest to widest.
+        """
+        models.Dog.objects.create(
+            name='Rex', image_filename='rex.jpg', breed='Boxer',
+            age=12, gender='m', size='m', microchipped=True)
+        call_command('build_image_variants', workers=1, stdout=open(os.devnull, 'w'))
+
+        srcset = images.get_srcset('rex.jpg').split(', ')
+        self.assertEqual(len(srcset), 2)
+        self.assertTrue(srcset[0].startswith(images.VARIANT_URL) and srcset[0].endswith(' 160w'))
+        self.assertTrue(srcset[1].endswith(' 480w'))
+
+    def test_manifest_checked_per_interval(self):
+        """
+        Ensure the manifest is checked for changes once per interval rather
+        than once per dog, and a manifest rewritten by another process is
+        picked up after it.
+        """
+        images.update_manifest([('rex.jpg', {'card': ('rex-a-card.webp', 480)})])
+        with mock.patch('pugorugh.images.os.path.getmtime', wraps=os.path.getmtime) as getmtime:
+            for dog in range(10):
+                self.assertEqual(images.get_srcset('rex.jpg'), images.VARIANT_URL + 'rex-a-card.webp 480w')
+        self.assertEqual(getmtime.call_count, 1)
+
+        with open(images.manifest_path(), 'w') as file:
+            json.dump({'rex.jpg': {'card': ['rex-b-card.webp', 480]}}, file)
+        os.utime(images.manifest_path(), (0, 0))
+        self.assertEqual(images.get_srcset('rex.jpg'), images.VARIANT_URL + 'rex-a-card.webp 480w')
+        with mock.patch.object(images, 'MANIFEST_CHECK_INTERVAL', 0):
+            self.assertEqual(images.get_srcset('rex.jpg'), images.VARIANT_URL + 'rex-b-card.webp 480w')
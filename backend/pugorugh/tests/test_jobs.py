@@ -0,0 +1,207 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from pugorugh import jobs, models
+
+calls = []
+
+
+@jobs.task(name='test_record', max_attempts=3)
+def record(value):
+    calls.append(value)
+    if value == 'fail':
+        raise ValueError('Failed')
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue(self):
+        """
+        Ensure jobs with the same idempotency key are only queued once.
+        """
+        job = jobs.enqueue('test_record', key='record:1', value='a')
+        self.assertEqual(jobs.enqueue('test_record', key='record:1', value='b'), job)
+        jobs.enqueue('test_record', value='c')
+        self.assertEqual(models.Job.objects.count(), 2)
+        with self.assertRaises(ValueError):
+            jobs.enqueue('missing')
+
+        self.assertEqual(jobs.work(once=True), 2)
+        self.assertEqual(calls, ['a', 'c'])
+        self.assertEqual(models.Job.objects.get(id=job.id).status, models.Job.DONE)
+        jobs.enqueue('test_record', key='record:1', value='a')
+        self.assertEqual(jobs.work(once=True), 0)
+
+    def test_enqueue_failed(self):
+        """
+        Ensure a failed job's idempotency key queues it again.
+        """
+        job = jobs.enqueue('test_record', key='record:1', value='fail')
+        models.Job.objects.filter(id=job.id).update(status=models.Job.FAILED, attempts=3, error='Failed')
+
+        requeued = jobs.enqueue('test_record', key='record:1', value='b')
+        self.assertEqual(requeued.id, job.id)
+        self.assertEqual((requeued.status, requeued.attempts, requeued.error), (models.Job.PENDING, 0, ''))
+        self.assertEqual(jobs.work(once=True), 1)
+        self.assertEqual(calls, ['b'])
+
+    def test_retries(self):
+        """
+        Ensure a failing job is retried after a growing backoff, then given up on.
+        """
+        job = jobs.enqueue('test_record', value='fail')
+        for attempt in range(1, 4):
+            started = timezone.now()
+            self.assertEqual(jobs.work(once=True), 1)
+            job.refresh_from_db()
+            self.assertEqual(job.attempts, attempt)
+            self.assertIn('ValueError: Failed', job.error)
+            if attempt < 3:
+                self.assertEqual(job.status, models.Job.PENDING)
+                self.assertGreaterEqual(job.run_after, started + jobs.backoff(attempt))
+                self.assertEqual(jobs.work(once=True), 0)  # Not due yet
+                models.Job.objects.filter(id=job.id).update(run_after=started)
+        self.assertEqual(job.status, models.Job.FAILED)
+        self.assertEqual(len(calls), 3)
+
+    def test_lease(self):
+        """
+        Ensure a job is taken by one worker at a time, and by another once
+        the first lets its lease run out.
+        """
+        job = jobs.enqueue('test_record', value='a')
+        self.assertEqual(jobs.claim(), job)
+        self.assertIsNone(jobs.claim())
+
+        models.Job.objects.filter(id=job.id).update(run_after=timezone.now() - timedelta(seconds=1))
+        claimed = jobs.claim()
+        self.assertEqual(claimed.attempts, 2)
+        self.assertTrue(jobs.run(claimed))
+
+    def test_lease_taken_over(self):
+        """
+        Ensure a worker whose lease was taken over does not mark the job
+        done or failed under the attempt that took it.
+        """
+        job = jobs.enqueue('test_record', value='a')
+        first = jobs.claim()
+        models.Job.objects.filter(id=job.id).update(run_after=timezone.now() - timedelta(seconds=1))
+        second = jobs.claim()
+
+        self.assertTrue(jobs.run(first))
+        first.kwargs = '{"value": "fail"}'
+        self.assertFalse(jobs.run(first))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.error), (models.Job.RUNNING, 2, ''))
+
+        self.assertTrue(jobs.run(second))
+        job.refresh_from_db()
+        self.assertEqual(job.status, models.Job.DONE)
+
+    def test_lease_last_attempt(self):
+        """
+        Ensure a job whose lease runs out on its last attempt is failed, not run again.
+        """
+        job = models.Job.objects.create(name='test_record', kwargs='{"value": "a"}', max_attempts=1,
+                                        run_after=timezone.now())
+        self.assertEqual(jobs.claim(), job)
+        models.Job.objects.filter(id=job.id).update(run_after=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(jobs.work(once=True), 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (models.Job.FAILED, 1))
+        self.assertEqual(calls, [])
+
+    def test_heartbeat(self):
+        """
+        Ensure a running job's lease is renewed until it finishes.
+        """
+        job = jobs.enqueue('test_record', value='a')
+        claimed = jobs.claim()
+        models.Job.objects.filter(id=job.id).update(run_after=timezone.now())
+        stop = mock.Mock(wait=mock.Mock(side_effect=[False, True]))
+        with mock.patch('pugorugh.jobs.connections'):
+            jobs.heartbeat(claimed, stop)
+        self.assertGreater(models.Job.objects.get(id=job.id).run_after, timezone.now() + timedelta(seconds=200))
+
+    def test_delete_finished(self):
+        """
+        Ensure run_jobs deletes old finished jobs and runs due ones.
+        """
+        old = jobs.enqueue('test_record', value='a')
+        models.Job.objects.filter(id=old.id).update(
+            status=models.Job.DONE, updated=timezone.now() - timedelta(days=8))
+        jobs.enqueue('test_record', value='b')
+
+        out = StringIO()
+        call_command('run_jobs', '--once', '--workers', '1', stdout=out)
+        self.assertEqual(out.getvalue(), 'Deleted 1 finished jobs\nRan 1 jobs\n')
+        self.assertEqual(calls, ['b'])
+
+
+@override_settings(BACKGROUND_JOBS=True)
+class OffloadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('scooby', 'doo@scooby-doo.com', 'scoobypassword')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.dog = models.Dog.objects.create(
+            name='Francesca', image_filename='1.jpg', breed='Labrador', age=72, gender='f', size='l')
+        jobs.work(once=True)
+
+    def test_preferences(self):
+        """
+        Ensure saving preferences queues the match queue rebuild.
+        """
+        response = self.client.put(
+            reverse('user-prefs'), {'age': 'a,s', 'gender': 'f', 'size': 'l', 'microchipped': 'e'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(models.MatchQueue.objects.exists())
+        # One job for the created preferences and one for the update, the first is skipped
+        self.assertEqual(set(models.Job.objects.filter(status=models.Job.PENDING).values_list('name', flat=True)),
+                         {'rebuild_queue'})
+
+        jobs.work(once=True)
+        self.assertEqual(list(models.MatchQueue.objects.values_list('dog_id', flat=True)), [self.dog.id])
+        self.assertTrue(models.UserPref.objects.get(user_id=self.user.id).match_queue_built)
+
+    def test_add_and_delete_dog(self):
+        """
+        Ensure adding a dog queues its image variants and queue updates,
+        and deleting it queues its purge.
+        """
+        models.UserPref.objects.create(age='b,y,a,s', gender='m,f', size='s,m,l,xl', user_id=self.user.id)
+        jobs.work(once=True)
+
+        with mock.patch('pugorugh.images.build_variants', return_value=('2.jpg', None)) as build_variants:
+            response = self.client.post(reverse('add-dog'), {
+                'name': 'Hank', 'image_filename': '2.jpg', 'breed': 'Pug', 'age': 14, 'gender': 'm', 'size': 's',
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            build_variants.assert_not_called()
+            dog_id = response.data['id']
+            self.assertFalse(models.MatchQueue.objects.filter(dog_id=dog_id).exists())
+
+            self.assertEqual(jobs.work(once=True), 2)
+            build_variants.assert_called_once_with('2.jpg')
+        self.assertTrue(models.MatchQueue.objects.filter(user_id=self.user.id, dog_id=dog_id).exists())
+
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=dog_id, status='l')
+        response = self.client.delete(reverse('delete-dog', kwargs={'pk': dog_id}))
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(models.Dog.objects.filter(id=dog_id).exists())
+
+        self.assertEqual(jobs.work(once=True), 1)
+        self.assertFalse(models.Dog.objects.filter(id=dog_id).exists())
+        self.assertFalse(models.UserDog.objects.filter(dog_id=dog_id).exists())
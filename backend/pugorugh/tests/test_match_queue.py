@@ -0,0 +1,106 @@
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+from django.contrib.auth.models import User
+
+from pugorugh import archive, models
+
+
+class MatchQueueTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('john', 'lennon@thebeatles.com', 'johnpassword')
+
+        self.user_prefs = models.UserPref.objects.create(
+            age='b,y,a,s',
+            gender='m,f',
+            size='s,m,l,xl',
+            user_id=self.user.id)
+
+        self.dog_1 = models.Dog.objects.create(
+            name='Francesca',
+            image_filename='1.jpg',
+            breed="Labrador",
+            age=72,
+            gender='f',
+            size='l',
+            microchipped=True
+        )
+
+        self.dog_2 = models.Dog.objects.create(
+            name='Hank',
+            image_filename='2.jpg',
+            breed="French Bulldog",
+            age=14,
+            gender='m',
+            size='s',
+            microchipped=True
+        )
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def queued_dogs(self):
+        return list(models.MatchQueue.objects.filter(
+            user=self.user).order_by('dog_id').values_list('dog_id', flat=True))
+
+    def test_queue_built_on_prefs_update(self):
+        """
+        Ensure that the queue is rebuilt when the preferences change.
+        """
+        self.assertEqual(self.queued_dogs(), [1, 2])
+
+        url = reverse('user-prefs')
+        data = {'age': 'y', 'gender': 'm', 'size': 's', 'microchipped': 'e'}
+        response = self.client.put(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.queued_dogs(), [2])
+
+    def test_queue_updated_on_rating(self):
+        """
+        Ensure that a rated dog leaves the queue and
+        returns when set back to undecided.
+        """
+        self.client.get(reverse('set-status', kwargs={'status': 'liked', 'pk': 1}))
+        self.assertEqual(self.queued_dogs(), [2])
+
+        self.client.get(reverse('set-status', kwargs={'status': 'undecided', 'pk': 1}))
+        self.assertEqual(self.queued_dogs(), [1, 2])
+
+        self.client.get(reverse('blacklist', kwargs={'blacklist': 'true', 'pk': 2}))
+        self.assertEqual(self.queued_dogs(), [1])
+
+    def test_queue_updated_on_add_delete(self):
+        """
+        Ensure that added dogs join the queue and deleted dogs leave it
+        once they are purged.
+        """
+        data = {
+            'name': 'Gnasher',
+            'image_filename': 'tripehound.jpg',
+            'breed': 'Wire-haired Tripehound',
+            'age': 76,
+            'gender': 'm',
+            'size': 'm',
+            'microchipped': False
+        }
+        response = self.client.post(reverse('add-dog'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.queued_dogs(), [1, 2, 3])
+
+        self.client.delete(reverse('delete-dog', kwargs={'pk': 1}))
+        archive.purge_archived()
+        self.assertEqual(self.queued_dogs(), [2, 3])
+
+    def test_queue_built_lazily(self):
+        """
+        Ensure that a queue is built on first use for
+        preferences saved before the queue existed.
+        """
+        models.MatchQueue.objects.all().delete()
+        models.UserPref.objects.filter(id=self.user_prefs.id).update(match_queue_built=False)
+
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], 2)
+        self.assertEqual(self.queued_dogs(), [1, 2])
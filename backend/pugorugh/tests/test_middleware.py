@@ -0,0 +1,63 @@
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APIClient
+
+from pugorugh import models
+from pugorugh.middleware import metrics
+
+
+class InstrumentationTests(APITestCase):
+    def setUp(self):
+        metrics.clear()
+        self.user = User.objects.create_user('fred', 'jones@scooby-doo.com', 'fredpassword')
+        models.Dog.objects.create(
+            name='Francesca',
+            image_filename='1.jpg',
+            breed="Labrador",
+            age=72,
+            gender='f',
+            size='l')
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_server_timing(self):
+        """
+        Ensure the timings and query counts are returned in a Server-Timing header.
+        """
+        url = reverse('set-status', kwargs={'status': 'liked', 'pk': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertRegex(response['Server-Timing'], r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries, 0 duplicates"$')
+
+    def test_metrics(self):
+        """
+        Ensure the requests are totalled per view in the Prometheus text format.
+        """
+        self.client.get(reverse('set-status', kwargs={'status': 'liked', 'pk': 1}))
+        self.client.get(reverse('set-status', kwargs={'status': 'disliked', 'pk': 1}))
+
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = response.content.decode()
+        self.assertIn('pugorugh_request_duration_seconds_count{view="SetStatus"} 2', content)
+        self.assertIn('pugorugh_duplicate_queries_total{view="SetStatus"} 0', content)
+
+    @override_settings(METRICS_ALLOWED_IPS=[])
+    def test_metrics_not_allowed(self):
+        """
+        Ensure the metrics are hidden from other addresses.
+        """
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(SLOW_REQUEST_MS=0, SLOW_REQUEST_SAMPLE_RATE=1)
+    def test_slow_request_log(self):
+        """
+        Ensure slow requests are logged with their SQL.
+        """
+        with self.assertLogs('pugorugh.slow_requests') as logs:
+            self.client.get(reverse('set-status', kwargs={'status': 'liked', 'pk': 1}))
+        self.assertIn('INSERT INTO "pugorugh_userdog"', logs.output[0])
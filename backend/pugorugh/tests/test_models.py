@@ -1,6 +1,9 @@
+from django.contrib.auth.models import User
+from django.db import IntegrityError
 from django.test import TestCase
 
-from pugorugh.models import Dog
+from pugorugh.models import Dog, UserDog, UserPref
+from pugorugh.utils import AGE_BITS, GENDER_BITS, SIZE_BITS, from_mask
 
 
 class MineralModelTests(TestCase):
@@ -22,3 +25,46 @@ class MineralModelTests(TestCase):
         self.assertEqual(new_dog.age, 42)
         self.assertEqual(new_dog.size, 's')
         self.assertEqual(new_dog.breed, 'Border Collie')
+        self.assertEqual(new_dog.age_bucket, 'a')
+
+
+class UserPrefModelTests(TestCase):
+    """Test the UserPref model."""
+    def test_masks(self):
+        """Test the bitmasks are derived from the stored preferences"""
+        user = User.objects.create_user('ringo', 'starr@thebeatles.com', 'ringopassword')
+        user_pref = UserPref.objects.create(user=user, age='b,s', gender='f', size='m,xl')
+        self.assertEqual(user_pref.age_mask, AGE_BITS['b'] | AGE_BITS['s'])
+        self.assertEqual(from_mask(user_pref.gender_mask, GENDER_BITS), ['f'])
+        self.assertEqual(from_mask(user_pref.size_mask, SIZE_BITS), ['m', 'xl'])
+
+
+class UserDogModelTests(TestCase):
+    """Test the UserDog model."""
+    def setUp(self):
+        self.user = User.objects.create_user('paul', 'mccartney@thebeatles.com', 'paulpassword')
+        self.dog = Dog.objects.create(
+            name="Patch",
+            image_filename="patch.jpg",
+            breed="Border Collie",
+            age=42,
+            gender='m',
+            size='s'
+        )
+
+    def test_upsert(self):
+        """Test upsert inserts a new row then updates it in place"""
+        row = {'user_id': self.user.id, 'dog_id': self.dog.id, 'status': 'l', 'blacklist': False}
+        UserDog.objects.upsert([row], update_fields=['status'])
+        UserDog.objects.upsert([dict(row, status='d', blacklist=True)], update_fields=['status'])
+
+        entry = UserDog.objects.get(user=self.user, dog=self.dog)
+        self.assertEqual(UserDog.objects.count(), 1)
+        self.assertEqual(entry.status, 'd')
+        self.assertEqual(entry.blacklist, False)
+
+    def test_unique_user_dog(self):
+        """Test only one UserDog can exist per user and dog"""
+        UserDog.objects.create(user=self.user, dog=self.dog, status='l')
+        with self.assertRaises(IntegrityError):
+            UserDog.objects.create(user=self.user, dog=self.dog, status='d')
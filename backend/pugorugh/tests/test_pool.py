@@ -0,0 +1,81 @@
+import os
+import sqlite3
+import tempfile
+import time
+
+from django.db import connection
+from django.db.utils import OperationalError, load_backend
+from django.test import SimpleTestCase
+
+from pugorugh.db.pool import ConnectionPool
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def connect(self):
+        return sqlite3.connect(':memory:', check_same_thread=False)
+
+    def check(self, connection):
+        return True
+
+    def test_reuse(self):
+        """
+        Ensure a released connection is handed out again.
+        """
+        pool = ConnectionPool(size=2)
+        first = pool.acquire(self.connect, self.check)
+        pool.release(first)
+        self.assertIs(pool.acquire(self.connect, self.check), first)
+        self.assertEqual(pool.open, 1)
+
+    def test_size_and_timeout(self):
+        """
+        Ensure no more than size connections are opened, and that
+        waiting for one times out.
+        """
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.acquire(self.connect, self.check)
+        with self.assertRaises(OperationalError):
+            pool.acquire(self.connect, self.check)
+
+    def test_max_age(self):
+        """
+        Ensure connections are recycled once they reach their max age.
+        """
+        pool = ConnectionPool(max_age=0)
+        first = pool.acquire(self.connect, self.check)
+        pool.release(first)
+        self.assertEqual(pool.open, 0)
+        self.assertIsNot(pool.acquire(self.connect, self.check), first)
+
+    def test_health_check(self):
+        """
+        Ensure an idle connection that fails its check is replaced.
+        """
+        pool = ConnectionPool(check_after=0)
+        first = pool.acquire(self.connect, self.check)
+        pool.release(first)
+        time.sleep(0.001)
+        second = pool.acquire(self.connect, lambda connection: False)
+        self.assertIsNot(second, first)
+        self.assertEqual(pool.open, 1)
+
+
+class PooledBackendTests(SimpleTestCase):
+    def test_connection_returned_to_pool(self):
+        """
+        Ensure the pooled backend reuses its connection after Django closes it.
+        """
+        handle, name = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        self.addCleanup(os.remove, name)
+
+        settings_dict = dict(connection.settings_dict, NAME=name, POOL={'SIZE': 1})
+        wrapper = load_backend('pugorugh.db.backends.sqlite3').DatabaseWrapper(settings_dict, 'pooled')
+        self.addCleanup(wrapper.get_pool().close_idle)
+
+        wrapper.ensure_connection()
+        first = wrapper.connection
+        wrapper.close()
+        wrapper.ensure_connection()
+        self.assertIs(wrapper.connection, first)
+        wrapper.close()
@@ -0,0 +1,119 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from pugorugh import models, preferences, ranking
+from pugorugh.tests.utils import create_dogs
+
+
+#  The fields given for each dog passed to create_dogs
+DOG_FIELDS = ('breed', 'size')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RankingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        ranking.features.reset()
+        self.user = User.objects.create_user('daphne', 'blake@scooby-doo.com', 'daphnepassword')
+        models.UserPref.objects.create(age='b,y,a,s', gender='m,f', size='s,m,l,xl', user_id=self.user.id)
+        self.dogs = create_dogs(DOG_FIELDS, [
+            ('Beagle', 's'), ('Boxer', 'l'), ('Beagle', 's'), ('Boxer', 'l'),
+            ('Pug', 's'), ('Beagle', 'm'), ('Boxer', 'm'),
+        ])
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[0].id, status='l')
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[1].id, status='d')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_features(self):
+        """
+        Ensure dogs can be added, moved between combinations and removed.
+        """
+        features = ranking.DogFeatures()
+        features.update([(5, 'Pug', 's', 'a', 'f', True), (2, 'Pug', 's', 'a', 'f', True)])
+        self.assertEqual(features.code_of(2), features.code_of(5))
+        self.assertEqual(list(features.members[features.code_of(2)]), [2, 5])
+
+        features.update([(5, 'Boxer', 'l', 'a', 'f', True)], [2, 5])
+        self.assertIsNone(features.code_of(2))
+        self.assertEqual(features.combos[features.code_of(5)][0], 'Boxer')
+        self.assertEqual(list(features.members[features.combo_codes[('Pug', 's', 'a', 'f', True)]]), [])
+
+    def test_ranked_order(self):
+        """
+        Ensure undecided dogs are served best scored first, in id order
+        within a score, looping back around without repeats.
+        """
+        prefs = preferences.get_prefs(self.user.id)
+        dogs = ranking.next_dogs(prefs, -1, count=10)
+        self.assertEqual([dog.id for dog in dogs], [
+            self.dogs[2].id,  # Beagle, small
+            self.dogs[4].id,  # small
+            self.dogs[5].id,  # Beagle
+            self.dogs[6].id,
+            self.dogs[3].id,  # Boxer, large
+        ])
+        self.assertEqual(ranking.next_dogs(prefs, self.dogs[5].id, count=2), [self.dogs[6], self.dogs[3]])
+        self.assertEqual(ranking.next_dogs(prefs, self.dogs[3].id), [self.dogs[2]])
+
+    @override_settings(DOG_RANKING=True)
+    def test_get_next_ranked(self):
+        """
+        Ensure the next undecided dog is the best ranked one, in two queries.
+        """
+        url = reverse('get-next', kwargs={'status': 'undecided', 'pk': -1})
+        self.client.get(url)
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.data['id'], self.dogs[2].id)
+
+        response = self.client.get(url, {'count': 2})
+        self.assertEqual([dog['id'] for dog in response.data], [self.dogs[2].id, self.dogs[4].id])
+
+    def test_evaluate(self):
+        """
+        Ensure replayed swipes are scored better by ranking than by id
+        order when the user's taste is consistent.
+        """
+        dogs = create_dogs(DOG_FIELDS, [('Beagle', 's'), ('Boxer', 'l')] * 10)
+        for dog in dogs:
+            models.UserDog.objects.create(
+                user_id=self.user.id, dog_id=dog.id, status='l' if dog.breed == 'Beagle' else 'd')
+
+        results = ranking.evaluate(min_ratings=10, holdout=0.5)
+        self.assertEqual(results['users'], 1)
+        self.assertEqual(results['ranked_auc'], 1.0)
+        self.assertLess(results['id_order_auc'], 1.0)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   DOG_RANKING=True)
+class RankingRefreshTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        ranking.features.reset()
+
+    def test_changes_picked_up(self):
+        """
+        Ensure saved, archived and deleted dogs reach the dog features
+        through the change log, without reloading every dog.
+        """
+        dog_1, dog_2 = create_dogs(DOG_FIELDS, [('Beagle', 's'), ('Boxer', 'l')])
+        features = ranking.get_features()
+        self.assertEqual(features.code_of(dog_1.id), features.combo_codes[('Beagle', 's', 'a', 'f', True)])
+
+        dog_1.breed = 'Pug'
+        dog_1.save()
+        dog_3, = create_dogs(DOG_FIELDS, [('Pug', 'm')])
+        dog_2.is_active = False
+        dog_2.save()
+        change = features.change
+
+        features = ranking.get_features()
+        self.assertEqual(features.change, change + 3)
+        self.assertEqual(features.combos[features.code_of(dog_1.id)][0], 'Pug')
+        self.assertIsNotNone(features.code_of(dog_3.id))
+        self.assertIsNone(features.code_of(dog_2.id))
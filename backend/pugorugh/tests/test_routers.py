@@ -0,0 +1,89 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from pugorugh import models, routers
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    REPLICA_DATABASES=['replica'],
+)
+class ReplicaRouterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        self.user = User.objects.create_user('daphne', 'blake@scooby-doo.com', 'daphnepassword')
+        self.addCleanup(routers.finish_request, None)
+
+    def test_read_only_request(self):
+        """
+        Ensure reads go to a replica once a view opts in, and to the
+        primary outside requests or after a write.
+        """
+        self.assertIsNone(self.router.db_for_read(models.Dog))
+
+        routers.start_request()
+        self.assertIsNone(self.router.db_for_read(models.Dog))
+        routers.read_from_replica(self.user)
+        self.assertEqual(self.router.db_for_read(models.Dog), 'replica')
+
+        self.assertEqual(self.router.db_for_write(models.UserDog), 'default')
+        self.assertIsNone(self.router.db_for_read(models.Dog))
+
+        routers.finish_request(self.user)
+        self.assertTrue(routers.is_pinned(self.user.id))
+
+    def test_pinned_user(self):
+        """
+        Ensure a user who wrote recently reads from the primary.
+        """
+        routers.pin(self.user.id)
+        routers.start_request()
+        routers.read_from_replica(self.user)
+        self.assertIsNone(self.router.db_for_read(models.Dog))
+
+    def test_write_view_pins_user(self):
+        """
+        Ensure setting a status pins the user to the primary.
+        """
+        dog = models.Dog.objects.create(
+            name='Scrappy', image_filename='1.jpg', breed='Great Dane',
+            age=12, gender='m', size='s', microchipped=True)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        response = client.put(reverse('set-status', kwargs={'status': 'liked', 'pk': dog.id}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(routers.is_pinned(self.user.id))
+
+    def test_replicas_not_migrated(self):
+        """
+        Ensure migrations only run on the primary.
+        """
+        self.assertFalse(self.router.allow_migrate('replica', 'pugorugh'))
+        self.assertIsNone(self.router.allow_migrate('default', 'pugorugh'))
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    REPLICA_DATABASES=['replica'],
+)
+class PinCacheTests(TestCase):
+    def test_pin_cache_shared(self):
+        """
+        Ensure replicas are refused a pin cache that each worker keeps to itself.
+        """
+        with self.assertRaises(ImproperlyConfigured):
+            routers.check_pin_cache()
+        with override_settings(REPLICA_PIN_CACHE_ALIAS='missing'), self.assertRaises(ImproperlyConfigured):
+            routers.check_pin_cache()
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/pins'}}):
+            routers.check_pin_cache()
+        with override_settings(REPLICA_DATABASES=[]):
+            routers.check_pin_cache()
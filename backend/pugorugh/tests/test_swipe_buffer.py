@@ -0,0 +1,168 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from pugorugh import archive, models, swipe_buffer
+
+
+class SwipeBufferTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        settings = override_settings(
+            SWIPE_BUFFER_PATH=os.path.join(self.directory, 'swipes.sqlite3'),
+            SWIPE_BUFFER_FLUSH_INTERVAL=0,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        self.user = User.objects.create_user('fred', 'jones@scooby-doo.com', 'fredpassword')
+        models.UserPref.objects.create(age='b,y,a,s', gender='m,f', size='s,m,l,xl', user_id=self.user.id)
+        self.dogs = [
+            models.Dog.objects.create(
+                name='Dog {}'.format(number), image_filename='{}.jpg'.format(number), breed='Pug',
+                age=24, gender='f', size='s')
+            for number in range(1, 5)
+        ]
+        models.UserDog.objects.create(user_id=self.user.id, dog_id=self.dogs[3].id, status='d')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        swipe_buffer.close()
+        shutil.rmtree(self.directory)
+
+    def get_next(self, pk=-1, **params):
+        return self.client.get(reverse('get-next', kwargs={'status': 'undecided', 'pk': pk}), params)
+
+    def test_buffered(self):
+        """
+        Ensure swipes are acknowledged without writing UserDog, then written
+        by a flush with repeated swipes on a dog merged.
+        """
+        with self.assertNumQueries(2):  # The dog exists and the current rating, both reads
+            response = self.client.get(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'liked'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'id': None, 'user_id': self.user.id, 'dog_id': self.dogs[0].id})
+
+        self.client.put(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'disliked'}))
+        self.client.put(reverse('blacklist', kwargs={'pk': self.dogs[0].id, 'blacklist': 'true'}))
+        self.client.put(reverse('blacklist', kwargs={'pk': self.dogs[3].id, 'blacklist': 'true'}))
+        self.assertFalse(models.UserDog.objects.filter(blacklist=True).exists())
+        self.assertEqual(swipe_buffer.pending(self.user.id), {
+            self.dogs[0].id: {'status': 'd', 'blacklist': True},
+            self.dogs[3].id: {'blacklist': True},
+        })
+
+        self.assertEqual(swipe_buffer.flush_all(), 4)
+        self.assertEqual(swipe_buffer.pending(self.user.id), {})
+        self.assertEqual(
+            set(models.UserDog.objects.filter(user_id=self.user.id).values_list('dog_id', 'status', 'blacklist')),
+            {(self.dogs[0].id, 'd', True), (self.dogs[3].id, 'd', True)},
+        )
+        self.assertEqual(models.UserDogCount.objects.get(user_id=self.user.id).blacklisted, 2)
+
+    def test_get_next_skips_pending(self):
+        """
+        Ensure dogs swiped since the last flush are not served as undecided.
+        """
+        self.assertEqual(self.get_next().data['id'], self.dogs[0].id)
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'liked'}))
+        self.client.get(reverse('blacklist', kwargs={'pk': self.dogs[1].id, 'blacklist': 'true'}))
+
+        self.assertEqual(self.get_next().data['id'], self.dogs[2].id)
+        self.assertEqual([dog['id'] for dog in self.get_next(count=5).data], [self.dogs[2].id])
+        self.assertEqual(self.get_next(pk=self.dogs[2].id).data['id'], self.dogs[2].id)
+
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[2].id, 'status': 'disliked'}))
+        self.assertEqual(self.get_next().status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_next_liked_applies_pending(self):
+        """
+        Ensure liked dogs include dogs liked since the last flush and skip
+        dogs disliked since.
+        """
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'liked'}))
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[2].id, 'status': 'liked'}))
+        swipe_buffer.flush_all()
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[1].id, 'status': 'liked'}))
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[2].id, 'status': 'disliked'}))
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[3].id, 'status': 'liked'}))
+
+        url = reverse('get-next', kwargs={'status': 'liked', 'pk': self.dogs[0].id})
+        self.assertEqual([dog['id'] for dog in self.client.get(url, {'count': 5}).data],
+                         [self.dogs[1].id, self.dogs[3].id, self.dogs[0].id])
+        self.assertEqual(self.client.get(url).data['id'], self.dogs[1].id)
+        url = reverse('get-next', kwargs={'status': 'disliked', 'pk': -1})
+        self.assertEqual(self.client.get(url).data['id'], self.dogs[2].id)
+
+    def test_appends_during_flush(self):
+        """
+        Ensure swipes are logged while a flush writes UserDog, and are left
+        for the next flush.
+        """
+        swipe_buffer.get_connection()
+        other = sqlite3.connect(os.path.join(self.directory, 'swipes.sqlite3'), timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        upsert = models.UserDog.objects.upsert
+
+        def append_then_upsert(rows, update_fields):
+            other.execute('INSERT INTO swipe (user_id, dog_id, status) VALUES (?, ?, ?)',
+                          (self.user.id, self.dogs[2].id, 'l'))
+            self.assertEqual(swipe_buffer.flush(), 0)  # The batch is claimed
+            upsert(rows, update_fields)
+
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[1].id, 'status': 'liked'}))
+        with mock.patch.object(models.UserDog.objects, 'upsert', side_effect=append_then_upsert):
+            self.assertEqual(swipe_buffer.flush(), 1)
+        self.assertEqual(swipe_buffer.pending(self.user.id), {self.dogs[2].id: {'status': 'l'}})
+        self.assertEqual(swipe_buffer.flush(), 1)
+        self.assertEqual(models.UserDog.objects.filter(user_id=self.user.id, status='l').count(), 2)
+
+    def test_failed_flush_released(self):
+        """
+        Ensure the swipes of a flush that fails, or never finishes, are flushed again.
+        """
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[1].id, 'status': 'liked'}))
+        with mock.patch.object(models.UserDog.objects, 'upsert', side_effect=ValueError):
+            with self.assertRaises(ValueError):
+                swipe_buffer.flush()
+        self.assertIsNotNone(swipe_buffer.claim(swipe_buffer.get_connection(), 10))
+        self.assertEqual(swipe_buffer.flush(), 0)
+
+        swipe_buffer.get_connection().execute('UPDATE swipe SET claimed_at = claimed_at - ?',
+                                              (swipe_buffer.CLAIM_TIMEOUT + 1,))
+        self.assertEqual(swipe_buffer.flush(), 1)
+        self.assertEqual(models.UserDog.objects.get(dog_id=self.dogs[1].id).status, 'l')
+
+    def test_missing_and_archived_dogs(self):
+        """
+        Ensure swipes on missing dogs are refused and swipes on dogs archived
+        before the flush are dropped.
+        """
+        response = self.client.get(reverse('set-status', kwargs={'pk': 99, 'status': 'liked'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[0].id, 'status': 'liked'}))
+        archive.archive_dog(self.dogs[0])
+        self.assertEqual(swipe_buffer.flush_all(), 1)
+        self.assertFalse(models.UserDog.objects.filter(dog_id=self.dogs[0].id).exists())
+
+    def test_command(self):
+        """
+        Ensure flush_swipes writes the pending swipes.
+        """
+        self.client.get(reverse('set-status', kwargs={'pk': self.dogs[1].id, 'status': 'liked'}))
+        out = StringIO()
+        call_command('flush_swipes', stdout=out)
+        self.assertEqual(out.getvalue(), 'Flushed 1 swipes\n')
+        self.assertEqual(models.UserDog.objects.get(dog_id=self.dogs[1].id).status, 'l')
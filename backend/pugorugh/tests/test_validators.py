@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+from rest_framework import serializers as drf_serializers
+
+from pugorugh import benchmark, serializers, validators
+
+
+class ValidatorTests(SimpleTestCase):
+    def test_check_list(self):
+        """
+        Ensure a comma-separated list is cleaned and checked against the choices.
+        """
+        value, value_list = validators.PREF_SIZES.check_list('s, xl,s')
+        self.assertEqual(value_list, {'s', 'xl'})
+        self.assertEqual(set(value.split(',')), {'s', 'xl'})
+
+        with self.assertRaises(drf_serializers.ValidationError):
+            validators.PREF_GENDERS.check_list('m,u')
+
+    def test_validate_dog_matches_serializer(self):
+        """
+        Ensure validate_dog accepts and rejects the same rows as
+        DogSerializer, with the same data and errors.
+        """
+        rows = benchmark.generate_rows(300) + [
+            {'name': ' Rex ', 'image_filename': 'rex.png', 'age': '12.0', 'gender': 'm', 'size': 'xl'},
+            {'name': '', 'image_filename': 'rex.png', 'age': 12, 'gender': 'm', 'size': 'xl'},
+            {'name': 'Rex', 'image_filename': 'rex.gif', 'age': 0, 'gender': 'x', 'size': 'xxl'},
+            {'name': 'Rex', 'image_filename': 'rex.jpg', 'age': True, 'gender': 'm', 'size': 's'},
+            {'name': 'Rex', 'image_filename': 'rex.jpg', 'age': 3, 'gender': 'm', 'size': 's',
+             'breed': '', 'microchipped': 'yes'},
+            {'name': None, 'image_filename': ['rex.jpg'], 'age': 3, 'gender': 'm', 'size': 's',
+             'microchipped': 'maybe'},
+            {'name': 'x' * 256, 'gender': 'f'},
+        ]
+        for row in rows:
+            serializer = serializers.DogSerializer(data=row)
+            valid = serializer.is_valid()
+            data, errors = validators.validate_dog(row)
+            self.assertEqual(not errors, valid, row)
+            self.assertEqual(errors, {
+                field: [str(detail) for detail in details] for field, details in serializer.errors.items()}, row)
+            if valid:
+                self.assertEqual(data, dict(serializer.validated_data), row)
@@ -0,0 +1,19 @@
+from pugorugh import models
+
+#  Values of the dogs made by create_dogs, unless a spec gives its own
+DOG_DEFAULTS = {'breed': 'Pug', 'age': 36, 'gender': 'f', 'size': 's', 'microchipped': True}
+
+
+def create_dogs(fields, specs):
+    """
+    Create a numbered dog for each spec.
+    :param fields: the names of the Dog fields each spec gives values for
+    :param specs: a list of tuples of values, in the order of fields
+    :return: a list of Dog instances
+    """
+    return [
+        models.Dog.objects.create(
+            name='Dog {}'.format(number), image_filename='{}.jpg'.format(number),
+            **dict(DOG_DEFAULTS, **dict(zip(fields, spec))))
+        for number, spec in enumerate(specs, start=1)
+    ]
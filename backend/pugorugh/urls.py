@@ -10,6 +10,7 @@ from . import views, converters
 
 register_converter(converters.StatusConverter, 'ds')
 register_converter(converters.BlacklistConverter, 'db')
+register_converter(converters.CollectionConverter, 'dc')
 # API endpoints
 urlpatterns = format_suffix_patterns([
     url(r'^api/user/login/$', obtain_auth_token, name='login-user'),
@@ -20,10 +21,14 @@ urlpatterns = format_suffix_patterns([
             permanent=True
         )),
     url(r'^$', TemplateView.as_view(template_name='index.html')),
+    url(r'^metrics$', views.metrics, name='metrics'),
     path('api/user/preferences/', views.UserPrefs.as_view(), name='user-prefs'),
     path('api/dog/<pk>/<ds:status>/next/', views.Dogs.as_view(), name='get-next'),
     path('api/dog/<int:pk>/<ds:status>/', views.SetStatus.as_view(), name='set-status'),
     path('api/dog/<int:pk>/blacklist/<db:blacklist>/', views.Blacklist.as_view(), name='blacklist'),
     path('api/dog/add/', views.AddDog.as_view(), name='add-dog'),
+    path('api/dog/bulk/', views.BulkStatus.as_view(), name='bulk-status'),
+    path('api/dog/search/', views.DogSearch.as_view(), name='dog-search'),
+    path('api/dog/<dc:collection>/', views.Collection.as_view(), name='dog-collection'),
     path('api/dog/<pk>/delete/', views.DeleteDog.as_view(), name='delete-dog')
 ])
@@ -6,6 +6,11 @@ AGE_RANGES = {
     's': set(range(90, 201)),
 }
 
+#  Set the bit used for each preference value when stored as a bitmask
+AGE_BITS = {'b': 1, 'y': 2, 'a': 4, 's': 8}
+GENDER_BITS = {'m': 1, 'f': 2, 'u': 4}
+SIZE_BITS = {'s': 1, 'm': 2, 'l': 4, 'xl': 8}
+
 
 def get_age_range(age_list):
     """
@@ -28,6 +33,41 @@ def get_age_range(age_list):
     return result
 
 
+def get_age_bucket(age):
+    """
+    Using the AGE RANGES above return the bucket an age falls into.
+    :param age: an integer age
+    :return: b, y, a or s (or an empty string if the age is out of range)
+    """
+    for bucket, ages in AGE_RANGES.items():
+        if age in ages:
+            return bucket
+    return ''
+
+
+def to_mask(value, bits):
+    """
+    Convert a comma-separated string of preference values into a bitmask.
+    :param value: e.g. 'b,y,a'
+    :param bits: one of AGE_BITS, GENDER_BITS or SIZE_BITS
+    :return: an integer with a bit set for each recognised value
+    """
+    mask = 0
+    for element in value.split(','):
+        mask |= bits.get(element.strip(), 0)
+    return mask
+
+
+def from_mask(mask, bits):
+    """
+    Convert a bitmask back into a list of preference values.
+    :param mask: an integer bitmask
+    :param bits: one of AGE_BITS, GENDER_BITS or SIZE_BITS
+    :return: a list of values in the order they appear in bits
+    """
+    return [value for value, bit in bits.items() if mask & bit]
+
+
 def get_microchipped(value):
     """
     Convert store microchipped preference into boolean or 'no-preference'
@@ -0,0 +1,165 @@
+import re
+
+from rest_framework import serializers
+
+from . import models
+from .utils import AGE_BITS, GENDER_BITS, SIZE_BITS, clean_input
+
+#  A bare filename, no directories or '..' that would reach outside images.IMAGE_DIR
+IMAGE_FILENAME = re.compile(r'(?!.*\.\.)[^/\\]+\.(jpg|jpeg|png)')
+DOG_AGE_RANGE = range(1, 201)
+
+
+class Choices:
+    """
+    A set of allowed values and the message for anything else,
+    checked by membership rather than by a pattern.
+    """
+    __slots__ = ('values', 'message')
+
+    def __init__(self, values, message):
+        self.values = frozenset(values)
+        self.message = message
+
+    def check(self, value):
+        """
+        Ensure that value is one of the allowed values.
+        """
+        if value not in self.values:
+            raise serializers.ValidationError(self.message)
+        return value
+
+    def check_list(self, value):
+        """
+        Ensure that value is a comma-separated string of allowed values.
+        :return: (value with whitespace and duplicates removed, a set of the values)
+        """
+        value, value_list = clean_input(value)
+        if not self.values.issuperset(value_list):
+            raise serializers.ValidationError(self.message)
+        return value, value_list
+
+
+DOG_GENDERS = Choices(GENDER_BITS, "Gender must be 'm' for male, 'f' for female or 'u' for unknown")
+DOG_SIZES = Choices(
+    SIZE_BITS, "Size must be 's' for small, 'm' for medium, 'l' for large or 'xl' for extra large")
+
+PREF_AGES = Choices(AGE_BITS, 'Age must a comma-separated string containing only b, y, a or s')
+PREF_GENDERS = Choices(('m', 'f'), 'Gender must a comma-separated string containing only m or f')
+PREF_SIZES = Choices(SIZE_BITS, 'Size must a comma-separated string containing only s, m, l or xl')
+PREF_MICROCHIPPED = Choices(('y', 'n', 'e'), 'Microchipped must contain only y, n or e')
+
+SEARCH_GENDERS = Choices(GENDER_BITS, 'Gender must a comma-separated string containing only m, f or u')
+
+
+def validate_image_filename(value):
+    """
+    Ensure that the image_filename ends with .jpg, .jpeg or .png
+    and is a bare filename, without '/', '\\' or '..'
+    """
+    if IMAGE_FILENAME.fullmatch(value) is None:
+        if '/' in value or '\\' in value or '..' in value:
+            raise serializers.ValidationError("image_filename must not contain '/', '\\' or '..'")
+        raise serializers.ValidationError("image_filename must end with '.jpg', '.jpeg' or '.png'")
+    return value
+
+
+def validate_age(value):
+    """
+    Ensure that Age is an integer between 1 and 200
+    """
+    if value not in DOG_AGE_RANGE:
+        raise serializers.ValidationError('Age must be an integer between 1 and 200')
+    return value
+
+
+#  The error messages of the DRF fields DogSerializer builds, so that
+#  validate_dog reports the same errors
+ERRORS = {
+    'required': str(serializers.Field.default_error_messages['required']),
+    'null': str(serializers.Field.default_error_messages['null']),
+    'blank': str(serializers.CharField.default_error_messages['blank']),
+    'string': str(serializers.CharField.default_error_messages['invalid']),
+    'max_length': str(serializers.CharField.default_error_messages['max_length']),
+    'integer': str(serializers.IntegerField.default_error_messages['invalid']),
+    'max_string_length': str(serializers.IntegerField.default_error_messages['max_string_length']),
+    'boolean': str(serializers.BooleanField.default_error_messages['invalid']),
+}
+
+
+def to_string(value, max_length, allow_blank=False):
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise serializers.ValidationError(ERRORS['string'])
+    value = str(value).strip()
+    if not value and not allow_blank:
+        raise serializers.ValidationError(ERRORS['blank'])
+    if len(value) > max_length:
+        raise serializers.ValidationError(ERRORS['max_length'].format(max_length=max_length))
+    return value
+
+
+def dog_string(field, allow_blank=False):
+    max_length = models.Dog._meta.get_field(field).max_length
+    return lambda value: to_string(value, max_length, allow_blank)
+
+
+def to_integer(value):
+    if isinstance(value, str) and len(value) > serializers.IntegerField.MAX_STRING_LENGTH:
+        raise serializers.ValidationError(ERRORS['max_string_length'])
+    try:
+        return int(serializers.IntegerField.re_decimal.sub('', str(value)))
+    except (ValueError, TypeError):
+        raise serializers.ValidationError(ERRORS['integer'])
+
+
+def to_boolean(value):
+    try:
+        if value in serializers.BooleanField.TRUE_VALUES:
+            return True
+        if value in serializers.BooleanField.FALSE_VALUES:
+            return False
+    except TypeError:
+        pass
+    raise serializers.ValidationError(ERRORS['boolean'])
+
+
+#  (field, required, convert, validate) for each field of a Dog, in the order DogSerializer checks them
+DOG_FIELDS = (
+    ('name', True, dog_string('name'), None),
+    ('image_filename', True, dog_string('image_filename'), validate_image_filename),
+    ('breed', False, dog_string('breed', allow_blank=True), None),
+    ('age', True, to_integer, validate_age),
+    ('gender', True, dog_string('gender'), DOG_GENDERS.check),
+    ('size', True, dog_string('size'), DOG_SIZES.check),
+    ('microchipped', False, to_boolean, None),
+)
+
+
+def validate_dog(row):
+    """
+    Validate a row of dog data as DogSerializer would, without building
+    a serializer and its fields for every row. Used by bulk imports.
+    :param row: a dict of raw field values, e.g. from JSON or CSV
+    :return: (validated data, {field: [error message]}), the data is
+             only complete if there are no errors
+    """
+    data = {}
+    errors = {}
+    for field, required, convert, validate in DOG_FIELDS:
+        if field not in row:
+            if required:
+                errors[field] = [ERRORS['required']]
+            continue
+        value = row[field]
+        if value is None:
+            errors[field] = [ERRORS['null']]
+            continue
+        try:
+            value = convert(value)
+            if validate is not None:
+                value = validate(value)
+        except serializers.ValidationError as error:
+            errors[field] = [str(detail) for detail in error.detail]
+            continue
+        data[field] = value
+    return data, errors
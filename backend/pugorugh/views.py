@@ -1,18 +1,49 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
+from django.http import Http404, HttpResponse
 
 from rest_framework import permissions
 from rest_framework.generics import (
+    GenericAPIView,
+    ListAPIView,
     RetrieveUpdateAPIView,
     CreateAPIView,
     RetrieveAPIView,
     DestroyAPIView)
-from rest_framework.exceptions import NotFound
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import CreateModelMixin
+from rest_framework.response import Response
 
 from . import serializers
+from . import archive
+from . import catalogue
+from . import conditional
+from . import dog_sets
+from . import images
+from . import jobs
+from . import matching
+from . import middleware
 from . import models
-from .utils import get_age_range, get_microchipped
+from . import pagination
+from . import preferences
+from . import ranking
+from . import ratings
+from . import routers
+from . import search
+from . import tasks
+from . import swipe_buffer
+
+
+class ReplicaReadMixin:
+    """
+    Serve the safe methods of a view from a read replica,
+    see routers.ReplicaRouter.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in permissions.SAFE_METHODS:
+            routers.read_from_replica(request.user)
 
 
 class UserRegisterView(CreateAPIView):
@@ -24,9 +55,11 @@ class UserRegisterView(CreateAPIView):
     serializer_class = serializers.UserSerializer
 
 
-class UserPrefs(CreateModelMixin, RetrieveUpdateAPIView):
+class UserPrefs(ReplicaReadMixin, CreateModelMixin, RetrieveUpdateAPIView):
     """
     List or Create User Preferences.
+    Responses carry an ETag, send it back in If-None-Match to get a 304
+    if the preferences have not changed.
     Endpoint: /api/user/preferences/
     Methods: GET, PUT, PATCH
     """
@@ -34,19 +67,60 @@ class UserPrefs(CreateModelMixin, RetrieveUpdateAPIView):
     serializer_class = serializers.UserPrefSerializer
 
     def get_object(self):
-        try:
-            #  Get the UserPrefs object for the current user if it exists
-            user_prefs = models.UserPref.objects.get(user=self.request.user.id)
-        except models.UserPref.DoesNotExist:
-            #  Else create a UserPrefs object for the current user
-            user_prefs = models.UserPref.objects.create(user=self.request.user)
-        return user_prefs
+        #  Reads are served from the cached Prefs
+        if self.request.method == 'GET':
+            return preferences.get_prefs(self.request.user.id)
+
+        #  Get the UserPrefs object for the current user, or create one
+        return preferences.get_or_create_user_pref(self.request.user.id)
+
+    def retrieve(self, request, *args, **kwargs):
+        prefs = self.get_object()
+        #  Answer a matching If-None-Match without serializing
+        etag = conditional.prefs_etag(prefs)
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            response = Response(self.get_serializer(prefs).data)
+        response['ETag'] = etag
+        return response
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        response['ETag'] = conditional.prefs_etag(self.user_pref)
+        return response
+
+    def perform_update(self, serializer):
+        #  The post_save receivers rebuild the match queue, or queue a job to,
+        #  and drop the cached Prefs
+        self.user_pref = serializer.save()
+
+
+class SwipeMixin:
+    """
+    Write a single swipe straight to UserDog, or log it for the swipe
+    buffer to write later if SWIPE_BUFFER_PATH is set.
+    """
+    def swipe(self, row, update_fields):
+        """
+        :param row: the UserDog values of a new entry
+        :param update_fields: the fields to overwrite on an existing entry
+        :return: the UserDog as written, unsaved
+        """
+        if not models.Dog.objects.filter(id=row['dog_id'], is_active=True).exists():
+            raise NotFound
+        if swipe_buffer.enabled():
+            swipe_buffer.append(row['user_id'], row['dog_id'], **{field: row[field] for field in update_fields})
+            return swipe_buffer.user_dog(row['user_id'], row['dog_id'])
+
+        #  Insert or update in a single statement
+        return models.UserDog.objects.upsert([row], update_fields=update_fields)[0]
 
     def perform_update(self, serializer):
-        serializer.save()
+        # The swipe was written, or buffered, by get_object
+        pass
 
 
-class SetStatus(CreateModelMixin, RetrieveUpdateAPIView):
+class SetStatus(SwipeMixin, CreateModelMixin, RetrieveUpdateAPIView):
     """
     Set User-Dog Status to liked, disliked or undecided.
     Endpoints:
@@ -62,20 +136,13 @@ class SetStatus(CreateModelMixin, RetrieveUpdateAPIView):
     def get_object(self):
         dog_id = self.kwargs['pk']
         new_status = self.kwargs['status'][0]  # returns l, d, u or b (liked, disliked or undecided)
-        try:
-            user_dog = models.UserDog.objects.get(user=self.request.user.id, dog_id=dog_id)
-            user_dog.status = new_status
-            user_dog.save()
-        except models.UserDog.DoesNotExist:
-            user_dog = models.UserDog.objects.create(
-                user=self.request.user,
-                dog_id=dog_id,
-                status=new_status
-            )
-        return user_dog
+        return self.swipe(
+            {'user_id': self.request.user.id, 'dog_id': dog_id, 'status': new_status, 'blacklist': False},
+            update_fields=['status'],
+        )
 
 
-class Blacklist(CreateModelMixin, RetrieveUpdateAPIView):
+class Blacklist(SwipeMixin, CreateModelMixin, RetrieveUpdateAPIView):
     """
     Set User-Dog blacklist to be either True or False
     Endpoints:
@@ -88,24 +155,78 @@ class Blacklist(CreateModelMixin, RetrieveUpdateAPIView):
 
     def get_object(self):
         dog_id = self.kwargs['pk']
-        blacklist = self.kwargs['blacklist']  # returns True or False
-        try:
-            user_dog = models.UserDog.objects.get(user=self.request.user.id, dog_id=dog_id)
-            user_dog.blacklist = blacklist
-            user_dog.save()
-        except models.UserDog.DoesNotExist:
-            user_dog = models.UserDog.objects.create(
-                user=self.request.user,
-                dog_id=dog_id,
-                blacklist=blacklist,
-                status='u',
+        blacklist = self.kwargs['blacklist'] == 'True'  # returns True or False
+        #  New entries default to 'undecided'
+        return self.swipe(
+            {'user_id': self.request.user.id, 'dog_id': dog_id, 'status': 'u', 'blacklist': blacklist},
+            update_fields=['blacklist'],
+        )
+
+
+class BulkStatus(GenericAPIView):
+    """
+    Set the status and / or blacklist of many User-Dog entries
+    in a single transaction, e.g. to replay offline swipes.
+    Endpoints:
+        /api/dog/bulk/
+    Method: POST
+    Body: a list of {"dog_id": 1, "status": "liked", "blacklist": false}
+    Returns: a result for each entry, in the order given
+    """
+    serializer_class = serializers.UserDogBulkSerializer
+    max_entries = 500
+
+    def post(self, request, *args, **kwargs):
+        if not isinstance(request.data, list) or not 1 <= len(request.data) <= self.max_entries:
+            raise ValidationError(
+                'Expected a list of between 1 and {} entries'.format(self.max_entries)
             )
-        return user_dog
 
+        # Validate each entry, later entries for the same dog win
+        results = []
+        entries = {}
+        for item in request.data:
+            serializer = self.get_serializer(data=item)
+            if serializer.is_valid():
+                dog_id = serializer.validated_data['dog_id']
+                entries.setdefault(dog_id, {}).update(serializer.validated_data)
+                results.append({'dog_id': dog_id, 'ok': True})
+            else:
+                dog_id = item.get('dog_id') if isinstance(item, dict) else None
+                results.append({'dog_id': dog_id, 'ok': False, 'errors': serializer.errors})
+
+        existing = set(models.Dog.objects.filter(id__in=entries, is_active=True).values_list('id', flat=True))
+        for result in results:
+            if result['ok'] and result['dog_id'] not in existing:
+                result['ok'] = False
+                result['errors'] = {'dog_id': ['Dog {} does not exist'.format(result['dog_id'])]}
+
+        # Upsert each set of updated fields, new entries default to 'undecided'
+        groups = {}
+        for dog_id, entry in entries.items():
+            if dog_id in existing:
+                update_fields = tuple(field for field in ('status', 'blacklist') if field in entry)
+                row = {'user_id': request.user.id, 'dog_id': dog_id, 'status': 'u', 'blacklist': False}
+                row.update(entry)
+                groups.setdefault(update_fields, []).append(row)
+
+        with transaction.atomic():
+            for update_fields, rows in groups.items():
+                models.UserDog.objects.upsert(rows, update_fields=list(update_fields))
 
-class Dogs(RetrieveAPIView):
+        return Response(results)
+
+
+class Dogs(ReplicaReadMixin, RetrieveAPIView):
     """
     Get next undecided / liked / disliked dog.
+    Undecided dogs are ranked for the user if DOG_RANKING is on, or
+    matched in memory if DOG_CATALOGUE_INDEX is on. Liked and disliked
+    dogs are read from the user's sets if USER_DOG_SETS is on. Swipes the
+    swipe buffer has not flushed yet are applied on top.
+    Pass ?count=N to get a list of the next N dogs instead.
+    Responses carry an ETag, send it back in If-None-Match to get a 304
+    if the dogs have not changed.
     Endpoints:
             /api/dog/<pk>/undecided/next/
             /api/dog/<pk>/liked/next/
@@ -113,74 +234,207 @@ class Dogs(RetrieveAPIView):
     Method(s): GET
     """
     serializer_class = serializers.DogSerializer
+    max_count = 50
 
     def get_queryset(self):
         current_status = self.kwargs['status'][0]  # returns l, d or u
 
-        # undecided dogs
+        # undecided dogs are served from the user's match queue
         if current_status == 'u':
-            user_prefs = models.UserPref.objects.all().get(user=self.request.user)
-            age = user_prefs.age.split(',')  # returns a combination of 'b,y,a,s'
-
-            # Use the utils helper functions
-            age_ranges = get_age_range(age)
-            microchipped = get_microchipped(user_prefs.microchipped)
+            prefs = preferences.get_prefs(self.request.user.id)
+            if not prefs.match_queue_built:
+                matching.rebuild_queue(prefs)
+            return models.Dog.objects.filter(match_queue__user_id=self.request.user.id)
 
-            #  Filer by Microchipped (no_preference, yes or no)
-            if microchipped == 'no_preference':
-                chipped_dogs = models.Dog.objects.all()
+        # liked or disliked dogs, joined from the user's ratings rather than
+        # checked for every dog
+        if current_status == 'l' or current_status == 'd':
+            return ratings.collection(self.request.user.id, self.kwargs['status'])
+
+    def next_from(self, queryset, pk, count):
+        """
+        Get the next count dogs by id after pk, looping back around to the
+        first dog. Each half is a seek on the id index LIMITed to the dogs
+        still wanted, as in matching.next_in_queue, rather than a sort of
+        every matching dog; the second only runs if the first runs out.
+        """
+        dogs = list(queryset.filter(id__gt=pk).order_by('id')[:count])
+        if len(dogs) < count:
+            dogs += queryset.filter(id__lte=pk).order_by('id')[:count - len(dogs)]
+        return dogs
+
+    def get_pending(self):
+        """
+        Get the dogs that swipes the swipe buffer has not flushed yet move
+        out of, or into, the requested dogs, which the database does not
+        know about yet. Undecided dogs swiped back to undecided are left
+        for the flush to add to the match queue.
+        :return: (skipped, added) sets of dog ids
+        """
+        if not swipe_buffer.enabled():
+            return set(), set()
+        if self.kwargs['status'][0] == 'u':
+            return swipe_buffer.decided(self.request.user.id), set()
+
+        skipped, added = set(), set()
+        for dog_id, rating in swipe_buffer.pending_ratings(self.request.user.id).items():
+            if self.kwargs['status'] in ratings.collections_of(rating):
+                added.add(dog_id)
             else:
-                chipped_dogs = models.Dog.objects.all().filter(
-                    microchipped__exact=microchipped)
-
-            # Filter by Gender, Size and Age Range
-            matched_dogs = chipped_dogs.filter(
-                Q(gender__in=user_prefs.gender.split(',')) &
-                Q(size__in=user_prefs.size.split(',')) &
-                Q(age__in=age_ranges)
-            )
+                skipped.add(dog_id)
+        return skipped, added
 
-            # Get all dogs that have yet to be rated
-            unrated_dogs = matched_dogs.exclude(
-                dog_user__user_id__exact=self.request.user.id
+    def get_object(self):
+        pk = int(self.kwargs['pk'])  # Initially set to -1
+        pending = self.get_pending()
+        if any(pending):
+            return self.get_objects(1, pending)[0]
+
+        if self.kwargs['status'][0] == 'u' and ranking.enabled():
+            # The best ranked dog for the user after pk, looping back around
+            dogs = ranking.next_dogs(preferences.get_prefs(self.request.user.id), pk)
+            dog = dogs[0] if dogs else None
+        elif self.kwargs['status'][0] == 'u' and catalogue.enabled():
+            # Successor lookup in the in-process catalogue index, looping back around
+            dogs = catalogue.next_dogs(preferences.get_prefs(self.request.user.id), pk)
+            dog = dogs[0] if dogs else None
+        elif self.kwargs['status'][0] == 'u':
+            # Successor lookup on the queue index, looping back around,
+            # once get_queryset has made sure the queue is built
+            self.get_queryset()
+            dog = matching.next_in_queue(self.request.user.id, pk)
+        elif dog_sets.enabled():
+            # Successor lookup in the user's sorted set of liked or disliked dogs
+            dogs = dog_sets.next_dogs(self.request.user.id, self.kwargs['status'], pk)
+            dog = dogs[0] if dogs else None
+        else:
+            # Retrieve the dog with the next highest id
+            dogs = self.next_from(self.get_queryset(), pk, 1)
+            dog = dogs[0] if dogs else None
+
+        if dog is None:
+            raise NotFound  # No matching dogs so raise 404
+        return dog
+
+    def get_count(self):
+        count = self.request.query_params['count']
+        if not count.isdigit() or not 1 <= int(count) <= self.max_count:
+            raise ValidationError(
+                {'count': 'Count must be an integer between 1 and {}'.format(self.max_count)}
             )
+        return int(count)
+
+    def get_objects(self, count, pending=None):
+        pk = int(self.kwargs['pk'])
+        skipped, added = self.get_pending() if pending is None else pending
+        wanted, count = count, count + len(skipped)  # Enough to leave wanted once skipped dogs are dropped
+
+        if self.kwargs['status'][0] == 'u' and ranking.enabled():
+            # The best ranked dogs for the user after pk, looping back around
+            dogs = ranking.next_dogs(preferences.get_prefs(self.request.user.id), pk, count)
+        elif self.kwargs['status'][0] == 'u' and catalogue.enabled():
+            # The next matching dogs from the in-process catalogue index
+            dogs = catalogue.next_dogs(preferences.get_prefs(self.request.user.id), pk, count)
+        elif self.kwargs['status'][0] != 'u' and dog_sets.enabled():
+            # The next dogs in the user's sorted set of liked or disliked dogs
+            dogs = dog_sets.next_dogs(self.request.user.id, self.kwargs['status'], pk, count)
+        else:
+            # Retrieve the next dogs in id order, looping back around
+            dogs = self.next_from(self.get_queryset(), pk, count)
+
+        if added:
+            # Merge in the dogs swiped into the collection, in the same order
+            dogs = {dog.id: dog for dog in dogs}
+            dogs.update((dog.id, dog) for dog in models.Dog.objects.filter(id__in=added - dogs.keys(), is_active=True))
+            dogs = sorted(dogs.values(), key=lambda dog: (dog.id <= pk, dog.id))
+        dogs = [dog for dog in dogs if dog.id not in skipped][:wanted]
+        if not dogs:
+            raise NotFound  # No matching dogs so raise 404
+        return dogs
+
+    def retrieve(self, request, *args, **kwargs):
+        count = self.get_count() if 'count' in request.query_params else None
+
+        # Serve the response from the optional cache of get-next responses
+        cache = conditional.get_cache()
+        cached = key = None
+        if cache is not None:
+            prefs = preferences.get_prefs(request.user.id)
+            key = conditional.next_cache_key(
+                cache, request.user.id, prefs.version, self.kwargs['status'], self.kwargs['pk'], count)
+            cached = cache.get(key)
+
+        if cached is not None:
+            etag, data = cached
+        else:
+            dogs = self.get_objects(count) if count else self.get_object()
+            etag, data = conditional.dog_etag(dogs), None
+
+        # Answer a matching If-None-Match without serializing
+        response = conditional.not_modified(request, etag)
+        if response is None:
+            if data is None:
+                data = self.get_serializer(dogs, many=count is not None).data
+                if key is not None:
+                    cache.set(key, (etag, data), getattr(settings, 'NEXT_DOG_CACHE_TTL', None))
+            response = Response(data)
+        response['ETag'] = etag
+        return response
+
+
+class Collection(ReplicaReadMixin, ListAPIView):
+    """
+    List the user's liked / disliked / blacklisted dogs a page at a time,
+    with the total number in the collection.
+    Endpoints:
+            /api/dog/liked/
+            /api/dog/disliked/
+            /api/dog/blacklisted/
+    Pass ?limit=N for up to 100 dogs per page, and follow the next / previous links.
+    Method(s): GET
+    """
+    serializer_class = serializers.DogSerializer
+    pagination_class = pagination.CollectionPagination
 
-            # Get all dogs explicitly rated as 'undecided'
-            rated_dogs = matched_dogs.filter(
-                Q(dog_user__user_id__exact=self.request.user.id) &
-                Q(dog_user__status__exact='u') &
-                Q(dog_user__blacklist__exact=False)
-            )
+    def get_queryset(self):
+        return ratings.rated(self.request.user.id, self.kwargs['collection'])
 
-            # Combine querysets & remove duplicates
-            undecided_dogs = (unrated_dogs | rated_dogs).distinct()
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_queryset())
+        serializer = self.get_serializer([user_dog.dog for user_dog in page], many=True)
+        return self.get_paginated_response(serializer.data)
 
-            if not undecided_dogs:
-                raise NotFound  # No matching dogs so raise 404
-            else:
-                return undecided_dogs
+    def get_paginated_response(self, data):
+        count = ratings.get_count(self.request.user.id, self.kwargs['collection'])
+        return self.paginator.get_paginated_response(data, count)
 
-        # liked or disliked dogs
-        if current_status == 'l' or current_status == 'd':
-            chosen_dogs = models.Dog.objects.all().filter(
-                Q(dog_user__user_id__exact=self.request.user.id) &
-                Q(dog_user__status__exact=current_status) &
-                Q(dog_user__blacklist__exact=False))
 
-            if not chosen_dogs:
-                raise NotFound
-            else:
-                return chosen_dogs
+class DogSearch(ReplicaReadMixin, GenericAPIView):
+    """
+    Search dogs by name and breed, with the number of matches
+    for each gender, size, age and microchipped value.
+    Endpoint: /api/dog/search/?q=<words>
+    Optional filters: gender, size, age (comma-separated), microchipped (y or n)
+    and limit / offset to page through the results.
+    Method(s): GET
+    """
+    serializer_class = serializers.DogSerializer
 
-    def get_object(self):
-        pk = int(self.kwargs['pk'])  # Initially set to -1
+    def get(self, request, *args, **kwargs):
+        params = serializers.DogSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = {
+            name: params.validated_data[name]
+            for name in ('gender', 'size', 'age', 'microchipped')
+            if name in params.validated_data
+        }
 
-        # Retrieve the dog with the next highest id
-        dog = self.get_queryset().filter(id__gt=pk).first()
-        if dog is not None:
-            return dog
-        else:
-            return self.get_queryset().first()  # Loop back around
+        total, dog_ids, facets = search.search(
+            params.validated_data['q'], filters,
+            params.validated_data['limit'], params.validated_data['offset'])
+        dogs = models.Dog.objects.filter(is_active=True).in_bulk(dog_ids)
+        serializer = self.get_serializer([dogs[dog_id] for dog_id in dog_ids if dog_id in dogs], many=True)
+        return Response({'count': total, 'results': serializer.data, 'facets': facets})
 
 
 class AddDog(CreateAPIView):
@@ -194,19 +448,44 @@ class AddDog(CreateAPIView):
     serializer_class = serializers.DogSerializer
 
     def perform_create(self, serializer):
-        serializer.save()
+        dog = serializer.save()
+        # Build the image variants in a background job, or thread, if the image
+        # is already in place, otherwise build_image_variants picks them up later
+        if jobs.enabled():
+            jobs.enqueue('build_image_variants', key='image-variants:{}:{}'.format(dog.id, dog.version),
+                         filename=dog.image_filename)
+        else:
+            images.background.submit(tasks.build_image_variants, dog.image_filename)
 
 
 class DeleteDog(DestroyAPIView):
     """
     Provide a method that allows a
     Dog instance to be deleted from the DB.
+    The dog is archived straight away and purged later, by a background
+    job if BACKGROUND_JOBS is on or else by the purge_archived_dogs command.
     Endpoints:
             /api/dog/<pk>/delete/
     Method(s): DELETE
     """
-    queryset = models.Dog.objects.all()
+    queryset = models.Dog.objects.filter(is_active=True)
     serializer_class = serializers.DogSerializer
 
     def perform_destroy(self, instance):
-        instance.delete()
+        archive.archive_dog(instance)
+        if jobs.enabled():
+            jobs.enqueue('purge_dog', key='purge-dog:{}'.format(instance.id), dog_id=instance.id)
+
+
+def metrics(request):
+    """
+    Expose the per-view request metrics recorded by
+    middleware.InstrumentationMiddleware in the Prometheus text format.
+    Only available to the addresses in METRICS_ALLOWED_IPS.
+    Endpoint: /metrics
+    Method: GET
+    """
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', settings.INTERNAL_IPS)
+    if request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(middleware.metrics.render(), content_type='text/plain; version=0.0.4')